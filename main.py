@@ -1,7 +1,6 @@
 # pyright: reportAny=false, reportExplicitAny=false, reportUnknownVariableType=false
 
 # TODO: persistent state management
-# TODO: persistent download (allow for resuming interrupted download)
 
 """
 OGG_VORBIS_96 = 0; // playplay
@@ -29,12 +28,11 @@ import argparse
 import shlex
 import logging
 import subprocess
+import time
 import curl_cffi
 import yt_dlp
 from faker import Faker
 
-from spotify_dl.auth.clienttoken import ClientToken
-from spotify_dl.auth.login5 import Login5Auth
 from spotify_dl.auth.spdc import SpDCAuth
 from spotify_dl.state import state
 from spotify_dl.utils.sanitize_path import sanitize_filename
@@ -52,13 +50,16 @@ from collections.abc import Iterable
 from yt_dlp.utils import DownloadError
 
 from spotify_dl.api.internal.playplay import PlayPlay
-from spotify_dl.api.internal.spotify_client import SpotifyClient
 from spotify_dl.api.internal.widevine import WidevineClient
+from spotify_dl.api.web.storage_resolve import StorageResolver
+from spotify_dl.async_downloader import AsyncBatchDownloader
 from spotify_dl.auth.internal_auth import SpotifyInternalAuth
 from spotify_dl.auth.web_auth import SpotifyAuthPKCE
+from spotify_dl.blob_store import BlobStore
 
 # TODO: cli is unreliable
 # from spotify_dl.cli import CLI
+from spotify_dl.download_queue import DownloadPriority
 from spotify_dl.downloader import (
     SpotifyDownloadParam,
 )
@@ -287,10 +288,9 @@ def main() -> None:
                     continue
 
                 print("Connecting to Spotify...")
-                state.client = SpotifyClient.random_ap(state.auth)
-                state.client.authenticate()
+                client = state.ensure_ap().ready()
                 print(
-                    f"Successfully connected to {state.client.addr}:{state.client.port}"
+                    f"Successfully connected to {client.addr}:{client.port}"
                 )
             case ["info", uri]:
                 if state.auth.require_login():
@@ -551,26 +551,13 @@ def main() -> None:
                     repr_fun=lambda x, _: x.value,
                 )
                 if method == KeySource.CLIENT:
+                    # handshake only the first time, the session stays up between commands
                     print("Connecting to Spotify...")
-                    state.client = SpotifyClient.random_ap(state.auth)
-                    state.client.handshake()
-                    state.client.authenticate()
+                    _ = state.ensure_ap()
                 if method == KeySource.PLAYPLAY:
-                    if not state.login5:
-                        if not state.client:
-                            state.client = SpotifyClient.random_ap(state.auth)
-
-                        if not state.clienttoken:
-                            state.clienttoken = ClientToken(state.client)
-
-                        state.login5 = Login5Auth(state.client, state.clienttoken)
-
-                    if not state.clienttoken:
-                        if not state.client:
-                            state.client = SpotifyClient.random_ap(state.auth)
-                        state.clienttoken = ClientToken(state.client)
-
-                    state.playplay = PlayPlay(state.login5, state.clienttoken)
+                    state.playplay = PlayPlay(
+                        state.ensure_login5(), state.ensure_clienttoken()
+                    )
                 elif method == KeySource.WIDEVINE:
                     print("NOTE: Widevine only supports mp4 format")
                     print(
@@ -582,17 +569,12 @@ def main() -> None:
                         print("No wvd file supplied")
                         continue
 
-                    if not state.clienttoken:
-                        if not state.client:
-                            state.client = SpotifyClient.random_ap(state.auth)
-                        state.clienttoken = ClientToken(state.client)
-
                     if not state.iauth.is_linked_with_account():
                         sp_dc = SpDCAuth()
                         _ = sp_dc.token  # trigger prompt
                         state.iauth = SpotifyInternalAuth(sp_dc)
 
-                    state.widevine = WidevineClient(state.iauth, state.clienttoken, wvd)
+                    state.widevine = WidevineClient(state.iauth, state.ensure_clienttoken(), wvd)
 
                 args = (
                     CommandParser()
@@ -600,22 +582,58 @@ def main() -> None:
                     .add_argument("uri")
                     .add_argument("--sim-play", "-p", action="store_true")
                     .add_argument("--output-directory", "-o")
+                    .add_argument(
+                        "--priority",
+                        choices=[p.name.lower() for p in DownloadPriority],
+                        default=None,
+                    )
+                    .add_argument(
+                        "--deadline",
+                        type=float,
+                        default=None,
+                        help="seconds from now the download should start by",
+                    )
+                    .add_argument(
+                        "--event-loop",
+                        "-e",
+                        action="store_true",
+                        help="download the batch on one event loop instead of the worker threads, blocks until it's done",
+                    )
                     .parse()
                 )
                 if not args:
                     continue
 
-                track = Track.probe(args.uri)
-                meta = track.get_metadata_internal(state.auth)
-                print(
-                    f"Downloading {meta.name!r} from the album {meta.album.name!r} featuring {len(meta.artist)} artists: ",
-                    end="",
-                )
-                for i, artist in enumerate(meta.artist):
-                    if i != 0:
-                        print(", ", end="")
-                    print(f"{artist.name}", end="")
-                print()
+                try:
+                    tracks = Track.probe(args.uri).expand(state.auth)
+                except ValueError as e:
+                    print(e)
+                    continue
+                if not tracks:
+                    print("Nothing to download")
+                    continue
+
+                # one request per 100 tracks instead of one per track
+                try:
+                    Track.prefetch_metadata_internal(tracks, state.auth)
+                except Exception as e:
+                    # every track still fetches its own below
+                    print(f"Metadata prefetch failed, fetching per track: {e}")
+
+                track = tracks[0]
+                if len(tracks) > 1:
+                    print(f"Downloading {len(tracks)} tracks")
+                else:
+                    meta = track.get_metadata_internal(state.auth)
+                    print(
+                        f"Downloading {meta.name!r} from the album {meta.album.name!r} featuring {len(meta.artist)} artists: ",
+                        end="",
+                    )
+                    for i, artist in enumerate(meta.artist):
+                        if i != 0:
+                            print(", ", end="")
+                        print(f"{artist.name}", end="")
+                    print()
 
                 default_format_type = None
                 if method == KeySource.WIDEVINE:
@@ -641,31 +659,92 @@ def main() -> None:
                 if not format:
                     continue
 
-                track.set_format(format)
-
-                filename = sanitize_filename(f"{', '.join(a.name for a in meta.artist)} - {meta.name}.{AudioCodec.get_extension(format.get_codec())}")
-                if args.output_directory:
-                    path = (
-                        Path(args.output_directory).expanduser().absolute() / filename
-                    )
-                elif state.dir:
-                    path = state.dir.expanduser().absolute() / filename
-                else:
-                    path = Path(filename)
-
                 if args.sim_play and method == KeySource.WIDEVINE:
                     print("Cannot stream with widevine (yet)")
                     args.sim_play = False
 
-                state.download_manager.enqueue(
-                    SpotifyDownloadParam(
-                        track=track,
-                        auth=state.auth,
-                        key_provider=state.playplay or state.widevine or state.client,
-                        output=str(path),
-                        emulate_playback=args.sim_play,
+                if args.priority:
+                    priority = DownloadPriority[args.priority.upper()]
+                elif args.sim_play:
+                    # someone is listening, it goes ahead of everything else
+                    priority = DownloadPriority.INTERACTIVE
+                elif len(tracks) > 1:
+                    priority = DownloadPriority.BATCH
+                else:
+                    priority = DownloadPriority.DOWNLOAD
+
+                params: list[SpotifyDownloadParam] = []
+                for track in tracks:
+                    try:
+                        meta = track.get_metadata_internal(state.auth)
+                        track_format = (
+                            format
+                            if track is tracks[0]
+                            else track.get_format(state.auth, format.type)
+                        )
+                    except Exception as e:
+                        print(f"Skipping spotify:track:{track.id_b62}, {e}")
+                        continue
+                    if not track_format:
+                        print(f"Skipping {meta.name!r}, no {format.type.name}")
+                        continue
+
+                    track.set_format(track_format)
+
+                    filename = sanitize_filename(f"{', '.join(a.name for a in meta.artist)} - {meta.name}.{AudioCodec.get_extension(track_format.get_codec())}")
+                    if args.output_directory:
+                        path = (
+                            Path(args.output_directory).expanduser().absolute()
+                            / filename
+                        )
+                    elif state.dir:
+                        path = state.dir.expanduser().absolute() / filename
+                    else:
+                        path = Path(filename)
+
+                    params.append(
+                        SpotifyDownloadParam(
+                            track=track,
+                            auth=state.auth,
+                            key_provider=state.playplay
+                            or state.widevine
+                            or state.ap,
+                            output=str(path),
+                            emulate_playback=args.sim_play,
+                            priority=priority,
+                            deadline=(
+                                time.monotonic() + args.deadline
+                                if args.deadline is not None
+                                else None
+                            ),
+                        )
+                    )
+
+                if args.event_loop:
+                    looped = [p for p in params if AsyncBatchDownloader.supports(p)]
+                    params = [p for p in params if not AsyncBatchDownloader.supports(p)]
+                    if params:
+                        print(
+                            f"{len(params)} tracks need widevine or playback, they go to the worker threads"
+                        )
+                    if looped:
+                        failed = AsyncBatchDownloader().run(looped)
+                        print(f"Downloaded {len(looped) - failed}/{len(looped)} tracks")
+
+                if len(params) > 1:
+                    # resolved in the background, by the time a worker gets to
+                    # a track its cdns are already known
+                    StorageResolver.shared().prefetch(
+                        state.auth.session,
+                        (
+                            param.track.format.file_id
+                            for param in params
+                            if param.track.format
+                            and not BlobStore.shared().has(param.track.format.file_id)
+                        ),
                     )
-                )
+                for param in params:
+                    state.download_manager.enqueue(param)
 
             case ["metadata", *rest]:
                 if state.auth.require_login():
@@ -748,6 +827,9 @@ def main() -> None:
                 print("Unknown command")
 
     readline.write_history_file(HISTORY_FILE)
+    # a one-shot command waits for its downloads, quitting the prompt stops them
+    # (the journals resume them next time)
+    state.download_manager.shutdown(wait=program_args.command is not None)
 
 
 if __name__ == "__main__":
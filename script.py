@@ -383,6 +383,197 @@ set(CMAKE_FIND_ROOT_PATH_MODE_INCLUDE ONLY)
     print("all requested builds finished.")
 
 
+class MemoryChunkSource:
+    CHUNK_SIZE: int = 128 * 1024
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.size = len(data)
+        self.chunks = [
+            data[i : i + self.CHUNK_SIZE] for i in range(0, self.size, self.CHUNK_SIZE)
+        ]
+
+    def request_chunk(self, chunk_index: int) -> bytes:
+        return self.chunks[chunk_index]
+
+
+def _legacy_read(source: MemoryChunkSource, pos: int, size: int) -> bytes:
+    # the read path before readinto/memoryview, kept as the baseline
+    start_chunk = pos // source.CHUNK_SIZE
+    end_chunk = (pos + size - 1) // source.CHUNK_SIZE
+
+    parts = bytearray()
+    remaining = size
+    offset = pos
+    for chunk_index in range(start_chunk, end_chunk + 1):
+        chunk_data = source.request_chunk(chunk_index)
+        chunk_start = max(0, offset - chunk_index * source.CHUNK_SIZE)
+        chunk_end = min(len(chunk_data), chunk_start + remaining)
+        parts.extend(chunk_data[chunk_start:chunk_end])
+        remaining -= chunk_end - chunk_start
+        offset += chunk_end - chunk_start
+
+    return bytes(parts)
+
+
+def bench_read(size_mb: int, read_size: int, offset: int) -> None:
+    import time
+    import tracemalloc
+
+    from typing import cast
+    from spotify_dl.stream import ChunkedBytesStreamProtocol, ChunkedStreamReader
+
+    source = MemoryChunkSource(os.urandom(size_mb * 1024 * 1024))
+    chunk_source = cast(ChunkedBytesStreamProtocol, source)
+    buf = bytearray(read_size)
+
+    def legacy():
+        pos = offset
+        while pos < source.size:
+            data = _legacy_read(source, pos, min(read_size, source.size - pos))
+            pos += len(data)
+            yield len(data)
+
+    def read():
+        reader = ChunkedStreamReader(chunk_source, offset)
+        while data := reader.read(read_size):
+            yield len(data)
+
+    def readinto():
+        reader = ChunkedStreamReader(chunk_source, offset)
+        while n := reader.readinto(buf):
+            yield n
+
+    print(f"{size_mb} MiB, read size {read_size}, offset {offset}")
+    for name, fun in (("legacy", legacy), ("read", read), ("readinto", readinto)):
+        start = time.perf_counter()
+        total = sum(fun())
+        elapsed = time.perf_counter() - start
+
+        # bytes allocated on top of what is alive before each read call
+        allocated = 0
+        tracemalloc.start()
+        steps = fun()
+        while True:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            if next(steps, None) is None:
+                break
+            allocated += tracemalloc.get_traced_memory()[1] - current
+        tracemalloc.stop()
+
+        mb = total / (1024 * 1024)
+        print(
+            f"{name:>9}: {mb / elapsed:8.1f} MiB/s, {allocated / mb / (1024 * 1024):5.2f} MiB allocated per MiB read"
+        )
+
+
+# key, nonce, plaintext, ciphertext, mac (4 bytes)
+_SHANNON_VECTORS = [
+    (
+        "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f",
+        0,
+        "",
+        "",
+        "0aab5702",
+    ),
+    (
+        "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f",
+        1,
+        "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f2021222324",
+        "bb9624ac06e5cdede21440de0b3c60e4ac24b47828feb371cba9fda8db6eaf12bc75511695",
+        "29dc9152",
+    ),
+    (
+        "ffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff",
+        0x01020304,
+        "73706f7469667973706f7469667973706f7469667973706f7469667973706f74696679",
+        "97a7cda690fc9a4184bc67455225dfddd9f8108b186a811d8f5ed0a71c65bacbdc2a53",
+        "96bf77a8",
+    ),
+]
+
+
+def check_shannon(rounds: int) -> bool:
+    import random
+
+    from spotify_dl.utils.crypto import Shannon, ShannonReference
+
+    def run(cipher, key: bytes, nonce: int, parts: list[bytes], decrypt: bool):
+        cipher.key(key)
+        cipher.nonce(nonce)
+        fun = cipher.decrypt if decrypt else cipher.encrypt
+        return b"".join(fun(part) for part in parts), cipher.finish(4)
+
+    variants = [("python", Shannon(native=False))]
+    if Shannon().native:
+        variants.append(("native", Shannon()))
+    else:
+        print("shannon.so not built, only checking the python implementation")
+
+    ok = True
+    for name, cipher in [("reference", ShannonReference()), *variants]:
+        for key, nonce, plain, encrypted, mac in _SHANNON_VECTORS:
+            out = run(cipher, bytes.fromhex(key), nonce, [bytes.fromhex(plain)], False)
+            if out != (bytes.fromhex(encrypted), bytes.fromhex(mac)):
+                print(f"{name}: wrong output for vector with nonce {nonce}")
+                ok = False
+
+    # split the way `CipherPair` does, header first, so partial words get covered
+    rng = random.Random(0)
+    for i in range(rounds):
+        key = rng.randbytes(32)
+        nonce = rng.randrange(2**32)
+        data = rng.randbytes(rng.randrange(0, 4096))
+        cuts = sorted(rng.sample(range(len(data) + 1), min(3, len(data) + 1)))
+        parts = [data[a:b] for a, b in zip([0, *cuts], [*cuts, len(data)])]
+        decrypt = i % 2 == 1
+
+        expected = run(ShannonReference(), key, nonce, parts, decrypt)
+        for name, cipher in variants:
+            if run(cipher, key, nonce, parts, decrypt) != expected:
+                print(f"{name}: differs from the reference in round {i}")
+                ok = False
+
+    print(
+        f"{len(_SHANNON_VECTORS)} vectors, {rounds} random rounds: {'ok' if ok else 'FAILED'}"
+    )
+    return ok
+
+
+def bench_shannon(size_mb: int, packet_size: int) -> None:
+    import time
+
+    from spotify_dl.utils.crypto import Shannon, ShannonReference
+
+    data = os.urandom(packet_size)
+    packets = max(1, size_mb * 1024 * 1024 // packet_size)
+
+    ciphers = [
+        ("reference", ShannonReference()),
+        ("python", Shannon(native=False)),
+    ]
+    if Shannon().native:
+        ciphers.append(("native", Shannon()))
+    else:
+        print("shannon.so not built, make in spotify_dl/utils/shannon to include it")
+
+    print(f"{size_mb} MiB in {packet_size} byte packets")
+    for name, cipher in ciphers:
+        cipher.key(bytes(32))
+        # the reference is slow, one tenth of the data is plenty to time it
+        count = max(1, packets // 10) if name == "reference" else packets
+
+        start = time.perf_counter()
+        for nonce in range(count):
+            cipher.nonce(nonce)
+            _ = cipher.encrypt(data)
+            _ = cipher.finish(4)
+        elapsed = time.perf_counter() - start
+
+        print(f"{name:>9}: {count * packet_size / elapsed / (1024 * 1024):8.2f} MiB/s")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
 
@@ -430,6 +621,34 @@ def main() -> None:
         help="overwrite output if exists",
     )
 
+    benchp = sub.add_parser(
+        "bench-read", help="measure copies on the stream read path (read vs readinto)"
+    )
+    benchp.add_argument("--size", type=int, default=64, help="data size in MiB")
+    benchp.add_argument(
+        "--read-size", type=int, default=128 * 1024, help="bytes per read call"
+    )
+    benchp.add_argument(
+        "--offset", type=int, default=167, help="start offset (ogg header skip)"
+    )
+
+    shannonp = sub.add_parser(
+        "check-shannon",
+        help="compare the Shannon cipher against test vectors and the reference",
+    )
+    shannonp.add_argument(
+        "--rounds", type=int, default=200, help="random keys and messages to compare"
+    )
+
+    benchsp = sub.add_parser(
+        "bench-shannon",
+        help="Shannon encrypt throughput, reference vs python vs native",
+    )
+    benchsp.add_argument("--size", type=int, default=4, help="data size in MiB")
+    benchsp.add_argument(
+        "--packet-size", type=int, default=4096, help="bytes per packet"
+    )
+
     args = parser.parse_args()
     if args.cmd == "build-bento4":
         build_bento4()
@@ -465,6 +684,16 @@ def main() -> None:
         password = read_password()
         decrypt_file(infile, outfile, password, force=bool(args.force))
 
+    elif args.cmd == "bench-read":
+        bench_read(args.size, args.read_size, args.offset)
+
+    elif args.cmd == "check-shannon":
+        if not check_shannon(args.rounds):
+            sys.exit(1)
+
+    elif args.cmd == "bench-shannon":
+        bench_shannon(args.size, args.packet_size)
+
     else:
         parser.print_help()
 
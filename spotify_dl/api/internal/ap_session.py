@@ -0,0 +1,107 @@
+import logging
+import threading
+
+from typing import override
+
+from spotify_dl.api.internal.spotify_client import SpotifyClient
+from spotify_dl.auth.web_auth import SpotifyAuthPKCE
+from spotify_dl.key_provider import KeyProvider
+
+
+class APSession(KeyProvider):
+    """one ap connection for the whole process, logged in once and kept that way.
+
+    the client's receiver answers pings, a keepalive thread reconnects with the reusable
+    credentials when the connection dies or the ap goes quiet
+    """
+
+    logger: logging.Logger = logging.getLogger("spdl:ap_session")
+    CHECK_INTERVAL: float = 10
+    # the ap pings every 2 minutes
+    PING_TIMEOUT: float = 3 * 60
+    RECONNECT_DELAY: float = 1
+    MAX_RECONNECT_DELAY: float = 60
+
+    def __init__(self, auth: SpotifyAuthPKCE) -> None:
+        self.auth: SpotifyAuthPKCE = auth
+
+        self._client: SpotifyClient | None = None
+        # held while connecting, so everyone waits for the same handshake
+        self._lock: threading.RLock = threading.RLock()
+        self._keepalive: threading.Thread | None = None
+        self._closed: threading.Event = threading.Event()
+
+    def client(self) -> SpotifyClient:
+        """connected to an ap, not necessarily logged in yet"""
+        with self._lock:
+            if self._client is None:
+                self._client = SpotifyClient.best_ap(self.auth)
+            return self._client
+
+    def ready(self) -> SpotifyClient:
+        """logged in, with pings answered and the keepalive running"""
+        with self._lock:
+            client = self.client()
+            if self._keepalive is None:
+                # a failed login leaves nothing running, the next call tries again
+                client.login()
+                self._keepalive = threading.Thread(
+                    target=self._run, name="ap_keepalive", daemon=True
+                )
+                self._keepalive.start()
+            elif not client.is_alive(self.PING_TIMEOUT):
+                self._reconnect(client)
+
+            return client
+
+    @override
+    def get_audio_key(self, gid: bytes, file_id: bytes) -> bytes | None:
+        """retried once on a new connection if the current one breaks"""
+        client = self.ready()
+        conn = client.conn
+        try:
+            return client.get_audio_key(gid, file_id)
+        except (OSError, RuntimeError, ValueError) as e:
+            self.logger.warning(f"Key request failed: {e!r}, reconnecting")
+
+        with self._lock:
+            # another request may have reconnected already
+            if client.conn is conn:
+                self._reconnect(client)
+        return self.ready().get_audio_key(gid, file_id)
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            if self._client:
+                self._client.conn.close()
+
+    def _reconnect(self, client: SpotifyClient) -> None:
+        self.logger.info(f"Reconnecting, lost {client.addr}:{client.port}")
+        client.reconnect()
+        self.logger.info(f"Reconnected to {client.addr}:{client.port}")
+
+    def _run(self) -> None:
+        failures = 0
+        delay = self.CHECK_INTERVAL
+        while not self._closed.wait(delay):
+            with self._lock:
+                client = self._client
+                if client is None or client.is_alive(self.PING_TIMEOUT):
+                    failures = 0
+                    delay = self.CHECK_INTERVAL
+                    continue
+
+                try:
+                    self._reconnect(client)
+                    failures = 0
+                    delay = self.CHECK_INTERVAL
+                except Exception as e:
+                    # `ready` still tries right away when someone needs it
+                    delay = min(
+                        self.RECONNECT_DELAY * 2**failures, self.MAX_RECONNECT_DELAY
+                    )
+                    failures += 1
+                    self.logger.warning(
+                        f"Reconnect failed: {e!r}, next try in {delay}s"
+                    )
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+
+from collections.abc import Sequence
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import ClassVar
+
+import curl_cffi
+
+from spotify_dl.api.internal.proto.extension_kind_pb2 import ExtensionKind
+from spotify_dl.api.internal.proto.extended_metadata_pb2 import (
+    EntityRequest,
+    BatchedEntityRequest,
+    ExtensionQuery,
+    BatchedExtensionResponse,
+)
+from spotify_dl.api.internal.proto import metadata_pb2 as Metadata
+
+logger = logging.getLogger("spdl:extended_metadata")
+
+EXTENDED_METADATA_URL = (
+    "https://spclient.wg.spotify.com/extended-metadata/v0/extended-metadata"
+)
+# entities per request
+BATCH_SIZE = 100
+
+
+def get_extended_metadata(
+    session: curl_cffi.Session[curl_cffi.Response],
+    uris: Sequence[str],
+    kind: ExtensionKind,
+) -> dict[str, bytes]:
+    """one `BatchedEntityRequest` per `BATCH_SIZE` uris, returns the raw extension data by uri"""
+    result: dict[str, bytes] = {}
+
+    for i in range(0, len(uris), BATCH_SIZE):
+        query = ExtensionQuery(extension_kind=kind)
+        batched_req = BatchedEntityRequest(
+            entity_request=[
+                EntityRequest(entity_uri=uri, query=[query])
+                for uri in uris[i : i + BATCH_SIZE]
+            ]
+        )
+        res = session.post(
+            EXTENDED_METADATA_URL,
+            headers={"Content-Type": "application/x-protobuf"},
+            data=batched_req.SerializeToString(),
+        )
+        res.raise_for_status()
+
+        batched_res = BatchedExtensionResponse()
+        _ = batched_res.ParseFromString(res.content)
+
+        for array in batched_res.extended_metadata:
+            if array.extension_kind != kind:
+                continue
+            for data in array.extension_data:
+                if not data.HasField("extension_data"):
+                    logger.warning(
+                        f"No metadata for {data.entity_uri} ({data.header.status_code})"
+                    )
+                    continue
+                result[data.entity_uri] = data.extension_data.value
+
+    return result
+
+
+@dataclass
+class BatcherStats:
+    # uris asked for by callers
+    requests: int = 0
+    # of those, answered by a request already in flight
+    coalesced: int = 0
+    # extended-metadata posts actually sent
+    batches: int = 0
+
+
+class MetadataBatcher:
+    """collects concurrent lookups for `WINDOW` seconds and sends them as one `BatchedEntityRequest`"""
+
+    logger: logging.Logger = logging.getLogger("spdl:metadata_batcher")
+    WINDOW: float = 0.02
+
+    _shared: ClassVar["MetadataBatcher | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, window: float = WINDOW) -> None:
+        self.window: float = window
+
+        # waiting for the next flush, grouped by what they are sent with
+        self._pending: dict[
+            tuple[curl_cffi.Session[curl_cffi.Response], ExtensionKind],
+            dict[str, Future[bytes]],
+        ] = {}
+        # pending or being fetched, duplicates get the same future
+        self._inflight: dict[tuple[ExtensionKind, str], Future[bytes]] = {}
+        self._stats: BatcherStats = BatcherStats()
+        self._cond: threading.Condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def shared(cls) -> "MetadataBatcher":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def submit(
+        self,
+        session: curl_cffi.Session[curl_cffi.Response],
+        uri: str,
+        kind: ExtensionKind,
+    ) -> Future[bytes]:
+        with self._cond:
+            self._stats.requests += 1
+
+            future = self._inflight.get((kind, uri))
+            if future:
+                self._stats.coalesced += 1
+                return future
+
+            future = Future[bytes]()
+            self._inflight[(kind, uri)] = future
+            self._pending.setdefault((session, kind), {})[uri] = future
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="metadata_batcher", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+            return future
+
+    def get(
+        self,
+        session: curl_cffi.Session[curl_cffi.Response],
+        uri: str,
+        kind: ExtensionKind,
+    ) -> bytes:
+        return self.submit(session, uri, kind).result()
+
+    def get_tracks(
+        self, session: curl_cffi.Session[curl_cffi.Response], uris: Sequence[str]
+    ) -> dict[str, Metadata.Track]:
+        """skips the uris there is no metadata for"""
+        futures = {
+            uri: self.submit(session, uri, ExtensionKind.TRACK_V4) for uri in uris
+        }
+
+        tracks: dict[str, Metadata.Track] = {}
+        for uri, future in futures.items():
+            try:
+                data = future.result()
+            except KeyError:
+                continue
+
+            track = Metadata.Track()
+            _ = track.ParseFromString(data)
+            tracks[uri] = track
+        return tracks
+
+    def get_track(
+        self, session: curl_cffi.Session[curl_cffi.Response], uri: str
+    ) -> Metadata.Track:
+        tracks = self.get_tracks(session, [uri])
+        if uri not in tracks:
+            raise ValueError(f"No metadata for {uri}")
+        return tracks[uri]
+
+    def stats(self) -> BatcherStats:
+        with self._cond:
+            return BatcherStats(
+                self._stats.requests, self._stats.coalesced, self._stats.batches
+            )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    _ = self._cond.wait()
+
+            # let the other workers' lookups pile up
+            time.sleep(self.window)
+
+            with self._cond:
+                pending, self._pending = self._pending, {}
+
+            for (session, kind), futures in pending.items():
+                uris = list(futures)
+                for i in range(0, len(uris), BATCH_SIZE):
+                    self._flush(
+                        session,
+                        kind,
+                        {uri: futures[uri] for uri in uris[i : i + BATCH_SIZE]},
+                    )
+
+    def _flush(
+        self,
+        session: curl_cffi.Session[curl_cffi.Response],
+        kind: ExtensionKind,
+        futures: dict[str, Future[bytes]],
+    ) -> None:
+        self.logger.debug(f"Fetching {len(futures)} entities")
+        try:
+            result = get_extended_metadata(session, list(futures), kind)
+            error = None
+        except Exception as e:
+            result = {}
+            error = e
+
+        with self._cond:
+            self._stats.batches += 1
+            # later lookups go out again, whoever wants to keep the result caches it
+            for uri in futures:
+                _ = self._inflight.pop((kind, uri), None)
+
+        for uri, future in futures.items():
+            if error:
+                future.set_exception(error)
+            elif uri in result:
+                future.set_result(result[uri])
+            else:
+                future.set_exception(KeyError(uri))
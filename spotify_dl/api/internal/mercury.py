@@ -1,4 +1,5 @@
 import struct
+from concurrent.futures import Future
 from typing import final
 from spotify_dl.api.internal.spotify_client import SpotifyClient
 from spotify_dl.api.internal.proto.mercury_pb2 import Header
@@ -14,25 +15,23 @@ class Mercury:
         self,
         uri: str,
         method: bytes,
-    ) -> None:
+    ) -> Future[bytes | None]:
+        """the reply comes back on the future, matched by seq on the client's receiver"""
         if not self.client.cipher:
             raise ValueError("cipher is not initialized, is the handshake successful?")
 
-        buf = bytearray()
-        buf.extend(struct.pack(">HQBH", 8, self.client.seq, 1, 1))
-        self.client.seq += 1
-
         header = Header(
             uri=uri,
             method=method.decode(),
         )
-
         header_buf = header.SerializeToString()
-        buf.extend(struct.pack(">H", len(header_buf)))
-        buf.extend(header_buf)
 
-        self.client.cipher.send_encoded(
-            self.client.conn,
-            method,
-            bytes(buf),
-        )
+        def payload(seq: int) -> bytes:
+            buf = bytearray()
+            buf.extend(struct.pack(">HQBH", 8, seq, 1, 1))
+            buf.extend(struct.pack(">H", len(header_buf)))
+            buf.extend(header_buf)
+            return bytes(buf)
+
+        _, future = self.client.request(method, payload)
+        return future
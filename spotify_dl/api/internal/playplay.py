@@ -9,7 +9,6 @@ from spotify_dl.api.internal.proto.playplay_pb2 import (
     PlayPlayLicenseRequest,
     PlayPlayLicenseResponse,
 )
-from spotify_dl.api.web.apresolve import get_random_spclient
 from spotify_dl.playplay.playplay_c import playplay_decrypt
 
 
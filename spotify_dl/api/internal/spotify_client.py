@@ -4,9 +4,12 @@ import logging
 import os
 import socket
 import struct
+import threading
 import time
 import uuid
 
+from collections.abc import Callable
+from concurrent.futures import Future
 from typing import Self, TypeGuard, cast, TypedDict, override
 from Cryptodome.Hash import HMAC, SHA1
 from Cryptodome.PublicKey import RSA
@@ -15,7 +18,7 @@ from Cryptodome.Signature import PKCS1_v1_5
 from spotify_dl.auth.auth_provider import AuthProvider
 from spotify_dl.auth.web_auth import SpotifyAuthPKCE
 from spotify_dl.key_provider import KeyProvider
-from spotify_dl.api.web.apresolve import get_accesspoint
+from spotify_dl.api.web.apresolve import ApResolver, get_accesspoint
 from spotify_dl.utils.connection import SocketConnection
 from spotify_dl.utils.crypto import DHKey
 from spotify_dl.api.internal.cipher import CipherPair
@@ -46,7 +49,6 @@ from spotify_dl.api.internal.proto.authentication_pb2 import (
     Os,
     SystemInfo,
 )
-from spotify_dl.utils.misc import random_order
 
 
 class ReusableSchema(TypedDict):
@@ -61,6 +63,7 @@ class SpotifyClient(AuthProvider[ReusableSchema], KeyProvider):
         21823581898349655569073153010024875866680360595041832877682009086525543062007759377936242326561802478825880089458110335403551375236649157065502301012891458399825664119417150281976229148711139317450628328839720892460534096843275538011418744806604964798210621296650510908306523427425696959525181094419017879246106872673711968985492349600443051010137641078005441820342625510004834802242062196525075763597088556647911324288377975942408884781721344719415751475652337673266953113087580192529673091473125075313299523391491535787804999014442523894945078938686301787840555533712734909924635503633011364796383888738282283357629
     )
     Auth: type[AuthenticationType] = AuthenticationType
+    KEY_TIMEOUT: float = 10.0
 
     def __init__(
         self,
@@ -81,6 +84,16 @@ class SpotifyClient(AuthProvider[ReusableSchema], KeyProvider):
         self.cipher: CipherPair | None = None
         self.authenticated: bool = False
 
+        # once authenticated a single thread reads the connection, and hands
+        # key responses to whoever asked for that seq
+        self._send_lock: threading.Lock = threading.Lock()
+        self._pending: dict[int, Future[bytes | None]] = {}
+        self._pending_lock: threading.Lock = threading.Lock()
+        self._receiver: threading.Thread | None = None
+        self._receiver_conn: SocketConnection | None = None
+        # monotonic, when the receiver last got anything
+        self.last_packet: float = 0
+
     @property
     @override
     def token(self) -> str:
@@ -124,27 +137,60 @@ class SpotifyClient(AuthProvider[ReusableSchema], KeyProvider):
 
     @override
     def refresh_token(self) -> None:
-        self.conn.close()
-        self._save(None)
-        self.cipher = None
+        # nothing is sent while the connection and cipher are swapped
+        with self._send_lock:
+            self.conn.close()
+            self._save(None)
+            self.cipher = None
+            # they were sent on the old connection, nothing is coming back for them
+            self._fail_pending(ConnectionError("Refreshing token"))
+
+            self._connect_any()
+            self.handshake()
+            self.authenticate_with_token()
+        if self._receiver:
+            self._start_receiver()
+
+    def reconnect(self) -> None:
+        """new connection and handshake, logged back in with the reusable credentials"""
+        with self._send_lock:
+            self.conn.close()
+            self.cipher = None
+            self.authenticated = False
+            self.key = DHKey()
+            self._fail_pending(ConnectionError("Reconnecting"))
+
+            self._connect_any()
+            self.handshake()
+            self.authenticate_with_reusable()
+        self._start_receiver()
+
+    def is_alive(self, timeout: float) -> bool:
+        """logged in and heard from the ap in the last `timeout` seconds, it pings every couple of minutes"""
+        return (
+            self.authenticated
+            and self._receiver is not None
+            and self._receiver.is_alive()
+            and time.monotonic() - self.last_packet < timeout
+        )
 
-        aps = get_accesspoint()
-        connected = False
-        for addr, port in random_order(aps):
+    def _connect_any(self) -> None:
+        resolver = ApResolver.shared()
+        for addr, port in get_accesspoint():
+            start = time.perf_counter()
             try:
                 self.conn = SocketConnection(addr, port)
-                self.addr = addr
-                self.port = port
-                connected = True
-                break
-            except ConnectionRefusedError:
+            except OSError:
+                resolver.record_failure((addr, port))
                 time.sleep(0.5)
+                continue
 
-        if not connected:
-            raise ConnectionRefusedError("Could not reconnect to spotify server")
+            resolver.record_latency((addr, port), time.perf_counter() - start)
+            self.addr = addr
+            self.port = port
+            return
 
-        self.handshake()
-        self.authenticate_with_token()
+        raise ConnectionRefusedError("Could not reconnect to spotify server")
 
     @classmethod
     def connect_retry(
@@ -157,12 +203,13 @@ class SpotifyClient(AuthProvider[ReusableSchema], KeyProvider):
                 time.sleep(0.5)
 
     @classmethod
-    def random_ap(cls, auth: SpotifyAuthPKCE) -> Self:
-        aps = get_accesspoint()
-        for addr, port in random_order(aps):
+    def best_ap(cls, auth: SpotifyAuthPKCE) -> Self:
+        """the fastest ap that takes the connection"""
+        for addr, port in get_accesspoint():
             client = cls.connect_retry(addr, port, auth)
             if client:
                 return client
+            ApResolver.shared().record_failure((addr, port))
 
         raise ConnectionRefusedError("Tried all ap's 5 TIMES still didn't work")
 
@@ -266,6 +313,14 @@ class SpotifyClient(AuthProvider[ReusableSchema], KeyProvider):
 
         self.logger.info(f"SUCCESSFULLY CONNECTED")
 
+    def login(self) -> None:
+        """handshake and authenticate unless that happened already, then keep reading the connection"""
+        if not self.authenticated:
+            if not self.cipher:
+                self.handshake()
+            self.authenticate()
+        self._start_receiver()
+
     def authenticate(self) -> None:
         if self.is_token_valid():
             self.authenticate_with_reusable()
@@ -339,40 +394,144 @@ class SpotifyClient(AuthProvider[ReusableSchema], KeyProvider):
         else:
             raise RuntimeError(f"Unknown CMD {PacketType.get_name(packet.type)}")
 
+    def send(self, cmd: bytes, payload: bytes) -> None:
+        """safe to call from any thread, waits out a reconnect"""
+        with self._send_lock:
+            if not self.cipher:
+                raise ValueError(
+                    "cipher is not initialized, is the handshake successful?"
+                )
+            self.cipher.send_encoded(self.conn, cmd, payload)
+
+    def _start_receiver(self) -> None:
+        with self._pending_lock:
+            if (
+                self._receiver
+                and self._receiver.is_alive()
+                and self._receiver_conn is self.conn
+            ):
+                return
+
+            assert self.cipher
+            self.last_packet = time.monotonic()
+            self._receiver = threading.Thread(
+                target=self._receive,
+                args=(self.conn, self.cipher),
+                name=f"ap_receiver:{self.addr}",
+                daemon=True,
+            )
+            self._receiver_conn = self.conn
+            self._receiver.start()
+
+    def _receive(self, conn: SocketConnection, cipher: CipherPair) -> None:
+        # bound to one connection, `refresh_token` swaps in a new one and
+        # closing the old one ends this
+        error: Exception = ConnectionError("Connection closed")
+        try:
+            while True:
+                packet = cipher.recv_encoded(conn)
+                self.last_packet = time.monotonic()
+                self.logger.debug(packet)
+
+                if packet.type in (PacketType.aes_key, PacketType.aes_key_error):
+                    self._resolve_key(packet.type, packet.payload)
+                elif packet.type == PacketType.mercury_req:
+                    self._resolve_mercury(packet.payload)
+                elif packet.type == PacketType.ping:
+                    with self._send_lock:
+                        # the pong goes out on the connection that was pinged
+                        if conn is self.conn:
+                            cipher.send_encoded(
+                                conn, PacketType.pong, b"\x00\x00\x00\x00"
+                            )
+        except Exception as e:
+            error = e
+        finally:
+            # after a reconnect the pending requests belong to the new connection
+            if conn is self.conn:
+                self._fail_pending(error)
+            self.logger.debug(f"Receiver stopped: {error}")
+
+    def _fail_pending(self, error: Exception) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def _resolve_key(self, type: bytes, payload: bytes) -> None:
+        seq = cast(int, struct.unpack_from(">I", payload)[0])
+        with self._pending_lock:
+            future = self._pending.pop(seq, None)
+        if future is None:
+            self.logger.debug(f"Key response for unknown seq {seq}")
+            return
+
+        if type == PacketType.aes_key:
+            future.set_result(payload[4:20])
+        else:
+            code = cast(int, struct.unpack_from(">H", payload, 4)[0])
+            self.logger.error(
+                f"Failed to get aes key, code: {code}. Track codec possibly gated behind premium user, continuing without a key (encrypted)"
+            )
+            future.set_result(None)
+
+    def _resolve_mercury(self, payload: bytes) -> None:
+        # seq length, seq, flags, part count
+        seq_len = cast(int, struct.unpack_from(">H", payload)[0])
+        seq = int.from_bytes(payload[2 : 2 + seq_len], "big")
+        flags = payload[2 + seq_len]
+        if not flags & 1:
+            # TODO: multi-packet replies, only the final packet is handed out
+            self.logger.debug(f"Partial mercury reply for seq {seq}")
+            return
+
+        with self._pending_lock:
+            future = self._pending.pop(seq, None)
+        if future is None:
+            self.logger.debug(f"Mercury reply for unknown seq {seq}")
+            return
+        future.set_result(payload)
+
+    def request(
+        self, cmd: bytes, payload: Callable[[int], bytes]
+    ) -> tuple[int, Future[bytes | None]]:
+        """sends what `payload` builds for a fresh seq, the receiver answers the future.
+
+        the seq is taken and registered under one lock, so concurrent requests never share one
+        """
+        self._start_receiver()
+
+        future: Future[bytes | None] = Future()
+        with self._pending_lock:
+            seq = self.seq
+            self.seq += 1
+            self._pending[seq] = future
+
+        try:
+            self.send(cmd, payload(seq))
+        except BaseException:
+            with self._pending_lock:
+                _ = self._pending.pop(seq, None)
+            raise
+        return seq, future
+
     @override
     def get_audio_key(self, gid: bytes, file_id: bytes) -> bytes | None:
+        """many can be in flight at once, each waits only for its own seq"""
         if not self.cipher:
             raise ValueError("cipher is not initialized, is the handshake successful?")
 
-        buf = bytearray()
-        buf.extend(file_id)
-        buf.extend(gid)
-        buf.extend(struct.pack(">I", self.seq))
-        buf.extend(b"\x00\x00")
-        self.seq += 1
-
-        self.cipher.send_encoded(self.conn, PacketType.request_key, bytes(buf))
-
-        while True:
-            packet = self.cipher.recv_encoded(self.conn)
-            self.logger.debug(packet)
-
-            if packet.type in (PacketType.aes_key, PacketType.aes_key_error):
-                payload = io.BytesIO(packet.payload)
-                seq = cast(int, struct.unpack(">i", payload.read(4))[0])
-                self.logger.debug(f"SEQ: {seq}")
-                if packet.type == PacketType.aes_key:
-                    return payload.read(16)
-                elif packet.type == PacketType.aes_key_error:
-                    code = cast(int, struct.unpack(">H", payload.read(2))[0])
-                    self.logger.error(
-                        f"Failed to get aes key, code: {code}. Track codec possibly gated behind premium user, continuing without a key (encrypted)"
-                    )
-                    return
-            else:
-                if packet.type == PacketType.ping:
-                    self.cipher.send_encoded(
-                        self.conn,
-                        PacketType.pong,
-                        b"\x00\x00\x00\x00",
-                    )
+        def payload(seq: int) -> bytes:
+            buf = bytearray()
+            buf.extend(file_id)
+            buf.extend(gid)
+            buf.extend(struct.pack(">I", seq))
+            buf.extend(b"\x00\x00")
+            return bytes(buf)
+
+        seq, future = self.request(PacketType.request_key, payload)
+        try:
+            return future.result(timeout=self.KEY_TIMEOUT)
+        finally:
+            with self._pending_lock:
+                _ = self._pending.pop(seq, None)
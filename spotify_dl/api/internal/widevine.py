@@ -7,7 +7,7 @@ from pywidevine.device import Device
 from pywidevine.pssh import PSSH
 import curl_cffi
 
-from spotify_dl.api.web.apresolve import get_random_spclient
+from spotify_dl.api.web.apresolve import with_best_spclient
 from spotify_dl.auth.clienttoken import ClientToken
 from spotify_dl.key_provider import KeyProvider
 from spotify_dl.auth.internal_auth import SpotifyInternalAuth
@@ -55,14 +55,16 @@ class WidevineClient(KeyProvider):
             privacy_mode=False,
         )
 
-        license = curl_cffi.post(
-            f"https://{get_random_spclient()[0]}/widevine-license/v1/audio/license",
-            data=challenge,
-            headers={
-                "Authorization": f"Bearer {self.iauth.token}",
-                "Client-Token": self.clienttoken.token,
-            },
-            impersonate="chrome",
+        license = with_best_spclient(
+            lambda host: curl_cffi.post(
+                f"https://{host}/widevine-license/v1/audio/license",
+                data=challenge,
+                headers={
+                    "Authorization": f"Bearer {self.iauth.token}",
+                    "Client-Token": self.clienttoken.token,
+                },
+                impersonate="chrome",
+            )
         )
         license.raise_for_status()
 
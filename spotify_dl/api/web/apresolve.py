@@ -1,33 +1,195 @@
-import random
+import logging
+import math
+import socket
+import threading
+import time
+
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import ClassVar, Literal
 
 import curl_cffi
 
+type Endpoint = tuple[str, int]
+type EndpointKind = Literal["accesspoint", "spclient"]
+
 
-def get_accesspoint() -> list[tuple[str, int]]:
-    res = curl_cffi.get("https://apresolve.spotify.com/?type=accesspoint", impersonate="chrome")
+def apresolve(kind: EndpointKind) -> list[Endpoint]:
+    res = curl_cffi.get(f"https://apresolve.spotify.com/?type={kind}", impersonate="chrome")
 
     json: dict[str, list[str]] = res.json()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-    urls = json.get("accesspoint", None)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    urls = json.get(kind, None)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
     if urls is None:
         raise ValueError("No urls")
 
     return [(addr, int(port)) for addr, port in (ap.split(":", 1) for ap in urls)]  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType, reportUnknownArgumentType]
 
 
-def get_spclient() -> list[tuple[str, int]]:
-    res = curl_cffi.get("https://apresolve.spotify.com/?type=spclient", impersonate="chrome")
+@dataclass
+class ApResolverStats:
+    hits: int = 0
+    misses: int = 0
+    # apresolve requests actually sent, misses and background refreshes
+    resolves: int = 0
 
-    json: dict[str, list[str]] = res.json()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-    urls = json.get("spclient", None)  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-    if urls is None:
-        raise ValueError("No urls")
 
-    return [(addr, int(port)) for addr, port in (ap.split(":", 1) for ap in urls)]  # pyright: ignore[reportUnknownArgumentType, reportUnknownVariableType, reportUnknownMemberType]
+class ApResolver:
+    """apresolve results kept for `TTL`, ranked by how fast each endpoint accepts a connection"""
+
+    logger: logging.Logger = logging.getLogger("spdl:apresolve")
+    # seconds
+    TTL: float = 60 * 60
+    # past this age lookups still get the cached list, a new one is fetched in the background
+    REFRESH_AFTER: float = 45 * 60
+    PROBE_TIMEOUT: float = 2
+    MAX_WORKERS: int = 8
+
+    _shared: ClassVar["ApResolver | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, max_workers: int = MAX_WORKERS) -> None:
+        # kind -> (resolved at, endpoints in apresolve's order)
+        self._entries: dict[EndpointKind, tuple[float, list[Endpoint]]] = {}
+        self._pending: dict[EndpointKind, Future[list[Endpoint]]] = {}
+        # seconds to connect, `math.inf` when the last attempt failed
+        self._latency: dict[Endpoint, float] = {}
+        self._stats: ApResolverStats = ApResolverStats()
+        self._lock: threading.Lock = threading.Lock()
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="apresolve"
+        )
+
+    @classmethod
+    def shared(cls) -> "ApResolver":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def endpoints(self, kind: EndpointKind) -> list[Endpoint]:
+        """fastest first"""
+        with self._lock:
+            entry = self._entries.get(kind)
+            age = time.monotonic() - entry[0] if entry else math.inf
+            if entry and age < self.TTL:
+                self._stats.hits += 1
+                if age >= self.REFRESH_AFTER:
+                    _ = self._submit(kind)
+                return self._rank(entry[1])
+
+            self._stats.misses += 1
+            future = self._submit(kind)
+
+        try:
+            endpoints = future.result()
+        except Exception as e:
+            if entry is None:
+                raise
+            self.logger.warning(
+                f"apresolve failed: {e!r}, keeping the expired {kind} list"
+            )
+            endpoints = entry[1]
+
+        with self._lock:
+            return self._rank(endpoints)
+
+    def best(self, kind: EndpointKind) -> Endpoint:
+        return self.endpoints(kind)[0]
+
+    def record_latency(self, endpoint: Endpoint, elapsed: float) -> None:
+        with self._lock:
+            self._latency[endpoint] = elapsed
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        """ranks it last until a probe or a connection gets through again"""
+        with self._lock:
+            self._latency[endpoint] = math.inf
+
+    def latency(self, endpoint: Endpoint) -> float | None:
+        with self._lock:
+            return self._latency.get(endpoint)
+
+    def stats(self) -> ApResolverStats:
+        with self._lock:
+            return ApResolverStats(
+                self._stats.hits, self._stats.misses, self._stats.resolves
+            )
+
+    def _rank(self, endpoints: list[Endpoint]) -> list[Endpoint]:
+        # measured ones by latency, then the ones not probed yet, then the failed ones,
+        # ties keep apresolve's order
+        def key(endpoint: Endpoint) -> tuple[int, float]:
+            latency = self._latency.get(endpoint)
+            if latency is None:
+                return (1, 0)
+            if latency == math.inf:
+                return (2, 0)
+            return (0, latency)
+
+        return sorted(endpoints, key=key)
+
+    def _submit(self, kind: EndpointKind) -> Future[list[Endpoint]]:
+        future = self._pending.get(kind)
+        if future is None:
+            future = self._executor.submit(self._fetch, kind)
+            self._pending[kind] = future
+        return future
+
+    def _fetch(self, kind: EndpointKind) -> list[Endpoint]:
+        try:
+            endpoints = apresolve(kind)
+        except BaseException:
+            with self._lock:
+                _ = self._pending.pop(kind, None)
+            raise
+
+        with self._lock:
+            self._entries[kind] = (time.monotonic(), endpoints)
+            self._stats.resolves += 1
+            _ = self._pending.pop(kind, None)
+
+        self.logger.debug(f"Resolved {len(endpoints)} {kind} endpoints")
+        for endpoint in endpoints:
+            _ = self._executor.submit(self._probe, endpoint)
+        return endpoints
+
+    def _probe(self, endpoint: Endpoint) -> None:
+        start = time.perf_counter()
+        try:
+            socket.create_connection(endpoint, timeout=self.PROBE_TIMEOUT).close()
+        except OSError:
+            self.record_failure(endpoint)
+            return
+        self.record_latency(endpoint, time.perf_counter() - start)
+
+
+def get_accesspoint() -> list[Endpoint]:
+    return ApResolver.shared().endpoints("accesspoint")
+
+
+def get_spclient() -> list[Endpoint]:
+    return ApResolver.shared().endpoints("spclient")
+
+
+def get_best_accesspoint() -> Endpoint:
+    return ApResolver.shared().best("accesspoint")
+
 
+def get_best_spclient() -> Endpoint:
+    return ApResolver.shared().best("spclient")
 
-def get_random_accesspoint() -> tuple[str, int]:
-    return random.choice(get_accesspoint())
 
+def with_best_spclient(request: Callable[[str], curl_cffi.Response]) -> curl_cffi.Response:
+    """runs `request` against the host of the best spclient. one that can't be reached or
+    answers with a server error is ranked last until the next probe"""
+    endpoint = get_best_spclient()
+    try:
+        res = request(endpoint[0])
+    except OSError:
+        ApResolver.shared().record_failure(endpoint)
+        raise
 
-def get_random_spclient() -> tuple[str, int]:
-    return random.choice(get_spclient())
+    if res.status_code >= 500:
+        ApResolver.shared().record_failure(endpoint)
+    return res
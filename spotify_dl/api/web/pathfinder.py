@@ -0,0 +1,84 @@
+from typing import Any, cast
+
+import curl_cffi
+
+from spotify_dl.metadata_cache import MetadataCache, MetadataKind
+from spotify_dl.model.getAlbum_gql import AlbumUnion
+from spotify_dl.model.getAlbum_gql import GraphQLResponse as AlbumResponse
+
+PATHFINDER_URL = "https://api-partner.spotify.com/pathfinder/v2/query"
+
+GET_TRACK_HASH = "d208301e63ccb8504831114cb8db1201636a016187d7c832c8c00933e2cd64c6"
+GET_ALBUM_HASH = "46ae954ef2d2fe7732b4b2b4022157b2e18b7ea84f70591ceb164e4de1b5d5d3"
+# tracks per getAlbum page
+ALBUM_PAGE_SIZE = 50
+
+
+def query(
+    operation: str,
+    sha256: str,
+    variables: dict[str, Any],  # pyright: ignore[reportExplicitAny]
+    token: str,
+    client_token: str,
+) -> Any:  # pyright: ignore[reportExplicitAny, reportAny]
+    res = curl_cffi.post(
+        PATHFINDER_URL,
+        json={
+            "variables": variables,
+            "operationName": operation,
+            "extensions": {
+                "persistedQuery": {
+                    "version": 1,
+                    "sha256Hash": sha256,
+                }
+            },
+        },
+        headers={
+            "authorization": f"Bearer {token}",
+            "client-token": client_token,
+        },
+        impersonate="chrome",
+    )
+    res.raise_for_status()
+    return res.json()  # pyright: ignore[reportUnknownMemberType, reportAny]
+
+
+def get_album(
+    uri: str,
+    token: str,
+    client_token: str,
+    offset: int = 0,
+    limit: int = ALBUM_PAGE_SIZE,
+) -> AlbumUnion:
+    cache = MetadataCache.shared()
+    key = f"{uri}?offset={offset}&limit={limit}"
+    album = cast(AlbumUnion | None, cache.get_json(MetadataKind.ALBUM, key))
+    if album:
+        return album
+
+    res = cast(
+        AlbumResponse,
+        query(
+            "getAlbum",
+            GET_ALBUM_HASH,
+            {"uri": uri, "locale": "", "offset": offset, "limit": limit},
+            token,
+            client_token,
+        ),
+    )
+    album = res["data"]["albumUnion"]
+    cache.put_json(MetadataKind.ALBUM, key, album)
+    return album
+
+
+def get_album_track_uris(uri: str, token: str, client_token: str) -> list[str]:
+    """every track of the album, one `getAlbum` page at a time"""
+    uris: list[str] = []
+    offset = 0
+    while True:
+        tracks = get_album(uri, token, client_token, offset)["tracks"]
+        uris.extend(item["track"]["uri"] for item in tracks["items"])
+
+        offset += ALBUM_PAGE_SIZE
+        if offset >= tracks["totalCount"] or not tracks["items"]:
+            return uris
@@ -1,4 +1,12 @@
-from typing import TypedDict, cast
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import ClassVar, TypedDict, cast
 
 import curl_cffi
 
@@ -10,7 +18,9 @@ class StorageResolve(TypedDict):
     ttl: int
 
 
-def storage_resolve(session: curl_cffi.Session, file_id: str) -> StorageResolve:
+def storage_resolve(
+    session: curl_cffi.Session[curl_cffi.Response], file_id: str
+) -> StorageResolve:
     res = session.get(
         f"https://gew4-spclient.spotify.com/storage-resolve/v2/files/audio/interactive/10/{file_id}",
         params={
@@ -25,3 +35,149 @@ def storage_resolve(session: curl_cffi.Session, file_id: str) -> StorageResolve:
     res.raise_for_status()
 
     return cast(StorageResolve, res.json())  # pyright: ignore[reportUnknownMemberType]
+
+
+@dataclass
+class StorageResolverStats:
+    hits: int = 0
+    misses: int = 0
+    # lookups that found the same file already being resolved
+    coalesced: int = 0
+
+
+class StorageResolver:
+    """`storage_resolve` results kept for their `ttl`, and resolved ahead of time in bulk"""
+
+    logger: logging.Logger = logging.getLogger("spdl:storage_resolve")
+    MAX_WORKERS: int = 8
+    # prefetches run on a pool of their own, a batch never holds up a lookup someone waits on
+    PREFETCH_WORKERS: int = 2
+    # the cdn urls are signed, they are dropped a bit before they actually expire
+    TTL_MARGIN: float = 0.9
+    # least recently used ones go first past this
+    MAX_ENTRIES: int = 1024
+
+    _shared: ClassVar["StorageResolver | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        max_workers: int = MAX_WORKERS,
+        max_entries: int = MAX_ENTRIES,
+        prefetch_workers: int = PREFETCH_WORKERS,
+    ) -> None:
+        self.max_entries: int = max_entries
+        # file_id -> (expires, result), least recently used first
+        self._entries: OrderedDict[str, tuple[float, StorageResolve]] = OrderedDict()
+        self._pending: dict[str, Future[StorageResolve]] = {}
+        self._stats: StorageResolverStats = StorageResolverStats()
+        self._lock: threading.Lock = threading.Lock()
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="storage_resolve"
+        )
+        self._prefetch_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=prefetch_workers, thread_name_prefix="storage_prefetch"
+        )
+
+    @classmethod
+    def shared(cls) -> "StorageResolver":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def resolve(
+        self, session: curl_cffi.Session[curl_cffi.Response], file_id: str
+    ) -> StorageResolve:
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry and entry[0] > time.monotonic():
+                self._stats.hits += 1
+                self._entries.move_to_end(file_id)
+                return entry[1]
+
+            future = self._pending.get(file_id)
+            if future and future.cancel():
+                # a prefetch still waiting for its turn, this one goes ahead of the batch
+                future = None
+            if future:
+                self._stats.coalesced += 1
+            else:
+                self._stats.misses += 1
+                future = self._submit(self._executor, session, file_id)
+
+        return future.result()
+
+    def prefetch(
+        self, session: curl_cffi.Session[curl_cffi.Response], file_ids: Iterable[str]
+    ) -> None:
+        """starts resolving in the background whatever isn't cached yet"""
+        self._submit_missing(self._prefetch_executor, session, file_ids)
+
+    def resolve_many(
+        self, session: curl_cffi.Session[curl_cffi.Response], file_ids: Iterable[str]
+    ) -> dict[str, StorageResolve]:
+        file_ids = list(file_ids)
+        self._submit_missing(self._executor, session, file_ids)
+        return {file_id: self.resolve(session, file_id) for file_id in file_ids}
+
+    def invalidate(self, file_id: str) -> None:
+        """for when none of the cdns it gave out work anymore"""
+        with self._lock:
+            _ = self._entries.pop(file_id, None)
+
+    def stats(self) -> StorageResolverStats:
+        with self._lock:
+            return StorageResolverStats(
+                self._stats.hits, self._stats.misses, self._stats.coalesced
+            )
+
+    def _submit_missing(
+        self,
+        executor: ThreadPoolExecutor,
+        session: curl_cffi.Session[curl_cffi.Response],
+        file_ids: Iterable[str],
+    ) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for file_id in file_ids:
+                entry = self._entries.get(file_id)
+                if (entry and entry[0] > now) or file_id in self._pending:
+                    continue
+                _ = self._submit(executor, session, file_id)
+
+    def _submit(
+        self,
+        executor: ThreadPoolExecutor,
+        session: curl_cffi.Session[curl_cffi.Response],
+        file_id: str,
+    ) -> Future[StorageResolve]:
+        future = executor.submit(self._fetch, session, file_id)
+        self._pending[file_id] = future
+        return future
+
+    def _fetch(
+        self, session: curl_cffi.Session[curl_cffi.Response], file_id: str
+    ) -> StorageResolve:
+        try:
+            res = storage_resolve(session, file_id)
+        except BaseException:
+            with self._lock:
+                _ = self._pending.pop(file_id, None)
+            raise
+
+        with self._lock:
+            now = time.monotonic()
+            self._entries[file_id] = (now + res.get("ttl", 0) * self.TTL_MARGIN, res)
+            self._entries.move_to_end(file_id)
+            self._evict(now)
+            _ = self._pending.pop(file_id, None)
+        return res
+
+    def _evict(self, now: float) -> None:
+        for file_id in [
+            k for k, (expires, _) in self._entries.items() if expires <= now
+        ]:
+            del self._entries[file_id]
+        while len(self._entries) > self.max_entries:
+            _ = self._entries.popitem(last=False)
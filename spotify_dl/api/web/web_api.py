@@ -0,0 +1,56 @@
+from typing import Any, TypedDict, cast
+
+import curl_cffi
+
+API_URL = "https://api.spotify.com/v1"
+
+
+class _PageItem(TypedDict):
+    uri: str
+
+
+class _PlaylistItem(TypedDict):
+    # null for tracks that were removed from spotify
+    track: _PageItem | None
+
+
+class _Page(TypedDict):
+    items: list[Any]  # pyright: ignore[reportExplicitAny]
+    next: str | None
+
+
+def _paginate(
+    session: curl_cffi.Session,
+    url: str,
+    params: dict[str, Any],  # pyright: ignore[reportExplicitAny]
+) -> list[Any]:  # pyright: ignore[reportExplicitAny]
+    items: list[Any] = []  # pyright: ignore[reportExplicitAny]
+    next: str | None = url
+    while next:
+        res = session.get(next, params=params)
+        res.raise_for_status()
+
+        page = cast(_Page, res.json())  # pyright: ignore[reportUnknownMemberType]
+        items += page["items"]
+        # `next` already carries the query
+        next, params = page["next"], {}
+
+    return items
+
+
+def get_playlist_track_uris(session: curl_cffi.Session, playlist_id: str) -> list[str]:
+    items: list[_PlaylistItem] = _paginate(
+        session,
+        f"{API_URL}/playlists/{playlist_id}/tracks",
+        {"limit": 100, "fields": "items(track(uri)),next"},
+    )
+    return [item["track"]["uri"] for item in items if item["track"]]
+
+
+def get_artist_album_uris(session: curl_cffi.Session, artist_id: str) -> list[str]:
+    items: list[_PageItem] = _paginate(
+        session,
+        f"{API_URL}/artists/{artist_id}/albums",
+        {"limit": 50, "include_groups": "album,single"},
+    )
+    return [item["uri"] for item in items]
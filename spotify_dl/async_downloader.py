@@ -0,0 +1,216 @@
+# pyright: reportAny=false, reportUnknownMemberType=false
+
+import asyncio
+import binascii
+import logging
+
+from pathlib import Path
+
+from curl_cffi import AsyncSession, Response
+
+from spotify_dl.api.internal.widevine import WidevineClient
+from spotify_dl.api.web.storage_resolve import StorageResolver
+from spotify_dl.async_stream import (
+    AsyncChunkedStream,
+    AsyncDecryptedSpotifyStream,
+    AsyncEncryptedSpotifyStream,
+)
+from spotify_dl.blob_store import Blob, BlobStore
+from spotify_dl.downloader import SpotifyDownloader, SpotifyDownloadParam
+from spotify_dl.format import AudioCodec
+from spotify_dl.journal import ChunkJournal
+from spotify_dl.key_store import KeyStore
+from spotify_dl.metadata import apply_metadata
+from spotify_dl.track import ReplayGain
+
+
+class AsyncBatchDownloader:
+    """a whole batch on one event loop, every track shares one `AsyncSession`.
+
+    the lookups (key, cdn, metadata) are blocking and go to threads, the transfers
+    never leave the loop
+    """
+
+    logger: logging.Logger = logging.getLogger("spdl:async_downloader")
+    MAX_CONCURRENT: int = 32
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT,
+        max_inflight: int = SpotifyDownloader.MAX_INFLIGHT,
+    ) -> None:
+        self.max_concurrent: int = max(1, max_concurrent)
+        self.max_inflight: int = max(1, max_inflight)
+
+    @staticmethod
+    def supports(param: SpotifyDownloadParam) -> bool:
+        """widevine files need mp4decrypt and playback needs a player, both stay on the worker threads"""
+        return not param.emulate_playback and not isinstance(
+            param.key_provider, WidevineClient
+        )
+
+    def run(self, params: list[SpotifyDownloadParam]) -> int:
+        """blocks until every track is done, returns how many failed"""
+        return asyncio.run(self._run(params))
+
+    async def _run(self, params: list[SpotifyDownloadParam]) -> int:
+        limit = asyncio.Semaphore(self.max_concurrent)
+        async with AsyncSession[Response](
+            impersonate="chrome", max_clients=self.max_concurrent * self.max_inflight
+        ) as session:
+            results = await asyncio.gather(
+                *(self._download(session, limit, param) for param in params),
+                return_exceptions=True,
+            )
+
+        failed = 0
+        for param, result in zip(params, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                self.logger.error(f"Error while downloading {param.output!r}: {result}")
+        return failed
+
+    async def _download(
+        self,
+        session: AsyncSession[Response],
+        limit: asyncio.Semaphore,
+        param: SpotifyDownloadParam,
+    ) -> None:
+        async with limit:
+            track = param.track
+            if not track.format:
+                raise ValueError("Track format is not set")
+            file_id = track.format.file_id
+
+            key = await asyncio.to_thread(self._key, param)
+
+            # already downloaded once, no need to resolve or touch the cdn
+            blob = BlobStore.shared().open(file_id)
+            cdn_urls = (
+                [] if blob else await asyncio.to_thread(self._resolve, param, file_id)
+            )
+            journal = (
+                None if blob else ChunkJournal(file_id, AsyncChunkedStream.CHUNK_SIZE)
+            )
+
+            try:
+                stream = await self._open(
+                    session, file_id, cdn_urls, key, journal, blob
+                )
+            except BaseException:
+                if journal:
+                    journal.release()
+                raise
+
+            self.logger.info(
+                f"Now downloading: {(await asyncio.to_thread(track.get_metadata))['name']}"
+            )
+
+            path = Path(param.output)
+            rg: ReplayGain | None = None
+            finished = False
+            try:
+                path.absolute().parent.mkdir(parents=True, exist_ok=True)
+                ogg = track.format.get_codec() == AudioCodec.OGG_VORBIS
+                if ogg:
+                    _ = stream.seek(SpotifyDownloader.OGG_HEADER_SKIP)
+
+                with open(path, "wb") as f:
+                    while data := await stream.read(stream.CHUNK_SIZE):
+                        _ = f.write(data)
+
+                if ogg and isinstance(stream, AsyncDecryptedSpotifyStream):
+                    rg = (await stream.read_header()).replaygain
+                finished = True
+            finally:
+                await stream.close()
+                stream.drop_cache()
+                if journal:
+                    if finished:
+                        if journal.complete():
+                            BlobStore.shared().put(file_id, journal.part_path)
+                        journal.discard()
+                    else:
+                        journal.release()
+
+            self.logger.info(f"Download finished, saved in: {param.output!r}")
+
+            # without a key the file is still encrypted, same as on the worker threads
+            if isinstance(stream, AsyncDecryptedSpotifyStream):
+                await asyncio.to_thread(
+                    apply_metadata, track, str(path), param.auth, replaygain=rg
+                )
+                self.logger.info(
+                    f"Finished adding metadata, saved in: {param.output!r}"
+                )
+
+    async def _open(
+        self,
+        session: AsyncSession[Response],
+        file_id: str,
+        cdn_urls: list[str],
+        key: bytes | None,
+        journal: ChunkJournal | None,
+        blob: Blob | None,
+    ) -> AsyncDecryptedSpotifyStream | AsyncEncryptedSpotifyStream:
+        """the first cdn that answers, in the order storage-resolve gave them"""
+        urls: list[str | None] = [*cdn_urls] if cdn_urls else [None]
+        for i, url in enumerate(urls):
+            stream = (
+                AsyncDecryptedSpotifyStream(
+                    url,
+                    key,
+                    session=session,
+                    max_inflight=self.max_inflight,
+                    read_ahead=True,
+                    journal=journal,
+                    blob=blob,
+                )
+                if key
+                else AsyncEncryptedSpotifyStream(
+                    url,
+                    session=session,
+                    max_inflight=self.max_inflight,
+                    read_ahead=True,
+                    journal=journal,
+                    blob=blob,
+                )
+            )
+            try:
+                _ = await stream.open()
+                return stream
+            except IOError as e:
+                await stream.close()
+                stream.drop_cache()
+                if i == len(urls) - 1:
+                    if not blob:
+                        # the next attempt gets a fresh set of cdns
+                        StorageResolver.shared().invalidate(file_id)
+                    raise
+                self.logger.warning(f"{url} failed: {e}, trying the next cdn")
+
+        raise AssertionError("unreachable")
+
+    def _key(self, param: SpotifyDownloadParam) -> bytes | None:
+        """the key store first, re-downloads never go back to the key provider"""
+        if not param.key_provider or not param.track.format:
+            return None
+
+        gid, file_id = param.track.format.gid, param.track.format.file_id
+        source = type(param.key_provider).__name__
+        key = KeyStore.shared().get(gid, file_id, source)
+        if key is None:
+            key = param.key_provider.get_audio_key(
+                binascii.unhexlify(gid), binascii.unhexlify(file_id)
+            )
+            if key:
+                KeyStore.shared().put(gid, file_id, source, key)
+        return key
+
+    def _resolve(self, param: SpotifyDownloadParam, file_id: str) -> list[str]:
+        res = StorageResolver.shared().resolve(param.auth.session, file_id)
+        cdn_urls: list[str] = res.get("cdnurl", [])
+        if not cdn_urls:
+            StorageResolver.shared().invalidate(file_id)
+            raise ValueError(f"No cdn url for {file_id}")
+        return cdn_urls
@@ -0,0 +1,542 @@
+# pyright: reportAny=false, reportUnknownMemberType=false
+import asyncio
+import io
+import math
+import struct
+import time
+import weakref
+
+from collections.abc import Buffer
+from typing import Protocol, Self, override
+
+from curl_cffi import AsyncSession, Response
+from curl_cffi.requests.exceptions import ConnectionError, Timeout
+
+from spotify_dl.blob_store import Blob
+from spotify_dl.chunk_cache import ChunkCache
+from spotify_dl.journal import ChunkJournal
+from spotify_dl.stream import (
+    ChunkedStream,
+    CTRDecryptor,
+    DecryptedSpotifyStream,
+    ReadAhead,
+    copy_views,
+    join_views,
+    parse_content_range,
+)
+from spotify_dl.track import ReplayGain, TrackHeader
+
+
+class AsyncChunkedBytesStreamProtocol(Protocol):
+    size: int
+    CHUNK_SIZE: int
+
+    async def read(self, size: int = -1) -> bytes: ...
+    async def readinto(self, buffer: Buffer) -> int: ...
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int: ...
+    def tell(self) -> int: ...
+    async def close(self) -> None: ...
+    async def request_chunk(self, chunk_index: int) -> bytes: ...
+
+
+async def _chunk_views(
+    source: AsyncChunkedBytesStreamProtocol, start: int, length: int
+) -> list[memoryview]:
+    """views into the cached chunks covering [start, start + length)"""
+    end = start + length
+    offset = start
+    views: list[memoryview] = []
+
+    while offset < end:
+        chunk_index = offset // source.CHUNK_SIZE
+        chunk = memoryview(await source.request_chunk(chunk_index))
+
+        chunk_start = offset - chunk_index * source.CHUNK_SIZE
+        chunk_end = min(len(chunk), chunk_start + end - offset)
+        if chunk_end <= chunk_start:
+            break
+
+        views.append(chunk[chunk_start:chunk_end])
+        offset += chunk_end - chunk_start
+
+    return views
+
+
+class AsyncChunkedStream(AsyncChunkedBytesStreamProtocol):
+    """`ChunkedStream` on an event loop, one session can be shared by any number of streams"""
+
+    CHUNK_SIZE: int = ChunkedStream.CHUNK_SIZE
+    PINNED_CHUNKS: frozenset[int] = frozenset()
+
+    # same policy as the urllib3 Retry on the sync stream
+    MAX_RETRIES: int = 5
+    RETRY_STATUS: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+    BACKOFF_FACTOR: float = 1
+
+    def __init__(
+        self,
+        url: str | None,
+        session: AsyncSession[Response] | None = None,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        reorder_buffer: int | None = None,
+        read_ahead: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+    ) -> None:
+        if url is None and blob is None:
+            raise ValueError("Either url or blob is required")
+
+        self.url: str | None = url
+        self.blob: Blob | None = blob
+        self.journal: ChunkJournal | None = journal
+
+        self.max_inflight: int = max(1, max_inflight)
+        self._owns_session: bool = session is None
+        self.session: AsyncSession[Response] = session or AsyncSession(
+            impersonate="chrome", max_clients=max(10, self.max_inflight)
+        )
+
+        self.cache: ChunkCache = cache or ChunkCache.shared()
+        self._cache_owner: int = self.cache.new_owner()
+        _ = weakref.finalize(self, self.cache.drop, self._cache_owner)
+
+        self.reorder_buffer: int = max(
+            reorder_buffer or 2 * self.max_inflight, self.max_inflight
+        )
+        self._pending: dict[int, asyncio.Task[bytes]] = {}
+        self._prefetch: bool = self.max_inflight > 1 or read_ahead
+        self._inflight: asyncio.Semaphore = asyncio.Semaphore(self.max_inflight)
+        self.read_ahead: ReadAhead | None = (
+            ReadAhead(self.CHUNK_SIZE, max_window=self.reorder_buffer)
+            if read_ahead
+            else None
+        )
+
+        self.size: int = 0
+        self.total_chunks: int = 0
+        self.pos: int = 0
+        self.opened: bool = False
+        self.closed: bool = False
+
+    async def open(self) -> Self:
+        if self.opened:
+            return self
+
+        head: bytes | None = None
+        if self.blob:
+            self.size = self.blob.size
+        else:
+            # the size comes with the first chunk, which is kept instead of
+            # being fetched a second time
+            res = await self._get(0, self.CHUNK_SIZE - 1)
+            start, _, self.size = parse_content_range(
+                res.headers.get("Content-Range") or ""
+            )
+            head = res.content
+            if start != 0 or len(head) != min(self.CHUNK_SIZE, self.size):
+                raise IOError(
+                    f"Expected the first {min(self.CHUNK_SIZE, self.size)} bytes, got {len(head)} at {start}"
+                )
+        self.total_chunks = math.ceil(self.size / self.CHUNK_SIZE)
+
+        if self.journal:
+            await asyncio.to_thread(self.journal.open, self.size)
+        if head is not None:
+            if self.journal:
+                await asyncio.to_thread(self.journal.write, 0, head)
+            self._store(0, self._process_chunk(0, head))
+
+        self.opened = True
+        return self
+
+    async def __aenter__(self) -> Self:
+        return await self.open()
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    @override
+    async def request_chunk(self, chunk_index: int) -> bytes:
+        if not (0 <= chunk_index < self.total_chunks):
+            raise IndexError(f"Chunk index {chunk_index} out of range")
+
+        data = self.cache.get(self._cache_owner, chunk_index)
+        if data is not None:
+            if self._prefetch and self.read_ahead:
+                ahead = self.read_ahead.access(chunk_index, waited=False)
+                if ahead > 0:
+                    self._schedule(chunk_index, ahead)
+            return data
+
+        if not self._prefetch:
+            data = self._process_chunk(
+                chunk_index, await self._fetch_chunk(chunk_index)
+            )
+            self._store(chunk_index, data)
+            return data
+
+        task = self._pending.get(chunk_index)
+        waited = task is None or not task.done()
+        ahead = (
+            self.read_ahead.access(chunk_index, waited)
+            if self.read_ahead
+            else self.reorder_buffer - 1
+        )
+        self._schedule(chunk_index, ahead)
+        run = [await self._pending.pop(chunk_index)]
+
+        # chunks that already arrived right behind this one are processed in one pass
+        while (
+            (task := self._pending.get(chunk_index + len(run))) is not None
+            and task.done()
+            and not task.cancelled()
+            and task.exception() is None
+        ):
+            run.append(self._pending.pop(chunk_index + len(run)).result())
+
+        processed = self._process_run(chunk_index, run)
+        for idx, data in enumerate(processed, chunk_index):
+            self._store(idx, data)
+
+        return processed[0]
+
+    def _store(self, chunk_index: int, data: bytes) -> None:
+        self.cache.put(
+            self._cache_owner,
+            chunk_index,
+            data,
+            pin=chunk_index in self.PINNED_CHUNKS,
+        )
+
+    def _process_chunk(self, chunk_index: int, data: bytes) -> bytes:
+        return data
+
+    def _process_run(self, first_chunk: int, chunks: list[bytes]) -> list[bytes]:
+        return [
+            self._process_chunk(chunk_index, data)
+            for chunk_index, data in enumerate(chunks, first_chunk)
+        ]
+
+    async def _get(self, start: int, end: int) -> Response:
+        assert self.url is not None
+
+        attempt = 0
+        while True:
+            try:
+                res = await self.session.get(
+                    self.url, headers={"Range": f"bytes={start}-{end}"}
+                )
+            except (ConnectionError, Timeout):
+                if attempt >= self.MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self.BACKOFF_FACTOR * 2**attempt)
+                attempt += 1
+                continue
+
+            if res.status_code not in self.RETRY_STATUS or attempt >= self.MAX_RETRIES:
+                break
+
+            retry_after = res.headers.get("Retry-After") or ""
+            await asyncio.sleep(
+                float(retry_after)
+                if retry_after.isdigit()
+                else self.BACKOFF_FACTOR * 2**attempt
+            )
+            attempt += 1
+
+        res.raise_for_status()
+        return res
+
+    async def _fetch_chunk(self, chunk_index: int) -> bytes:
+        start = chunk_index * self.CHUNK_SIZE
+        end = min(start + self.CHUNK_SIZE, self.size) - 1
+
+        if self.blob:
+            return await asyncio.to_thread(self.blob.read, start, end - start + 1)
+        if self.journal and self.journal.has(chunk_index):
+            data = await asyncio.to_thread(self.journal.read, chunk_index)
+            if data is not None:
+                return data
+
+        started = time.monotonic()
+        res = await self._get(start, end)
+        if self.read_ahead:
+            self.read_ahead.record_fetch(time.monotonic() - started)
+
+        data = res.content
+        if self.journal:
+            # never persist something that isn't exactly the chunk we asked for
+            got = parse_content_range(res.headers.get("Content-Range") or "")
+            if got != (start, end, self.size) or len(data) != end - start + 1:
+                raise IOError(
+                    f"Expected bytes {start}-{end}/{self.size}, got {got} with {len(data)} bytes"
+                )
+            await asyncio.to_thread(self.journal.write, chunk_index, data)
+
+        return data
+
+    async def _fetch_limited(self, chunk_index: int) -> bytes:
+        async with self._inflight:
+            return await self._fetch_chunk(chunk_index)
+
+    def _schedule(self, chunk_index: int, ahead: int) -> None:
+        keep_end = chunk_index + self.reorder_buffer
+        window_end = min(chunk_index + 1 + ahead, keep_end, self.total_chunks)
+
+        # the reader moved away (seek), drop whatever it won't ask for anymore
+        for idx in [i for i in self._pending if not chunk_index <= i < keep_end]:
+            self._discard(self._pending.pop(idx))
+
+        for idx in range(chunk_index, window_end):
+            if idx in self._pending or self.cache.contains(self._cache_owner, idx):
+                continue
+            self._pending[idx] = asyncio.ensure_future(self._fetch_limited(idx))
+
+    @staticmethod
+    def _discard(task: asyncio.Task[bytes]) -> None:
+        if task.done():
+            if not task.cancelled():
+                # nobody will look at it, keep asyncio from complaining
+                _ = task.exception()
+        else:
+            _ = task.cancel()
+
+    @override
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            new_pos = offset
+        elif whence == io.SEEK_CUR:
+            new_pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            new_pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if not (0 <= new_pos <= self.size):
+            raise ValueError(f"Seek out of bounds: {new_pos}")
+        self.pos = new_pos
+        return self.pos
+
+    @override
+    def tell(self) -> int:
+        return self.pos
+
+    def _check_readable(self) -> None:
+        if self.closed:
+            raise IOError("I/O operation on closed file.")
+        if not self.opened:
+            raise IOError("Stream is not open, await `open()` first")
+
+    @override
+    async def read(self, size: int = -1) -> bytes:
+        self._check_readable()
+
+        if size < 0:
+            size = self.size - self.pos
+
+        if self.pos >= self.size or size == 0:
+            return b""
+
+        to_read = min(size, self.size - self.pos)
+        data = join_views(await _chunk_views(self, self.pos, to_read))
+
+        self.pos += len(data)
+        return data
+
+    @override
+    async def readinto(self, buffer: Buffer) -> int:
+        self._check_readable()
+
+        to_read = min(memoryview(buffer).nbytes, self.size - self.pos)
+        if to_read <= 0:
+            return 0
+
+        read = copy_views(await _chunk_views(self, self.pos, to_read), buffer)
+
+        self.pos += read
+        return read
+
+    @override
+    async def close(self) -> None:
+        if not self.closed:
+            for task in self._pending.values():
+                self._discard(task)
+            self._pending.clear()
+            self._prefetch = False
+            if self._owns_session:
+                await self.session.close()
+            if self.journal:
+                self.journal.close()
+            if self.blob:
+                self.blob.close()
+            self.cache.drop(self._cache_owner, keep_pinned=True)
+            self.closed = True
+
+    def drop_cache(self) -> None:
+        """frees the pinned chunks as well, once nothing is going to read the header anymore"""
+        self.cache.drop(self._cache_owner)
+
+
+class AsyncEncryptedStream(AsyncChunkedStream):
+    def __init__(
+        self,
+        url: str | None,
+        key: bytes,
+        iv: int,
+        session: AsyncSession[Response] | None = None,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        read_ahead: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+    ) -> None:
+        super().__init__(
+            url,
+            session,
+            cache,
+            max_inflight,
+            read_ahead=read_ahead,
+            journal=journal,
+            blob=blob,
+        )
+
+        self.key: bytes = key
+        self.iv: int = iv
+        # only touched from the event loop, decrypting a chunk is cheap next to fetching it
+        self.decryptor: CTRDecryptor | None = (
+            CTRDecryptor(key, iv, self.CHUNK_SIZE) if key else None
+        )
+
+    def decrypt_chunk(self, chunk: int, encrypted: bytes) -> bytes:
+        if not self.decryptor:
+            return encrypted
+
+        return self.decryptor.decrypt(chunk, encrypted)
+
+    @override
+    def _process_chunk(self, chunk_index: int, data: bytes) -> bytes:
+        # only the plaintext is cached
+        return self.decrypt_chunk(chunk_index, data)
+
+    @override
+    def _process_run(self, first_chunk: int, chunks: list[bytes]) -> list[bytes]:
+        if not self.decryptor:
+            return chunks
+
+        return self.decryptor.decrypt_run(first_chunk, chunks)
+
+
+class AsyncDecryptedSpotifyStream(AsyncEncryptedStream):
+    AUDIO_IV: int = DecryptedSpotifyStream.AUDIO_IV
+    REPLAYGAIN_OFFSET: int = DecryptedSpotifyStream.REPLAYGAIN_OFFSET
+    PINNED_CHUNKS: frozenset[int] = DecryptedSpotifyStream.PINNED_CHUNKS
+
+    def __init__(
+        self,
+        url: str | None,
+        key: bytes,
+        session: AsyncSession[Response] | None = None,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        read_ahead: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+    ) -> None:
+        super().__init__(
+            url,
+            key,
+            self.AUDIO_IV,
+            session=session,
+            cache=cache,
+            max_inflight=max_inflight,
+            read_ahead=read_ahead,
+            journal=journal,
+            blob=blob,
+        )
+
+    async def _read_rg(self) -> ReplayGain:
+        track_gain_db, track_peak, album_gain_db, album_peak = struct.unpack_from(
+            "<ffff", await self.request_chunk(0), self.REPLAYGAIN_OFFSET
+        )
+        return ReplayGain(
+            track_gain_db=track_gain_db,
+            track_peak=track_peak,
+            album_gain_db=album_gain_db,
+            album_peak=album_peak,
+        )
+
+    async def read_header(self) -> TrackHeader:
+        return TrackHeader(
+            replaygain=await self._read_rg(),
+        )
+
+
+class AsyncEncryptedSpotifyStream(AsyncChunkedStream):
+    pass
+
+
+class AsyncChunkedStreamReader:
+    def __init__(
+        self, source: AsyncChunkedBytesStreamProtocol, offset: int = 0
+    ) -> None:
+        if not (0 <= offset <= source.size):
+            raise ValueError(f"Invalid offset: {offset}")
+        self.source: AsyncChunkedBytesStreamProtocol = source
+        self.offset: int = offset
+        self.pos: int = 0
+        self.closed: bool = False
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            new_pos = offset
+        elif whence == io.SEEK_CUR:
+            new_pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            new_pos = self.source.size - self.offset + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if not (0 <= new_pos <= self.source.size - self.offset):
+            raise ValueError(f"Seek out of bounds: {new_pos}")
+        self.pos = new_pos
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.closed:
+            raise IOError("I/O operation on closed reader")
+
+        logical_end = self.source.size - self.offset
+        if size < 0 or self.pos + size > logical_end:
+            size = logical_end - self.pos
+
+        if self.pos >= logical_end or size == 0:
+            return b""
+
+        data = join_views(await _chunk_views(self.source, self.offset + self.pos, size))
+
+        self.pos += len(data)
+        return data
+
+    async def readinto(self, buffer: Buffer) -> int:
+        if self.closed:
+            raise IOError("I/O operation on closed reader")
+
+        to_read = min(
+            memoryview(buffer).nbytes, self.source.size - self.offset - self.pos
+        )
+        if to_read <= 0:
+            return 0
+
+        read = copy_views(
+            await _chunk_views(self.source, self.offset + self.pos, to_read), buffer
+        )
+
+        self.pos += read
+        return read
+
+    def close(self) -> None:
+        self.closed = True
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+
+from pathlib import Path
+from typing import BinaryIO, ClassVar
+
+
+class Blob:
+    """read-only handle on a stored file"""
+
+    def __init__(self, file_id: str, path: Path) -> None:
+        self.file_id: str = file_id
+        self.path: Path = path
+        self._file: BinaryIO = path.open("rb")
+        self.size: int = os.fstat(self._file.fileno()).st_size
+        self._lock: threading.Lock = threading.Lock()
+
+    def read(self, offset: int, length: int) -> bytes:
+        with self._lock:
+            _ = self._file.seek(offset)
+            data = self._file.read(length)
+
+        if len(data) != length:
+            raise IOError(
+                f"Blob {self.file_id} is truncated, wanted {length} bytes at {offset}, got {len(data)}"
+            )
+
+        return data
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class BlobStore:
+    """encrypted cdn files keyed by file_id, least recently used are evicted past the budget"""
+
+    logger: logging.Logger = logging.getLogger("spdl:blob_store")
+    BLOB_DIR: Path = Path(".spcache") / "blobs"
+    DEFAULT_BUDGET: int = 4 * 1024 * 1024 * 1024
+
+    _shared: ClassVar["BlobStore | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self, directory: Path | None = None, budget: int = DEFAULT_BUDGET
+    ) -> None:
+        self.directory: Path = directory or BlobStore.BLOB_DIR
+        self.budget: int = budget
+        self._lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "BlobStore":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def path(self, file_id: str) -> Path:
+        return self.directory / file_id
+
+    def has(self, file_id: str) -> bool:
+        return self.path(file_id).is_file()
+
+    def open(self, file_id: str) -> Blob | None:
+        path = self.path(file_id)
+        try:
+            # mtime doubles as the last access time for eviction
+            os.utime(path)
+            return Blob(file_id, path)
+        except FileNotFoundError:
+            return None
+
+    def put(self, file_id: str, source: Path) -> None:
+        """moves `source` into the store"""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            try:
+                os.replace(str(source), str(self.path(file_id)))
+            except FileNotFoundError:
+                # another writer of the same file got here first
+                if not self.has(file_id):
+                    raise
+                self.logger.debug(f"{file_id} is already stored")
+                return
+            self.logger.debug(f"Stored {file_id}")
+            self._evict(keep=file_id)
+
+    def remove(self, file_id: str) -> None:
+        with self._lock:
+            self.path(file_id).unlink(missing_ok=True)
+
+    def usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self) -> list[tuple[Path, int, float]]:
+        if not self.directory.exists():
+            return []
+
+        entries: list[tuple[Path, int, float]] = []
+        for path in self.directory.iterdir():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+
+        return entries
+
+    def _evict(self, keep: str) -> None:
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+
+        for path, entry_size, _ in entries:
+            if size <= self.budget:
+                break
+            if path.name == keep:
+                continue
+
+            try:
+                path.unlink()
+            except OSError as e:
+                # still open somewhere (windows), try again next time
+                self.logger.debug(f"Could not evict {path.name}: {e}")
+                continue
+
+            size -= entry_size
+            self.logger.debug(f"Evicted {path.name} ({entry_size} bytes)")
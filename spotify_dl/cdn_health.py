@@ -0,0 +1,99 @@
+import logging
+import threading
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import ClassVar
+from urllib.parse import urlparse
+
+
+@dataclass
+class HostHealth:
+    # bytes per second per request
+    throughput: float | None = None
+    successes: int = 0
+    failures: int = 0
+    # failures since the last success
+    recent_failures: int = 0
+
+
+class CdnHealth:
+    """per-host throughput and failures, shared by every stream so it carries over between tracks"""
+
+    logger: logging.Logger = logging.getLogger("spdl:cdn_health")
+    EWMA_WEIGHT: float = 0.3
+    # what a host nobody has talked to yet is assumed to do, keeps new hosts in the race
+    DEFAULT_THROUGHPUT: float = 1024 * 1024
+
+    _shared: ClassVar["CdnHealth | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self) -> None:
+        self._hosts: dict[str, HostHealth] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "CdnHealth":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).hostname or url
+
+    def record(self, url: str, size: int, elapsed: float) -> None:
+        if elapsed <= 0:
+            return
+
+        with self._lock:
+            health = self._hosts.setdefault(self.host(url), HostHealth())
+            throughput = size / elapsed
+            health.throughput = (
+                throughput
+                if health.throughput is None
+                else health.throughput
+                + self.EWMA_WEIGHT * (throughput - health.throughput)
+            )
+            health.successes += 1
+            health.recent_failures = 0
+
+    def record_failure(self, url: str) -> None:
+        with self._lock:
+            health = self._hosts.setdefault(self.host(url), HostHealth())
+            health.failures += 1
+            health.recent_failures += 1
+
+    def get(self, url: str) -> HostHealth | None:
+        with self._lock:
+            h = self._hosts.get(self.host(url))
+            return (
+                HostHealth(h.throughput, h.successes, h.failures, h.recent_failures)
+                if h
+                else None
+            )
+
+    def score(self, url: str) -> float:
+        with self._lock:
+            health = self._hosts.get(self.host(url)) or HostHealth()
+            throughput = (
+                health.throughput
+                if health.throughput is not None
+                else self.DEFAULT_THROUGHPUT
+            )
+            # every failure in a row halves it
+            return throughput / 2**health.recent_failures
+
+    def rank(self, urls: Iterable[str]) -> list[str]:
+        """best first, ties keep the given order"""
+        return sorted(urls, key=self.score, reverse=True)
+
+    def stats(self) -> dict[str, HostHealth]:
+        with self._lock:
+            return {
+                host: HostHealth(
+                    h.throughput, h.successes, h.failures, h.recent_failures
+                )
+                for host, h in self._hosts.items()
+            }
@@ -0,0 +1,147 @@
+import itertools
+import logging
+import threading
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import ClassVar
+
+
+@dataclass
+class ChunkCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    pinned_size: int
+    budget: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total != 0 else 0
+
+
+class ChunkCache:
+    logger: logging.Logger = logging.getLogger("spdl:chunk_cache")
+    DEFAULT_BUDGET: int = 128 * 1024 * 1024
+
+    _shared: ClassVar["ChunkCache | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, budget: int = DEFAULT_BUDGET) -> None:
+        self.budget: int = budget
+        self.size: int = 0
+        self.pinned_size: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        # (owner, chunk_index) -> data, least recently used first
+        self._entries: OrderedDict[tuple[int, int], bytes] = OrderedDict()
+        # pinned entries are never evicted, only dropped with their owner
+        self._pinned: dict[tuple[int, int], bytes] = {}
+        self._by_owner: dict[int, set[int]] = {}
+
+        self._owner_ids: itertools.count[int] = itertools.count()
+        self._lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "ChunkCache":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def new_owner(self) -> int:
+        with self._lock:
+            owner = next(self._owner_ids)
+            self._by_owner[owner] = set()
+            return owner
+
+    def contains(self, owner: int, chunk_index: int) -> bool:
+        key = (owner, chunk_index)
+        with self._lock:
+            return key in self._entries or key in self._pinned
+
+    def get(self, owner: int, chunk_index: int) -> bytes | None:
+        key = (owner, chunk_index)
+        with self._lock:
+            if key in self._pinned:
+                self.hits += 1
+                return self._pinned[key]
+
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, owner: int, chunk_index: int, data: bytes, pin: bool = False) -> None:
+        key = (owner, chunk_index)
+        with self._lock:
+            self._remove(key)
+
+            if pin:
+                self._pinned[key] = data
+                self.pinned_size += len(data)
+            else:
+                self._entries[key] = data
+            self.size += len(data)
+            self._by_owner.setdefault(owner, set()).add(chunk_index)
+
+            self._evict()
+
+    def drop(self, owner: int, keep_pinned: bool = False) -> None:
+        with self._lock:
+            chunks = self._by_owner.get(owner, set())
+            for chunk_index in list(chunks):
+                key = (owner, chunk_index)
+                if keep_pinned and key in self._pinned:
+                    continue
+                self._remove(key)
+
+            if not keep_pinned:
+                _ = self._by_owner.pop(owner, None)
+
+    def stats(self) -> ChunkCacheStats:
+        with self._lock:
+            return ChunkCacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=self.size,
+                pinned_size=self.pinned_size,
+                budget=self.budget,
+            )
+
+    def _remove(self, key: tuple[int, int]) -> None:
+        data = self._entries.pop(key, None)
+        if data is None:
+            data = self._pinned.pop(key, None)
+            if data is None:
+                return
+            self.pinned_size -= len(data)
+
+        self.size -= len(data)
+        chunks = self._by_owner.get(key[0])
+        if chunks is not None:
+            chunks.discard(key[1])
+
+    def _evict(self) -> None:
+        while self.size > self.budget and self._entries:
+            key, data = self._entries.popitem(last=False)
+            self.size -= len(data)
+            self.evictions += 1
+            chunks = self._by_owner.get(key[0])
+            if chunks is not None:
+                chunks.discard(key[1])
+
+        if self.size > self.budget:
+            self.logger.warning(
+                f"Pinned chunks ({self.pinned_size} bytes) exceed the cache budget ({self.budget} bytes)"
+            )
@@ -249,15 +249,17 @@ class CLI:
         try:
             active = self.dm.get_active()
             queued = self.dm.get_queued()
+            concurrency = self.dm.status()
         except Exception:
-            active, queued = [], []
+            active, queued, concurrency = [], [], "?"
+
         status: list[str] = []
         for dl, _ in active:
             try:
                 status.append(f"{dl.get_percentage()*100:.0f}%")
             except Exception:
                 status.append("??%")
-        return f"{len(active)}/{len(queued)}{', ' if status else ''}{'|'.join(status)}"
+        return f"{len(active)}/{len(queued)} {concurrency}{', ' if status else ''}{'|'.join(status)}"
 
     def _status_updater(self) -> None:
         interval = 0.2
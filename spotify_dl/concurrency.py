@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+from spotify_dl.utils.http_pool import HttpPoolStats
+
+
+class ConcurrencyController:
+    """hill climbs the number of download workers on aggregate throughput, backs off on throttling"""
+
+    logger: logging.Logger = logging.getLogger("spdl:concurrency")
+    INTERVAL: float = 10.0
+    # an extra worker has to buy at least this much more throughput to stay
+    MIN_GAIN: float = 0.1
+    # intervals to sit still after backing off before probing again
+    HOLD_INTERVALS: int = 3
+    KEY_LATENCY_LIMIT: float = 3.0
+    EWMA_WEIGHT: float = 0.3
+
+    def __init__(self, initial: int = 2, minimum: int = 1, maximum: int = 8) -> None:
+        self.minimum: int = max(1, minimum)
+        self.maximum: int = max(self.minimum, maximum)
+        self.concurrency: int = min(max(initial, self.minimum), self.maximum)
+        self.reason: str = "initial"
+
+        # bytes per second over the last interval, all downloads together
+        self.throughput: float = 0
+        self.track_throughput: float | None = None
+        self.key_latency: float | None = None
+
+        self._baseline: float | None = None
+        self._probing: bool = False
+        self._hold: int = 0
+        self._last: tuple[float, HttpPoolStats] | None = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def _ewma(self, old: float | None, new: float) -> float:
+        if old is None:
+            return new
+        return old + self.EWMA_WEIGHT * (new - old)
+
+    def record_track(self, size: int, elapsed: float) -> None:
+        if elapsed <= 0:
+            return
+        with self._lock:
+            self.track_throughput = self._ewma(self.track_throughput, size / elapsed)
+
+    def record_key_latency(self, elapsed: float) -> None:
+        with self._lock:
+            self.key_latency = self._ewma(self.key_latency, elapsed)
+
+    def update(self, stats: HttpPoolStats, busy: bool) -> int:
+        """called every `INTERVAL`, returns the concurrency to run at"""
+        with self._lock:
+            now = time.monotonic()
+            last, self._last = self._last, (now, stats)
+            if last is None or now <= last[0]:
+                return self.concurrency
+
+            then, prev = last
+            self.throughput = (stats.bytes_received - prev.bytes_received) / (
+                now - then
+            )
+            errors = (stats.throttled - prev.throttled) + (
+                stats.server_errors - prev.server_errors
+            )
+
+            if errors > 0:
+                self._probing = False
+                self._hold = self.HOLD_INTERVALS
+                self._set(
+                    self.concurrency // 2, f"backoff, {errors} throttled/5xx responses"
+                )
+            elif (
+                self.key_latency is not None
+                and self.key_latency > self.KEY_LATENCY_LIMIT
+                and self._hold == 0
+            ):
+                # the key provider is shared, more workers only queue up on it
+                self._probing = False
+                self._hold = self.HOLD_INTERVALS
+                self._set(self.concurrency - 1, f"key latency {self.key_latency:.1f}s")
+            elif not busy:
+                # fewer tracks than workers, the numbers say nothing about the limit
+                self._probing = False
+            elif self._probing:
+                self._probing = False
+                gain = self.throughput / self._baseline - 1 if self._baseline else 1.0
+                if gain < self.MIN_GAIN:
+                    self._hold = self.HOLD_INTERVALS
+                    self._set(self.concurrency - 1, f"no gain at {self.concurrency}")
+                else:
+                    self.reason = f"{gain:+.0%} at {self.concurrency}"
+            elif self._hold > 0:
+                self._hold -= 1
+            elif self.concurrency < self.maximum:
+                self._baseline = self.throughput
+                self._probing = True
+                self._set(self.concurrency + 1, "probing")
+
+            return self.concurrency
+
+    def _set(self, concurrency: int, reason: str) -> None:
+        concurrency = min(max(concurrency, self.minimum), self.maximum)
+        if concurrency != self.concurrency:
+            self.logger.info(
+                f"Concurrency {self.concurrency} -> {concurrency} ({reason}), {self.throughput / 1024:.0f} KiB/s"
+            )
+        self.concurrency = concurrency
+        self.reason = reason
@@ -0,0 +1,103 @@
+import heapq
+import itertools
+import math
+import time
+
+from dataclasses import dataclass, field
+from enum import IntEnum
+from queue import Queue
+from typing import Protocol, override
+
+
+class DownloadPriority(IntEnum):
+    # lower goes first
+    INTERACTIVE = 0
+    DOWNLOAD = 1
+    BATCH = 2
+
+
+class Prioritized(Protocol):
+    priority: DownloadPriority
+    # time.monotonic() it should have started by, earlier goes first within a priority
+    deadline: float | None
+
+
+@dataclass
+class WaitStats:
+    count: int = 0
+    total: float = 0
+    max: float = 0
+    missed_deadlines: int = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count != 0 else 0
+
+
+@dataclass(order=True)
+class _Entry[T]:
+    priority: int
+    deadline: float
+    seq: int
+    enqueued: float = field(compare=False)
+    item: T = field(compare=False)
+
+
+class DownloadQueue[T: Prioritized](Queue[T]):
+    """`Queue` ordered by priority, then deadline, then arrival"""
+
+    queue: list[_Entry[T]]  # pyright: ignore[reportIncompatibleVariableOverride]
+
+    def __init__(self, maxsize: int = 0) -> None:
+        self._seq: itertools.count[int] = itertools.count()
+        self._waits: dict[DownloadPriority, WaitStats] = {
+            priority: WaitStats() for priority in DownloadPriority
+        }
+        super().__init__(maxsize)
+
+    @override
+    def _init(self, maxsize: int) -> None:
+        self.queue = []
+
+    @override
+    def _qsize(self) -> int:
+        return len(self.queue)
+
+    @override
+    def _put(self, item: T) -> None:
+        heapq.heappush(
+            self.queue,
+            _Entry(
+                item.priority,
+                item.deadline if item.deadline is not None else math.inf,
+                next(self._seq),
+                time.monotonic(),
+                item,
+            ),
+        )
+
+    @override
+    def _get(self) -> T:
+        entry = heapq.heappop(self.queue)
+
+        now = time.monotonic()
+        waited = now - entry.enqueued
+        stats = self._waits[entry.item.priority]
+        stats.count += 1
+        stats.total += waited
+        stats.max = max(stats.max, waited)
+        if entry.deadline < now:
+            stats.missed_deadlines += 1
+
+        return entry.item
+
+    def items(self) -> list[T]:
+        with self.mutex:
+            return [entry.item for entry in sorted(self.queue)]
+
+    def wait_stats(self) -> dict[DownloadPriority, WaitStats]:
+        with self.mutex:
+            return {
+                priority: WaitStats(s.count, s.total, s.max, s.missed_deadlines)
+                for priority, s in self._waits.items()
+            }
@@ -10,37 +10,52 @@ import subprocess
 import threading
 import time
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass
-from queue import Queue
+from queue import Empty, Queue
 import traceback
 from typing import Any, Callable
 import uuid
-from requests import HTTPError
 
 from spotify_dl.api.internal.widevine import WidevineClient
-from spotify_dl.api.web.storage_resolve import storage_resolve
+from spotify_dl.api.web.storage_resolve import StorageResolver
 from spotify_dl.key_provider import KeyProvider
+from spotify_dl.key_store import KeyStore
 from spotify_dl.auth.web_auth import SpotifyAuthPKCE
+from spotify_dl.blob_store import Blob, BlobStore
+from spotify_dl.cdn_health import CdnHealth
+from spotify_dl.concurrency import ConcurrencyController
+from spotify_dl.download_queue import DownloadPriority, DownloadQueue, WaitStats
+from spotify_dl.journal import ChunkJournal
 from spotify_dl.metadata import apply_metadata
+from spotify_dl.metadata_cache import MetadataCache
 from spotify_dl.stream import (
+    ChunkedStream,
     DecryptedSpotifyStream,
     EncryptedSpotifyStream,
 )
 from spotify_dl.track import ReplayGain, Track
 from spotify_dl.format import AudioCodec, AudioFormat
+from spotify_dl.utils.http_pool import HttpPool
+from spotify_dl.utils.ring_buffer import RingBuffer, RingReader
 
 
 class SpotifyDownloader:
     logger: logging.Logger = logging.getLogger("spdl:downloader")
     OGG_HEADER_SKIP: int = 167
-    _KEY_CACHE: dict[str, bytes] = {}
+    MAX_INFLIGHT: int = 4
+    # for the lookups a single downloader runs side by side while it's set up
+    _io: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=8, thread_name_prefix="downloader_io"
+    )
 
     def __init__(
         self,
         track: Track,
         auth: SpotifyAuthPKCE,
         key_provider: KeyProvider | None,
+        max_inflight: int = MAX_INFLIGHT,
     ) -> None:
         self.track: Track = track
 
@@ -49,52 +64,168 @@ class SpotifyDownloader:
         self.format: AudioFormat = track.format
         self.auth: SpotifyAuthPKCE = auth
         self.key_provider: KeyProvider | None = key_provider
+        self.max_inflight: int = max_inflight
 
-        cdn_urls, fileid = self._resolve(track.format.file_id)
-
-        self.key: bytes | None = SpotifyDownloader._KEY_CACHE.get(track.format.gid)
-        if self.key_provider:
-            if self.key is None:
-                self.key = self.key_provider.get_audio_key(
-                    binascii.unhexlify(track.format.gid),
-                    (
-                        binascii.unhexlify(track.format.file_id)
-                        if not isinstance(self.key_provider, WidevineClient)
-                        else fileid.encode()
-                    ),
-                )
-                self.logger.info(f"key: {self.key!r}")
-                if self.key:
-                    SpotifyDownloader._KEY_CACHE[track.format.gid] = self.key
+        # none of these depend on each other, the key and the metadata are
+        # fetched while the cdn is resolved
+        duration = self._io.submit(lambda: track.get_metadata_internal(auth).duration)
+
+        # re-downloads and re-decrypts never go back to the key provider
+        self.key: bytes | None = (
+            KeyStore.shared().get(
+                track.format.gid, track.format.file_id, self._key_source()
+            )
+            if self.key_provider
+            else None
+        )
+        self.key_latency: float | None = None
+        # widevine wants the fileid storage-resolve hands out
+        needs_fileid = isinstance(self.key_provider, WidevineClient)
+        key: Future[bytes | None] | None = None
+        if self.key_provider and self.key is None and not needs_fileid:
+            key = self._io.submit(self._fetch_key, None)
+
+        # already downloaded once, no need to resolve or touch the cdn
+        self.blob: Blob | None = BlobStore.shared().open(track.format.file_id)
+
+        cdn_urls: list[str] = []
+        fileid: str | None = None
+        if not self.blob:
+            cdn_urls, fileid = self._resolve(track.format.file_id)
+        elif needs_fileid and self.key is None:
+            _, fileid = self._resolve(track.format.file_id)
+
+        if key:
+            self.key = key.result()
+        elif self.key_provider and self.key is None:
+            self.key = self._fetch_key(fileid)
+
+        # survives a crash or ctrl-c, the next attempt only fetches what's missing
+        self.journal: ChunkJournal = ChunkJournal(
+            track.format.file_id, ChunkedStream.CHUNK_SIZE
+        )
 
+        # the stream races the cdns for the first chunk and moves to
+        # another one if the one it picked slows down or fails
         self.stream: DecryptedSpotifyStream | EncryptedSpotifyStream
-        for cdn in cdn_urls:
+        try:
+            self.stream = self._open_stream(cdn_urls, max_inflight)
+        except BaseException as e:
+            if isinstance(e, IOError):
+                # the next attempt gets a fresh set of cdns
+                StorageResolver.shared().invalidate(track.format.file_id)
+            self.journal.release()
+            raise
+
+        try:
+            self.duration_ms: float | None = duration.result()
+        except BaseException:
+            self.discard()
+            raise
+        self.finished_event: threading.Event = threading.Event()
+        self._unpaused: threading.Event = threading.Event()
+        self._unpaused.set()
+        self._cancelled: threading.Event = threading.Event()
+
+    @property
+    def paused(self) -> bool:
+        return not self._unpaused.is_set()
+
+    def pause(self) -> None:
+        """stops fetching until `resume`, the consumers keep draining what's buffered"""
+        self._unpaused.clear()
+
+    def resume(self) -> None:
+        self._unpaused.set()
+
+    def cancel(self) -> None:
+        """stops `download` at the next chunk, the journal keeps what's done for the next run"""
+        self._cancelled.set()
+        self._unpaused.set()
+
+    def discard(self) -> None:
+        """for one that is never going to `download`, frees what setting it up took"""
+        self.stream.close()
+        self.stream.drop_cache()
+        self.journal.release()
+
+    def _open_stream(
+        self, cdn_urls: list[str], max_inflight: int
+    ) -> DecryptedSpotifyStream | EncryptedSpotifyStream:
+        cdn = cdn_urls[0] if cdn_urls else None
+        # TODO: decrypt ourself
+        if self.key and not isinstance(self.key_provider, WidevineClient):
+            return DecryptedSpotifyStream(
+                cdn,
+                self.key,
+                max_inflight=max_inflight,
+                read_ahead=True,
+                decrypt_in_worker=True,
+                journal=None if self.blob else self.journal,
+                blob=self.blob,
+                mirrors=cdn_urls[1:],
+            )
+
+        return EncryptedSpotifyStream(
+            cdn,
+            max_inflight=max_inflight,
+            read_ahead=True,
+            journal=None if self.blob else self.journal,
+            blob=self.blob,
+            mirrors=cdn_urls[1:],
+        )
+
+    def _start_consumer(
+        self,
+        reader: RingReader,
+        target: Callable[[RingReader], None],
+        errors: list[BaseException],
+    ) -> threading.Thread:
+        def run() -> None:
             try:
-                # TODO: decrypt ourself
-                if self.key and not isinstance(self.key_provider, WidevineClient):
-                    self.stream = DecryptedSpotifyStream(
-                        cdn, self.key, max_cached_chunks=-1
-                    )
-                else:
-                    self.stream = EncryptedSpotifyStream(cdn, max_cached_chunks=-1)
-                break
-            except HTTPError:
-                self.logger.debug(f"Could not connect to {cdn}, trying next")
+                target(reader)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                # a dead consumer must not stall the producer
+                reader.close()
 
-        if not self.stream:
-            raise HTTPError(f"Tried all ({len(cdn_urls)}) cdn's, none of them worked")
+        t = threading.Thread(
+            target=run, name=f"ring_consumer:{reader.name}", daemon=True
+        )
+        t.start()
+        return t
+
+    def _fetch_key(self, fileid: str | None) -> bytes | None:
+        assert self.key_provider
+
+        started = time.monotonic()
+        key = self.key_provider.get_audio_key(
+            binascii.unhexlify(self.format.gid),
+            (
+                binascii.unhexlify(self.format.file_id)
+                if not isinstance(self.key_provider, WidevineClient)
+                else (fileid or "").encode()
+            ),
+        )
+        self.key_latency = time.monotonic() - started
+        self.logger.info(f"key: {key!r}")
+        if key:
+            KeyStore.shared().put(
+                self.format.gid, self.format.file_id, self._key_source(), key
+            )
+        return key
 
-        self.duration_ms: float | None = self.track.get_metadata_internal(
-            self.auth
-        ).duration
-        self.finished_event: threading.Event = threading.Event()
+    def _key_source(self) -> str:
+        return type(self.key_provider).__name__
 
     def _resolve(self, file_id: str) -> tuple[list[str], str]:
-        res = storage_resolve(self.auth.session, file_id)
+        res = StorageResolver.shared().resolve(self.auth.session, file_id)
         cdn_urls: list[str] = res.get("cdnurl", [])
         self.logger.debug(f"cdn for {file_id}: {cdn_urls}")
 
         if not cdn_urls:
+            StorageResolver.shared().invalidate(file_id)
             raise ValueError(f"No cdn url for {file_id}")
 
         return cdn_urls, res["fileid"]
@@ -108,9 +239,21 @@ class SpotifyDownloader:
         output: str,
         emulate_playback: bool = False,
         player_buffer: Queue[bytes] | None = None,
-    ) -> None:
+    ) -> bool:
+        """False when it stopped before the end"""
         path = Path(output)
 
+        if not self.blob and (blob := BlobStore.shared().open(self.format.file_id)):
+            # another download of the same file finished after this one was prepared
+            self.logger.debug(
+                f"{self.format.file_id} got stored meanwhile, reading that"
+            )
+            self.stream.close()
+            self.stream.drop_cache()
+            self.journal.discard()
+            self.blob = blob
+            self.stream = self._open_stream([], self.max_inflight)
+
         bps = (
             (self.stream.size / (self.duration_ms / 1000.0))
             if self.duration_ms
@@ -118,12 +261,21 @@ class SpotifyDownloader:
         )
         if bps is None:
             self.logger.error("Could not determine bps because duration_ms is None")
-            return
+            self.discard()
+            if player_buffer:
+                # the player waits for the end of the stream
+                player_buffer.put(b"")
+            self.finished_event.set()
+            return False
 
-        buffer: Queue[bytes] = Queue()
-        buffer_bytes = 3 * bps
+        # ~3 seconds of audio ahead of the slowest consumer
+        buffer_bytes = max(int(3 * bps), 4 * self.stream.CHUNK_SIZE)
+        ring = RingBuffer(2 * buffer_bytes, high_watermark=buffer_bytes)
+        consumers: list[threading.Thread] = []
+        errors: list[BaseException] = []
 
         f = None
+        finished = False
         try:
             # TODO: determine if output points to file/directory (based on the filename alone)
             path.absolute().parent.mkdir(parents=True, exist_ok=True)
@@ -132,36 +284,86 @@ class SpotifyDownloader:
                 _ = self.stream.seek(self.OGG_HEADER_SKIP)
 
             f = open(path, "wb")
-            while True:
-                # TODO: better way of buffering
-                while buffer.qsize() * bps < buffer_bytes or (
-                    player_buffer and player_buffer.qsize() * bps < buffer_bytes
+            file = f
+
+            def write_file(reader: RingReader) -> None:
+                while view := reader.view(self.stream.CHUNK_SIZE):
+                    size = len(view)
+                    _ = file.write(view)
+                    view.release()
+                    reader.consume(size)
+
+                    if emulate_playback:
+                        time.sleep(size / bps)
+
+            consumers.append(
+                self._start_consumer(ring.add_consumer("file"), write_file, errors)
+            )
+
+            if player_buffer:
+                player = player_buffer
+
+                def feed_player(reader: RingReader) -> None:
+                    while data := reader.read(self.stream.CHUNK_SIZE):
+                        # `get` notifies `not_full` for every item taken, even on an unbounded queue.
+                        # `qsize` takes the same lock, so the deque is checked directly
+                        with player.not_full:
+                            # every item is at most a chunk, so this is an upper bound in bytes
+                            while (
+                                len(player.queue) * self.stream.CHUNK_SIZE
+                                > buffer_bytes
+                            ):
+                                _ = player.not_full.wait()
+                        player.put(data)
+                    player.put(b"")
+
+                consumers.append(
+                    self._start_consumer(
+                        ring.add_consumer("player"), feed_player, errors
+                    )
+                )
+
+            # the stream decrypts straight into the ring, consumers read it in place
+            while not errors:
+                _ = self._unpaused.wait()
+                if self._cancelled.is_set() or not ring.write_from(
+                    self.stream.readinto
                 ):
-                    data = self.stream.read(self.stream.CHUNK_SIZE)
-                    if not data:
-                        if player_buffer:
-                            player_buffer.put(b"")
-                        buffer.put(b"")
-                        break
-
-                    if player_buffer:
-                        player_buffer.put(data)
-                    buffer.put(data)
-
-                data = buffer.get()
-                if not data:
                     break
 
-                _ = f.write(data)
+            ring.close()
+            for t in consumers:
+                t.join()
+            if errors:
+                raise errors[0]
 
-                if emulate_playback:
-                    time.sleep(len(data) / bps)
+            finished = not self._cancelled.is_set()
         finally:
+            ring.close()
+            for t in consumers:
+                t.join()
             if f:
                 f.close()
             self.stream.close()
+            if finished:
+                if not self.blob and self.journal.complete():
+                    BlobStore.shared().put(self.format.file_id, self.journal.part_path)
+                self.journal.discard()
+            else:
+                # the part file stays for the next attempt to resume
+                self.journal.release()
+            self.logger.debug(f"Chunk cache: {self.stream.cache.stats()}")
+            self.logger.debug(f"HTTP pool: {HttpPool.shared().stats()}")
+            self.logger.debug(
+                f"CDN: {self.stream.switches} switches, {CdnHealth.shared().stats()}"
+            )
+            self.logger.debug(f"Metadata cache: {MetadataCache.shared().stats()}")
+            self.logger.debug(f"Storage resolve: {StorageResolver.shared().stats()}")
+            self.logger.debug(f"Ring buffer: {ring.stats()}")
             self.finished_event.set()
 
+        return finished
+
 
 @dataclass
 class SpotifyDownloadParam:
@@ -170,6 +372,9 @@ class SpotifyDownloadParam:
     key_provider: KeyProvider | None
     output: str
     emulate_playback: bool
+    priority: DownloadPriority = DownloadPriority.DOWNLOAD
+    # time.monotonic() it should have started by
+    deadline: float | None = None
 
 
 @dataclass
@@ -181,166 +386,425 @@ class SpotifyDownloadState:
 
 class SpotifyDownloadManager:
     logger: logging.Logger = logging.getLogger("spdl:download_manager")
+    POST_PROCESS_WORKERS: int = 2
+    # queued items set up (resolved, keyed, stream opened) ahead of a free worker
+    PREPARE_AHEAD: int = 2
 
     def __init__(
         self,
         concurrent_download: int = 1,
         download_cb: Callable[[SpotifyDownloadState], Any] | None = None,
+        post_process_workers: int = POST_PROCESS_WORKERS,
+        max_concurrent_download: int | None = None,
+        prepare_ahead: int = PREPARE_AHEAD,
     ) -> None:
-        self.queue: Queue[SpotifyDownloadParam] = Queue()
+        self.queue: DownloadQueue[SpotifyDownloadParam] = DownloadQueue()
         self.threads: list[threading.Thread] = []
+        # worker -> what it is downloading, for preemption
+        self._running: dict[
+            threading.Thread, tuple[DownloadPriority, SpotifyDownloader]
+        ] = {}
+        self._preempted: list[tuple[DownloadPriority, SpotifyDownloader]] = []
+        self._threads_lock: threading.Lock = threading.Lock()
+        self._worker_ids: int = 0
+        # extra workers for preempting items, each exits after one item
+        self._bursts: list[threading.Thread] = []
+        self._stopping: threading.Event = threading.Event()
         self._active: Queue[tuple[str, SpotifyDownloadState]] = Queue()
         self._cond: threading.Condition = threading.Condition()
         self.download_cb: Callable[[SpotifyDownloadState], Queue[bytes]] | None = (
             download_cb
         )
 
-        for i in range(concurrent_download):
-            tid = threading.Thread(
-                target=self._consumer_thread,
-                name=f"download_worker:{i}",
-                daemon=True,
+        # resized at runtime between concurrent_download and max_concurrent_download
+        self.controller: ConcurrencyController | None = (
+            ConcurrencyController(concurrent_download, maximum=max_concurrent_download)
+            if max_concurrent_download and max_concurrent_download > concurrent_download
+            else None
+        )
+        self.concurrency: int = concurrent_download
+
+        # every worker can have MAX_INFLIGHT requests to the same cdn host
+        HttpPool.shared().ensure_size(
+            max(concurrent_download, max_concurrent_download or 0)
+            * SpotifyDownloader.MAX_INFLIGHT
+        )
+
+        # mp4decrypt, cover art and tagging, kept off the download workers.
+        # threads and not processes, the track and auth objects don't pickle
+        # and both mp4decrypt and PIL release the GIL
+        self.post_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=post_process_workers, thread_name_prefix="post_process"
+        )
+
+        # id(param) -> its downloader being set up, keyed by id since params don't hash
+        self.prepare_ahead: int = prepare_ahead
+        self._prepared: dict[
+            int, tuple[SpotifyDownloadParam, Future[SpotifyDownloader]]
+        ] = {}
+        self._prepared_lock: threading.Lock = threading.Lock()
+        self.prepare_executor: ThreadPoolExecutor | None = (
+            ThreadPoolExecutor(
+                max_workers=prepare_ahead, thread_name_prefix="download_prepare"
+            )
+            if prepare_ahead > 0
+            else None
+        )
+
+        self.resize(concurrent_download)
+
+        self._control: threading.Thread | None = None
+        if self.controller:
+            self._control = threading.Thread(
+                target=self._control_thread, name="download_control", daemon=True
             )
-            tid.start()
-            self.threads.append(tid)
+            self._control.start()
 
     def enqueue(self, param: SpotifyDownloadParam) -> None:
         self.queue.put(param)
+        self._prepare()
+
+        with self._threads_lock:
+            if len(self._running) < len(self.threads):
+                # a worker is free and the queue hands it the most urgent item
+                return
+
+            lower = [
+                (priority, dl)
+                for priority, dl in self._running.values()
+                if priority > param.priority and not dl.paused
+            ]
+            if not lower:
+                return
+
+            # park the least urgent download (it resumes from the journal
+            # where it stopped) and give this one a worker of its own,
+            # every urgent item enqueued parks one more
+            priority, dl = max(lower, key=lambda running: running[0])
+            self.logger.info(
+                f"Pausing a {priority.name} download for a {param.priority.name} one"
+            )
+            dl.pause()
+            self._preempted.append((priority, dl))
 
-    def _consumer_thread(self) -> None:
-        while True:
-            param = self.queue.get()
-            thread_name = threading.current_thread().name
+            burst = threading.Thread(
+                target=self._burst_thread,
+                name=f"download_burst:{self._worker_ids}",
+                daemon=True,
+            )
+            self._worker_ids += 1
+            self._bursts.append(burst)
+            burst.start()
 
-            try:
-                dl = SpotifyDownloader(param.track, param.auth, param.key_provider)
+    def _prepare(self) -> None:
+        """starts setting up the next `prepare_ahead` queued items"""
+        if not self.prepare_executor:
+            return
 
-                state = SpotifyDownloadState(dl, param, None)
-                state.buffer = (
-                    self.download_cb(state)
-                    if self.download_cb
-                    and isinstance(dl.stream, DecryptedSpotifyStream)
-                    else None
-                )
+        with self._prepared_lock:
+            for param in self.queue.items()[: self.prepare_ahead]:
+                if id(param) in self._prepared:
+                    continue
 
-                with self._cond:
-                    self._active.put((thread_name, state))
-                    self._cond.notify_all()
+                self.logger.debug(f"Preparing spotify:track:{param.track.id_b62} ahead")
+                self._prepared[id(param)] = (
+                    param,
+                    self.prepare_executor.submit(
+                        SpotifyDownloader,
+                        param.track,
+                        param.auth,
+                        param.key_provider,
+                    ),
+                )
 
-                self.logger.info(
-                    f"Now downloading: {param.track.get_metadata()['name']}",
+    def _downloader(self, param: SpotifyDownloadParam) -> SpotifyDownloader:
+        with self._prepared_lock:
+            _, prepared = self._prepared.pop(id(param), (param, None))
+
+        # whatever is next in line gets a head start while this one downloads
+        self._prepare()
+
+        if prepared:
+            return prepared.result()
+        return SpotifyDownloader(param.track, param.auth, param.key_provider)
+
+    def resize(self, concurrency: int) -> None:
+        """extra workers exit once they finish their current track"""
+        with self._threads_lock:
+            self.concurrency = max(1, concurrency)
+            while len(self.threads) < self.concurrency:
+                tid = threading.Thread(
+                    target=self._consumer_thread,
+                    name=f"download_worker:{self._worker_ids}",
+                    daemon=True,
                 )
-                dl.download(
-                    param.output,
-                    param.emulate_playback,
-                    state.buffer,
+                self._worker_ids += 1
+                tid.start()
+                self.threads.append(tid)
+
+    def wait_stats(self) -> dict[DownloadPriority, WaitStats]:
+        return self.queue.wait_stats()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """`wait` lets everything queued finish (post-processing included) first.
+
+        otherwise the queue is dropped and the running downloads stop at their next chunk,
+        their journals keep what's done for the next run
+        """
+        if wait:
+            self.queue.join()
+        self.logger.debug(f"Queue waits: {self.wait_stats()}")
+
+        self._stopping.set()
+        if not wait:
+            dropped = 0
+            while True:
+                try:
+                    _ = self.queue.get_nowait()
+                except Empty:
+                    break
+                self.queue.task_done()
+                dropped += 1
+            with self._threads_lock:
+                running = [dl for _, dl in self._running.values()]
+                for dl in running:
+                    dl.cancel()
+            if dropped or running:
+                self.logger.info(
+                    f"Stopping {len(running)} downloads, dropping {dropped} queued"
                 )
-                self.logger.info(f"Download finished, saved in: {param.output!r}")
-
-                # TODO: just pass the key source
-
-                add_metadata = isinstance(dl.stream, DecryptedSpotifyStream)
-
-                if isinstance(dl.stream, EncryptedSpotifyStream) and dl.key:
-                    self.logger.info("File is encrypted, decrypting...")
-                    # dl.key is [KID:KEY, ...] separated with space
-                    k = dl.key.decode().split(" ")
-                    keys = [
-                        val
-                        for pair in zip(("--key" for _ in range(len(k))), k)
-                        for val in pair
-                    ]
-                    enc_file = Path(param.output)
-                    dec_file = Path(param.output).with_stem(enc_file.stem + "_dec")
-
-                    suffix = ""
-                    if platform.system() == "Windows":
-                        suffix = ".exe"
-
-                    mp4dec: Path | None = None
-                    if p := shutil.which("mp4decrypt"):
-                        mp4dec = Path(p).with_suffix(suffix)
-                    else:
-                        mp4dec = (
-                            Path(__file__).parent.parent
-                            / f"binaries/mp4decrypt{suffix}"
-                        )
 
-                    if mp4dec.exists() and mp4dec.is_file():
-                        print(
-                            f"Running mp4decrypt {mp4dec!r} with args {keys} {enc_file} {dec_file}"
-                        )
+        with self._threads_lock:
+            threads = [*self.threads, *self._bursts]
+        if self._control:
+            threads.append(self._control)
+        for t in threads:
+            t.join()
+
+        if self.prepare_executor:
+            self.prepare_executor.shutdown(cancel_futures=True)
+        # set up ahead for items that never got a worker
+        with self._prepared_lock:
+            prepared = [future for _, future in self._prepared.values()]
+            self._prepared.clear()
+        for future in prepared:
+            if not future.cancelled() and future.exception() is None:
+                future.result().discard()
+        self.post_executor.shutdown()
+
+    def status(self) -> str:
+        if not self.controller:
+            return f"x{self.concurrency}"
+        return f"x{self.concurrency} {self.controller.reason}"
+
+    def _retire(self) -> bool:
+        with self._threads_lock:
+            if self._stopping.is_set() or len(self.threads) > self.concurrency:
+                self.threads.remove(threading.current_thread())
+                return True
+            return False
+
+    def _control_thread(self) -> None:
+        assert self.controller
+        while not self._stopping.wait(self.controller.INTERVAL):
+            concurrency = self.controller.update(
+                HttpPool.shared().stats(), busy=self.queue.qsize() > 0
+            )
+            if concurrency != self.concurrency:
+                self.resize(concurrency)
 
-                        tmp_input = enc_file.with_name(f"tmp_{uuid.uuid4().hex}.mp4")
-                        tmp_output = enc_file.with_name(
-                            f"tmp_{uuid.uuid4().hex}_out.mp4"
-                        )
+    def _consumer_thread(self) -> None:
+        while not self._retire():
+            try:
+                param = self.queue.get(timeout=1.0)
+            except Empty:
+                continue
 
-                        try:
-                            # workaround for unicode issues with windows
-                            os.replace(enc_file, tmp_input)
+            self._process(param)
 
-                            _ = subprocess.run(
-                                [mp4dec, *keys, tmp_input, tmp_output], check=True
-                            )
+    def _burst_thread(self) -> None:
+        # a regular worker may have freed up and taken it in the meantime
+        try:
+            param = self.queue.get(timeout=1.0)
+        except Empty:
+            self._resume_preempted()
+        else:
+            self._process(param)
+        finally:
+            with self._threads_lock:
+                self._bursts.remove(threading.current_thread())
+
+    def _resume_preempted(self) -> None:
+        with self._threads_lock:
+            highest = min(
+                (priority for priority, dl in self._running.values() if not dl.paused),
+                default=None,
+            )
+            for priority, dl in list(self._preempted):
+                if highest is None or priority <= highest:
+                    dl.resume()
+                    self._preempted.remove((priority, dl))
 
-                            os.replace(tmp_input, enc_file)
-                            os.replace(tmp_output, enc_file)
+    def _process(self, param: SpotifyDownloadParam) -> None:
+        thread = threading.current_thread()
+        thread_name = thread.name
+        post: Future[None] | None = None
+        dl: SpotifyDownloader | None = None
 
-                            add_metadata = True
-                        except Exception as e:
-                            self.logger.error(f"mp4decrypt failed: {e}")
-                            if tmp_input.exists():
-                                os.replace(tmp_input, enc_file)
+        try:
+            dl = self._downloader(param)
+            if self.controller and dl.key_latency is not None:
+                self.controller.record_key_latency(dl.key_latency)
+            with self._threads_lock:
+                self._running[thread] = (param.priority, dl)
+                if self._stopping.is_set():
+                    # taken off the queue just as it was being cleared
+                    dl.cancel()
+
+            state = SpotifyDownloadState(dl, param, None)
+            state.buffer = (
+                self.download_cb(state)
+                if self.download_cb and isinstance(dl.stream, DecryptedSpotifyStream)
+                else None
+            )
 
-                            if tmp_output.exists():
-                                tmp_output.unlink()
+            with self._cond:
+                self._active.put((thread_name, state))
+                self._cond.notify_all()
 
-                            raise
+            self.logger.info(
+                f"Now downloading: {param.track.get_metadata()['name']} [{self.status()}]",
+            )
+            started = time.monotonic()
+            if not dl.download(
+                param.output,
+                param.emulate_playback,
+                state.buffer,
+            ):
+                self.logger.info(f"Download stopped early: {param.output!r}")
+                return
+            if self.controller:
+                self.controller.record_track(dl.stream.size, time.monotonic() - started)
+            self.logger.info(f"Download finished, saved in: {param.output!r}")
+            self.logger.debug(f"Queue waits: {self.wait_stats()}")
+
+            # the network worker moves on to the next track right away
+            post = self.post_executor.submit(self._post_process, dl, param)
+            post.add_done_callback(lambda _: self.queue.task_done())
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error while downloading: {e}")
+        finally:
+            with self._threads_lock:
+                _ = self._running.pop(thread, None)
+            self._resume_preempted()
+            if post is None:
+                if dl:
+                    dl.stream.drop_cache()
+                self.queue.task_done()
 
-                    else:
-                        self.logger.warning(
-                            "mp4decrypt is required for widevine stream. download it from 'https://www.bento4.com/downloads' or build it with 'python script.py build-bento4'"
-                        )
-                        self.logger.info(
-                            "call the following command to decrypt the already downloaded file:"
-                        )
-                        self.logger.info(
-                            f"\tmp4decrypt {' '.join(keys)} {shlex.quote(str(enc_file))} {shlex.quote(str(dec_file))}"
+    def _post_process(self, dl: SpotifyDownloader, param: SpotifyDownloadParam) -> None:
+        try:
+            # TODO: just pass the key source
+
+            add_metadata = isinstance(dl.stream, DecryptedSpotifyStream)
+
+            if isinstance(dl.stream, EncryptedSpotifyStream) and dl.key:
+                self.logger.info("File is encrypted, decrypting...")
+                # dl.key is [KID:KEY, ...] separated with space
+                k = dl.key.decode().split(" ")
+                keys = [
+                    val
+                    for pair in zip(("--key" for _ in range(len(k))), k)
+                    for val in pair
+                ]
+                enc_file = Path(param.output)
+                dec_file = Path(param.output).with_stem(enc_file.stem + "_dec")
+
+                suffix = ""
+                if platform.system() == "Windows":
+                    suffix = ".exe"
+
+                mp4dec: Path | None = None
+                if p := shutil.which("mp4decrypt"):
+                    mp4dec = Path(p).with_suffix(suffix)
+                else:
+                    mp4dec = (
+                        Path(__file__).parent.parent / f"binaries/mp4decrypt{suffix}"
+                    )
+
+                if mp4dec.exists() and mp4dec.is_file():
+                    print(
+                        f"Running mp4decrypt {mp4dec!r} with args {keys} {enc_file} {dec_file}"
+                    )
+
+                    tmp_input = enc_file.with_name(f"tmp_{uuid.uuid4().hex}.mp4")
+                    tmp_output = enc_file.with_name(f"tmp_{uuid.uuid4().hex}_out.mp4")
+
+                    try:
+                        # workaround for unicode issues with windows
+                        os.replace(enc_file, tmp_input)
+
+                        _ = subprocess.run(
+                            [mp4dec, *keys, tmp_input, tmp_output], check=True
                         )
 
-                if add_metadata:
-                    self.logger.info("Adding metadata")
-                    rg: ReplayGain | None = None
-                    if (
-                        param.track.format
-                        and param.track.format.get_codec() == AudioCodec.OGG_VORBIS
-                        and isinstance(dl.stream, DecryptedSpotifyStream)
-                    ):
-                        header = dl.stream.read_header()
-                        rg = header.replaygain
-                    else:
-                        self.logger.debug("Track does not have replaygain info")
-
-                    apply_metadata(
-                        param.track,
-                        str(param.output),
-                        param.auth,
-                        replaygain=rg,
+                        os.replace(tmp_input, enc_file)
+                        os.replace(tmp_output, enc_file)
+
+                        add_metadata = True
+                    except Exception as e:
+                        self.logger.error(f"mp4decrypt failed: {e}")
+                        if tmp_input.exists():
+                            os.replace(tmp_input, enc_file)
+
+                        if tmp_output.exists():
+                            tmp_output.unlink()
+
+                        raise
+
+                else:
+                    self.logger.warning(
+                        "mp4decrypt is required for widevine stream. download it from 'https://www.bento4.com/downloads' or build it with 'python script.py build-bento4'"
+                    )
+                    self.logger.info(
+                        "call the following command to decrypt the already downloaded file:"
+                    )
+                    self.logger.info(
+                        f"\tmp4decrypt {' '.join(keys)} {shlex.quote(str(enc_file))} {shlex.quote(str(dec_file))}"
                     )
 
-                self.logger.info(
-                    f"Finished adding metadata, saved in: {param.output!r}"
+            if add_metadata:
+                self.logger.info("Adding metadata")
+                rg: ReplayGain | None = None
+                if (
+                    param.track.format
+                    and param.track.format.get_codec() == AudioCodec.OGG_VORBIS
+                    and isinstance(dl.stream, DecryptedSpotifyStream)
+                ):
+                    header = dl.stream.read_header()
+                    rg = header.replaygain
+                else:
+                    self.logger.debug("Track does not have replaygain info")
+
+                apply_metadata(
+                    param.track,
+                    str(param.output),
+                    param.auth,
+                    replaygain=rg,
                 )
-            except Exception as e:
-                traceback.print_exc()
-                self.logger.error(f"Error while downloading: {e}")
-            finally:
-                self.queue.task_done()
+
+            self.logger.info(f"Finished adding metadata, saved in: {param.output!r}")
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error while post-processing: {e}")
+        finally:
+            # the pinned header chunk would otherwise stay until the stream is collected
+            dl.stream.drop_cache()
 
     def get_active(self) -> list[tuple[SpotifyDownloader, SpotifyDownloadParam]]:
         with self._cond:
             return [(s.download, s.param) for _, s in self._active.queue]
 
     def get_queued(self) -> list[SpotifyDownloadParam]:
-        return list(self.queue.queue)
+        return self.queue.items()
@@ -0,0 +1,212 @@
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+from typing import BinaryIO, ClassVar
+
+
+class ChunkJournal:
+    """sparse part-file of downloaded chunks, with a bitmap sidecar of which ones are there"""
+
+    logger: logging.Logger = logging.getLogger("spdl:journal")
+    JOURNAL_DIR: Path = Path(".spcache") / "journal"
+
+    # the bitmap goes to disk every this many chunks or seconds, whichever comes first.
+    # a crash loses at most that much, it is fetched again
+    FLUSH_CHUNKS: int = 32
+    FLUSH_INTERVAL: float = 2.0
+
+    _MAGIC: bytes = b"SPJv1"
+    _HEADER: struct.Struct = struct.Struct(">QI")
+
+    # file_ids whose part file some journal in this process is writing
+    _claimed: ClassVar[set[str]] = set()
+    _claimed_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self, file_id: str, chunk_size: int, directory: Path | None = None
+    ) -> None:
+        self.file_id: str = file_id
+        self.chunk_size: int = chunk_size
+        self.directory: Path = directory or ChunkJournal.JOURNAL_DIR
+
+        # a second download of the same file (queued twice, another output dir) gets a
+        # part file of its own instead of sharing, and can't resume
+        with ChunkJournal._claimed_lock:
+            self.owner: bool = file_id not in ChunkJournal._claimed
+            if self.owner:
+                ChunkJournal._claimed.add(file_id)
+        name = file_id if self.owner else f"{file_id}.{os.getpid()}.{id(self)}"
+        self.part_path: Path = self.directory / f"{name}.part"
+        self.bitmap_path: Path = self.directory / f"{name}.bitmap"
+        self._released: bool = False
+
+        self.size: int | None = None
+        self.total_chunks: int = 0
+        self._bitmap: bytearray = bytearray()
+        self._file: BinaryIO | None = None
+        # chunks written since the bitmap was last saved
+        self._dirty: int = 0
+        self._last_flush: float = 0
+        self._lock: threading.Lock = threading.Lock()
+
+        if self.owner:
+            self._load()
+
+    def _load(self) -> None:
+        if not self.bitmap_path.exists() or not self.part_path.exists():
+            return
+
+        try:
+            raw = self.bitmap_path.read_bytes()
+            if not raw.startswith(self._MAGIC):
+                raise ValueError("bad magic")
+
+            size, chunk_size = self._HEADER.unpack_from(raw, len(self._MAGIC))
+            if chunk_size != self.chunk_size:
+                raise ValueError(f"chunk size {chunk_size} != {self.chunk_size}")
+
+            bitmap = bytearray(raw[len(self._MAGIC) + self._HEADER.size :])
+            total_chunks = -(-size // chunk_size)
+            if len(bitmap) != (total_chunks + 7) // 8:
+                raise ValueError("bitmap is truncated")
+        except Exception as e:
+            self.logger.warning(f"Ignoring journal for {self.file_id}: {e}")
+            return
+
+        self.size = size
+        self.total_chunks = total_chunks
+        self._bitmap = bitmap
+
+    def open(self, size: int) -> None:
+        with self._lock:
+            if self.size != size:
+                if self.size is not None:
+                    self.logger.info(
+                        f"Size of {self.file_id} changed ({self.size} -> {size}), starting over"
+                    )
+                self.size = size
+                self.total_chunks = -(-size // self.chunk_size)
+                self._bitmap = bytearray((self.total_chunks + 7) // 8)
+                self.part_path.unlink(missing_ok=True)
+            elif any(self._bitmap):
+                self.logger.info(
+                    f"Resuming {self.file_id}: {self.total_chunks - len(self.missing())}/{self.total_chunks} chunks on disk"
+                )
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if not self.part_path.exists():
+                with self.part_path.open("wb") as f:
+                    _ = f.truncate(size)
+            self._file = self.part_path.open("r+b")
+            self._save_bitmap()
+            self._last_flush = time.monotonic()
+
+    def has(self, chunk_index: int) -> bool:
+        if not 0 <= chunk_index < self.total_chunks:
+            return False
+        return bool(self._bitmap[chunk_index >> 3] & (1 << (chunk_index & 7)))
+
+    def missing(self) -> list[int]:
+        return [i for i in range(self.total_chunks) if not self.has(i)]
+
+    def complete(self) -> bool:
+        return self.size is not None and not self.missing()
+
+    def read(self, chunk_index: int) -> bytes | None:
+        if not self.has(chunk_index) or self.size is None:
+            return None
+
+        start = chunk_index * self.chunk_size
+        length = min(self.chunk_size, self.size - start)
+        with self._lock:
+            if not self._file:
+                return None
+            _ = self._file.seek(start)
+            data = self._file.read(length)
+
+        if len(data) != length:
+            self.logger.warning(
+                f"Short read for chunk {chunk_index} of {self.file_id}, refetching"
+            )
+            return None
+
+        return data
+
+    def write(self, chunk_index: int, data: bytes) -> None:
+        with self._lock:
+            if not self._file:
+                return
+
+            _ = self._file.seek(chunk_index * self.chunk_size)
+            _ = self._file.write(data)
+
+            self._bitmap[chunk_index >> 3] |= 1 << (chunk_index & 7)
+            self._dirty += 1
+            if (
+                self._dirty >= self.FLUSH_CHUNKS
+                or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL
+            ):
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                if self._dirty:
+                    self._flush()
+                self._file.close()
+                self._file = None
+
+    def _flush(self) -> None:
+        assert self._file
+
+        # the data has to be on disk before a bitmap that claims it
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._save_bitmap()
+        self._dirty = 0
+        self._last_flush = time.monotonic()
+
+    def discard(self) -> None:
+        self.close()
+        self.part_path.unlink(missing_ok=True)
+        self.bitmap_path.unlink(missing_ok=True)
+        self.release()
+
+    def release(self) -> None:
+        """lets the next journal for this file_id use the shared part file, call once done with it.
+
+        a private part file is deleted instead, no later run would ever find it again
+        """
+        with ChunkJournal._claimed_lock:
+            if self._released:
+                return
+            self._released = True
+            if self.owner:
+                ChunkJournal._claimed.discard(self.file_id)
+                return
+
+        self.close()
+        self.part_path.unlink(missing_ok=True)
+        self.bitmap_path.unlink(missing_ok=True)
+
+    def _save_bitmap(self) -> None:
+        assert self.size is not None
+
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.file_id}.", dir=str(self.directory))
+        tmp_path = Path(tmp)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                _ = f.write(self._MAGIC)
+                _ = f.write(self._HEADER.pack(self.size, self.chunk_size))
+                _ = f.write(self._bitmap)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(str(tmp_path), str(self.bitmap_path))
+        finally:
+            tmp_path.unlink(missing_ok=True)
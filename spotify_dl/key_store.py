@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import secrets
+import threading
+
+from pathlib import Path
+from typing import ClassVar
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# same layout as `script.py enc`: magic, salt, nonce, ciphertext
+_MAGIC = b"SPDv1"
+_SALT_SIZE = 16
+_NONCE_SIZE = 12
+_KEY_LEN = 32
+_PBKDF2_ITERS = 400_000
+
+
+class KeyStore:
+    """audio keys encrypted at rest, one file per key so several processes can share the directory.
+
+    every file uses the same salt, the password only goes through pbkdf2 once per process
+    """
+
+    logger: logging.Logger = logging.getLogger("spdl:key_store")
+    KEY_DIR: Path = Path(".spcache") / "keys"
+    PASSWORD_ENV: str = "SPDL_KEY_STORE_PASSWORD"
+
+    _shared: ClassVar["KeyStore | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self, directory: Path | None = None, password: bytes | None = None
+    ) -> None:
+        self.directory: Path = directory or KeyStore.KEY_DIR
+        self.password: bytes | None = password
+        if self.password is None and (env := os.environ.get(self.PASSWORD_ENV)):
+            self.password = env.encode("utf-8")
+
+        # whatever this process already looked up or stored, in the clear
+        self._memory: dict[tuple[str, str, str], bytes] = {}
+        self._aead: AESGCM | None = None
+        self._salt: bytes | None = None
+        self._lock: threading.Lock = threading.Lock()
+
+        if self.password is None:
+            self.logger.debug(
+                f"{self.PASSWORD_ENV} is not set, keys are only kept in memory"
+            )
+
+    @classmethod
+    def shared(cls) -> "KeyStore":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def persistent(self) -> bool:
+        return self.password is not None
+
+    def path(self, gid: str, file_id: str, source: str) -> Path:
+        # the ids themselves don't end up on disk
+        name = hashlib.sha256(f"{source}:{gid}:{file_id}".encode()).hexdigest()
+        return self.directory / f"{name}.key"
+
+    def get(self, gid: str, file_id: str, source: str) -> bytes | None:
+        with self._lock:
+            key = self._memory.get((gid, file_id, source))
+            if key is not None or not self.persistent:
+                return key
+
+        try:
+            data = self.path(gid, file_id, source).read_bytes()
+        except FileNotFoundError:
+            return None
+
+        key = self._decrypt(data)
+        if key is None:
+            self.logger.warning(
+                f"Could not decrypt the stored key for {gid}, wrong password or corrupted"
+            )
+            return None
+
+        with self._lock:
+            self._memory[(gid, file_id, source)] = key
+        return key
+
+    def put(self, gid: str, file_id: str, source: str, key: bytes) -> None:
+        with self._lock:
+            self._memory[(gid, file_id, source)] = key
+        if not self.persistent:
+            return
+
+        path = self.path(gid, file_id, source)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        _ = tmp.write_bytes(self._encrypt(key))
+        # readers in other processes see the old file or the new one, never half of it
+        os.replace(tmp, path)
+
+    def _cipher(self) -> tuple[AESGCM, bytes]:
+        assert self.password is not None
+
+        with self._lock:
+            if self._aead is None or self._salt is None:
+                self._salt = self._load_salt()
+                kdf = PBKDF2HMAC(
+                    algorithm=hashes.SHA256(),
+                    length=_KEY_LEN,
+                    salt=self._salt,
+                    iterations=_PBKDF2_ITERS,
+                )
+                self._aead = AESGCM(kdf.derive(self.password))
+            return self._aead, self._salt
+
+    def _load_salt(self) -> bytes:
+        path = self.directory / "salt"
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"salt.{os.getpid()}.tmp")
+        _ = tmp.write_bytes(secrets.token_bytes(_SALT_SIZE))
+        try:
+            # unlike `os.replace`, fails if another process created it first
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            tmp.unlink()
+        return path.read_bytes()
+
+    def _encrypt(self, key: bytes) -> bytes:
+        aead, salt = self._cipher()
+        nonce = secrets.token_bytes(_NONCE_SIZE)
+        return _MAGIC + salt + nonce + aead.encrypt(nonce, key, associated_data=None)
+
+    def _decrypt(self, data: bytes) -> bytes | None:
+        aead, salt = self._cipher()
+
+        header = len(_MAGIC) + _SALT_SIZE + _NONCE_SIZE
+        if (
+            len(data) < header + 16
+            or data[: len(_MAGIC)] != _MAGIC
+            or data[len(_MAGIC) : len(_MAGIC) + _SALT_SIZE] != salt
+        ):
+            return None
+
+        try:
+            return aead.decrypt(
+                data[header - _NONCE_SIZE : header], data[header:], associated_data=None
+            )
+        except InvalidTag:
+            return None
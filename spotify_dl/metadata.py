@@ -3,7 +3,6 @@ import io
 import logging
 import base64
 
-import curl_cffi
 from mutagen.id3 import (
     ID3,
     TIT2,
@@ -35,7 +34,7 @@ from spotify_dl.format import AudioCodec
 from spotify_dl.model.id3 import ID3Picture
 from spotify_dl.track import ReplayGain, Track
 from spotify_dl.utils.misc import url_build
-from spotify_dl.model.getAlbum_gql import GraphQLResponse
+from spotify_dl.api.web.pathfinder import get_album
 
 
 class MetadataFormat(Enum):
@@ -665,31 +664,12 @@ def apply_metadata(
 
     from spotify_dl.state import state
 
-    res = curl_cffi.post(
-        "https://api-partner.spotify.com/pathfinder/v2/query",
-        json={
-            "variables": {
-                "uri": f"spotify:album:{meta['albumOfTrack']['id']}",
-                "locale": "",
-                "offset": 0,
-                "limit": 1,
-            },
-            "operationName": "getAlbum",
-            "extensions": {
-                "persistedQuery": {
-                    "version": 1,
-                    "sha256Hash": "46ae954ef2d2fe7732b4b2b4022157b2e18b7ea84f70591ceb164e4de1b5d5d3",
-                }
-            },
-        },
-        headers={
-            "authorization": f"Bearer {state.auth.token}",
-            "client-token": state.ensure_clienttoken().token,
-        },
-        impersonate="chrome",
+    album = get_album(
+        f"spotify:album:{meta['albumOfTrack']['id']}",
+        state.auth.token,
+        state.ensure_clienttoken().token,
+        limit=1,
     )
-    res.raise_for_status()
-    album = cast(GraphQLResponse, res.json())["data"]["albumUnion"]
     provider.album_name(album["name"])
     provider.recording_time(album["date"]["isoString"])
 
@@ -0,0 +1,135 @@
+# pyright: reportAny=false, reportExplicitAny=false
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Any, ClassVar
+
+
+class MetadataKind(Enum):
+    # getTrack `TrackUnion`
+    TRACK = "track"
+    # extended-metadata `Metadata.Track`
+    TRACK_INTERNAL = "track_internal"
+    # getAlbum `AlbumUnion` pages
+    ALBUM = "album"
+    # track-playback `MediaResponse`
+    MANIFEST = "manifest"
+
+
+@dataclass
+class MetadataCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total != 0 else 0
+
+
+class MetadataCache:
+    """process-wide metadata keyed by uri, persisted in sqlite so it outlives the command"""
+
+    logger: logging.Logger = logging.getLogger("spdl:metadata_cache")
+    DEFAULT_PATH: Path = Path(".spcache") / "metadata.sqlite3"
+    # seconds
+    TTL: dict[MetadataKind, float] = {
+        MetadataKind.TRACK: 7 * 24 * 60 * 60,
+        # file ids get reencoded every now and then
+        MetadataKind.TRACK_INTERNAL: 24 * 60 * 60,
+        MetadataKind.ALBUM: 7 * 24 * 60 * 60,
+        MetadataKind.MANIFEST: 24 * 60 * 60,
+    }
+
+    _shared: ClassVar["MetadataCache | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path: Path = path or MetadataCache.DEFAULT_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._db: sqlite3.Connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        _ = self._db.execute("PRAGMA journal_mode=WAL")
+        _ = self._db.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                kind TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires REAL NOT NULL,
+                PRIMARY KEY (kind, uri)
+            ) WITHOUT ROWID
+            """)
+        self._stats: dict[MetadataKind, MetadataCacheStats] = {
+            kind: MetadataCacheStats() for kind in MetadataKind
+        }
+        self._lock: threading.Lock = threading.Lock()
+
+        purged = self.purge()
+        if purged:
+            self.logger.debug(f"Purged {purged} expired entries")
+
+    @classmethod
+    def shared(cls) -> "MetadataCache":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get(self, kind: MetadataKind, uri: str) -> bytes | None:
+        with self._lock:
+            row: tuple[bytes, float] | None = self._db.execute(
+                "SELECT value, expires FROM metadata WHERE kind = ? AND uri = ?",
+                (kind.value, uri),
+            ).fetchone()
+
+            stats = self._stats[kind]
+            if row is None or row[1] < time.time():
+                stats.misses += 1
+                return None
+
+            stats.hits += 1
+            return zlib.decompress(row[0])
+
+    def put(self, kind: MetadataKind, uri: str, value: bytes) -> None:
+        with self._lock:
+            _ = self._db.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                (kind.value, uri, zlib.compress(value), time.time() + self.TTL[kind]),
+            )
+
+    def get_json(self, kind: MetadataKind, uri: str) -> Any:
+        value = self.get(kind, uri)
+        return json.loads(value) if value is not None else None
+
+    def put_json(self, kind: MetadataKind, uri: str, value: object) -> None:
+        self.put(kind, uri, json.dumps(value, separators=(",", ":")).encode())
+
+    def invalidate(self, kind: MetadataKind, uri: str) -> None:
+        with self._lock:
+            _ = self._db.execute(
+                "DELETE FROM metadata WHERE kind = ? AND uri = ?", (kind.value, uri)
+            )
+
+    def purge(self) -> int:
+        """drops expired entries, returns how many"""
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM metadata WHERE expires < ?", (time.time(),)
+            ).rowcount
+
+    def stats(self) -> dict[MetadataKind, MetadataCacheStats]:
+        with self._lock:
+            return {
+                kind: MetadataCacheStats(s.hits, s.misses)
+                for kind, s in self._stats.items()
+            }
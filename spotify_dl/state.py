@@ -2,6 +2,7 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Mapping
 
+from spotify_dl.api.internal.ap_session import APSession
 from spotify_dl.api.internal.playplay import PlayPlay
 from spotify_dl.api.internal.spotify_client import SpotifyClient
 from spotify_dl.api.internal.widevine import WidevineClient
@@ -17,12 +18,16 @@ class AppState:
     auth: SpotifyAuthPKCE
     iauth: SpotifyInternalAuth | None = None
     name: str | None = None
+    ap: APSession | None = None
+    # `ap`'s client, reconnecting keeps the same one
     client: SpotifyClient | None = None
     running: bool = True
     last_json_output: Mapping[str, object] | str = field(default_factory=dict)
     dir: Path | None = None
     download_manager: SpotifyDownloadManager = field(
-        default_factory=lambda: SpotifyDownloadManager(concurrent_download=2)
+        default_factory=lambda: SpotifyDownloadManager(
+            concurrent_download=2, max_concurrent_download=8
+        )
     )
     volume: float = 100
     widevine: WidevineClient | None = None
@@ -30,22 +35,31 @@ class AppState:
     login5: Login5Auth | None = None
     clienttoken: ClientToken | None = None
 
-    def ensure_clienttoken(self) -> ClientToken:
+    def ensure_client(self) -> SpotifyClient:
+        if not self.ap:
+            self.ap = APSession(self.auth)
         if not self.client:
-            self.client = SpotifyClient.random_ap(self.auth)
+            self.client = self.ap.client()
+
+        return self.client
+
+    def ensure_ap(self) -> APSession:
+        """logged in, kept alive and reconnected in the background"""
+        _ = self.ensure_client()
+        assert self.ap
+        _ = self.ap.ready()
+
+        return self.ap
+
+    def ensure_clienttoken(self) -> ClientToken:
         if not self.clienttoken:
-            self.clienttoken = ClientToken(self.client)
+            self.clienttoken = ClientToken(self.ensure_client())
 
         return self.clienttoken
 
     def ensure_login5(self) -> Login5Auth:
-        if not self.client:
-            self.client = SpotifyClient.random_ap(self.auth)
-        if not self.clienttoken:
-            self.clienttoken = ClientToken(self.client)
-
         if not self.login5:
-            self.login5 = Login5Auth(self.client, self.clienttoken)
+            self.login5 = Login5Auth(self.ensure_client(), self.ensure_clienttoken())
 
         return self.login5
 
@@ -1,18 +1,28 @@
 # pyright: reportAny=false, reportUnknownMemberType=false
 import io
+import logging
 import math
 import struct
+import threading
+import time
+import weakref
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from Cryptodome.Cipher import AES
+from Cryptodome.Cipher._mode_ctr import CtrMode
 from Cryptodome.Util import Counter
+from collections.abc import Buffer, Iterable, Iterator, Sequence
 from typing import Protocol, Self, override
-from collections import OrderedDict
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
 
+from spotify_dl.blob_store import Blob
+from spotify_dl.cdn_health import CdnHealth
+from spotify_dl.chunk_cache import ChunkCache
+from spotify_dl.journal import ChunkJournal
 from spotify_dl.track import ReplayGain, TrackHeader
+from spotify_dl.utils.http_pool import HttpPool
 
 # TODO: better separation on provider and reader
 # TODO: this is a mess
@@ -22,6 +32,7 @@ class BytesStreamProtocol(Protocol):
     size: int
 
     def read(self, size: int = -1) -> bytes: ...
+    def readinto(self, buffer: Buffer) -> int: ...
     def seek(self, offset: int, whence: int = io.SEEK_SET) -> int: ...
     def tell(self) -> int: ...
     def close(self) -> None: ...
@@ -32,69 +43,475 @@ class ChunkedBytesStreamProtocol(Protocol):
     CHUNK_SIZE: int
 
     def read(self, size: int = -1) -> bytes: ...
+    def readinto(self, buffer: Buffer) -> int: ...
     def seek(self, offset: int, whence: int = io.SEEK_SET) -> int: ...
     def tell(self) -> int: ...
     def close(self) -> None: ...
     def request_chunk(self, chunk_index: int) -> bytes: ...
 
 
+def parse_content_range(header: str) -> tuple[int, int, int]:
+    # bytes <start>-<end>/<size>
+    unit, _, spec = header.partition(" ")
+    span, _, size = spec.partition("/")
+    start, _, end = span.partition("-")
+    if unit != "bytes" or not start or not end or not size.isdigit():
+        raise IOError(f"Malformed Content-Range: {header!r}")
+
+    return int(start), int(end), int(size)
+
+
+def _chunk_views(
+    source: ChunkedBytesStreamProtocol, start: int, length: int
+) -> Iterator[memoryview]:
+    """yields views into the cached chunks covering [start, start + length)"""
+    end = start + length
+    offset = start
+
+    while offset < end:
+        chunk_index = offset // source.CHUNK_SIZE
+        chunk = memoryview(source.request_chunk(chunk_index))
+
+        chunk_start = offset - chunk_index * source.CHUNK_SIZE
+        chunk_end = min(len(chunk), chunk_start + end - offset)
+        if chunk_end <= chunk_start:
+            break
+
+        yield chunk[chunk_start:chunk_end]
+        offset += chunk_end - chunk_start
+
+
+def _join_views(source: ChunkedBytesStreamProtocol, start: int, length: int) -> bytes:
+    return join_views(list(_chunk_views(source, start, length)))
+
+
+def _copy_views(
+    source: ChunkedBytesStreamProtocol, start: int, buffer: Buffer, length: int
+) -> int:
+    return copy_views(_chunk_views(source, start, length), buffer)
+
+
+def join_views(views: Sequence[memoryview]) -> bytes:
+    if (
+        len(views) == 1
+        and isinstance(views[0].obj, bytes)
+        and len(views[0]) == len(views[0].obj)
+    ):
+        # a whole cached chunk, hand it out as is
+        return views[0].obj
+
+    return b"".join(views)
+
+
+def copy_views(views: Iterable[memoryview], buffer: Buffer) -> int:
+    out = memoryview(buffer).cast("B")
+    written = 0
+    for view in views:
+        out[written : written + len(view)] = view
+        written += len(view)
+
+    return written
+
+
+class ReadAhead:
+    EWMA_WEIGHT: float = 0.3
+
+    def __init__(self, chunk_size: int, min_window: int = 1, max_window: int = 8):
+        self.chunk_size: int = chunk_size
+        self.min_window: int = min_window
+        self.max_window: int = max(min_window, max_window)
+        self.window: int = min_window
+
+        # seconds per chunk request, measured on the fetch workers
+        self.fetch_time: float | None = None
+        # bytes per second the reader walks through the stream
+        self.drain_rate: float | None = None
+
+        self._last_chunk: int | None = None
+        self._last_access: float = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def _ewma(self, old: float | None, new: float) -> float:
+        if old is None:
+            return new
+        return old + self.EWMA_WEIGHT * (new - old)
+
+    def record_fetch(self, elapsed: float) -> None:
+        with self._lock:
+            self.fetch_time = self._ewma(self.fetch_time, elapsed)
+
+    def access(self, chunk_index: int, waited: bool) -> int:
+        """returns how many chunks after `chunk_index` should be prefetched"""
+        now = time.monotonic()
+        last = self._last_chunk
+        self._last_chunk = chunk_index
+
+        if last is None:
+            self._last_access = now
+            self.window = self.min_window
+            return self.window
+
+        if chunk_index == last:
+            return self.window
+
+        if chunk_index != last + 1:
+            # random access, prefetching would only fetch bytes nobody reads
+            self._last_access = now
+            self.window = 0
+            return self.window
+
+        elapsed = now - self._last_access
+        self._last_access = now
+        if elapsed > 0:
+            self.drain_rate = self._ewma(self.drain_rate, self.chunk_size / elapsed)
+
+        if waited:
+            # the reader outran us, grow fast
+            self.window = min(self.max_window, max(self.min_window, self.window * 2))
+            return self.window
+
+        with self._lock:
+            fetch_time = self.fetch_time
+
+        if fetch_time is None or self.drain_rate is None:
+            self.window = max(self.window, self.min_window)
+            return self.window
+
+        # enough chunks to keep the reader busy while the next one is in flight
+        target = math.ceil(self.drain_rate * fetch_time / self.chunk_size) + 1
+        target = min(self.max_window, max(self.min_window, target))
+        if self.window < target:
+            self.window += 1
+        elif self.window > target:
+            self.window -= 1
+
+        return self.window
+
+
 class ChunkedStream(ChunkedBytesStreamProtocol):
+    logger: logging.Logger = logging.getLogger("spdl:stream")
     CHUNK_SIZE: int = 128 * 1024
+    # chunks that must outlive eviction and `close()`
+    PINNED_CHUNKS: frozenset[int] = frozenset()
+    # cdns the first request goes out to at once
+    RACE_WIDTH: int = 3
+    # below this a host is given up for a better one, as long as there is one
+    SWITCH_THROUGHPUT: float = 256 * 1024
+    # how much better the other host has to look, so streams don't flap between two
+    SWITCH_MARGIN: float = 1.5
+    # requests in a row that have to be slow before switching
+    SWITCH_MIN_SAMPLES: int = 3
 
-    def __init__(self, url: str, max_cached_chunks: int = 16):
-        self.url: str = url
-        self.session: requests.Session = requests.Session()
-        retry_strategy = Retry(
-            total=5,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"],
-            backoff_factor=1,
-            raise_on_status=False,
-            respect_retry_after_header=True,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
+    def __init__(
+        self,
+        url: str | None,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        reorder_buffer: int | None = None,
+        read_ahead: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+        mirrors: Sequence[str] = (),
+    ):
+        if url is None and blob is None:
+            raise ValueError("Either url or blob is required")
+
+        # the same file on other cdns, whichever is fastest gets used
+        self.urls: list[str] = ([url] if url else []) + [
+            mirror for mirror in mirrors if mirror != url
+        ]
+        self.url: str | None = url
+        self.health: CdnHealth = CdnHealth.shared()
+        self.switches: int = 0
+        self._failed: set[str] = set()
+        # per request throughput from the current host
+        self._recent: deque[float] = deque(maxlen=self.SWITCH_MIN_SAMPLES)
+        self._switch_lock: threading.Lock = threading.Lock()
+        # a locally stored copy, the network is never touched
+        self.blob: Blob | None = blob
+        # shared by every stream so connections to the cdn outlive a single track
+        self.session: requests.Session = HttpPool.shared().session
+
+        self.size: int
+        head: bytes | None = None
+        if self.blob:
+            self.size = self.blob.size
+        else:
+            # the size comes with the first chunk, which is kept instead of
+            # being fetched a second time
+            self.url, head, self.size = self._race_head()
+        self.total_chunks: int = math.ceil(self.size / self.CHUNK_SIZE)
 
-        res = self.session.get(url, headers={"Range": f"bytes=0-1024"})
-        res.raise_for_status()
+        self.journal: ChunkJournal | None = journal
+        if self.journal:
+            self.journal.open(self.size)
 
-        self.size: int = int(res.headers["Content-Range"].split("/")[-1])
-        self.total_chunks: int = math.ceil(self.size / self.CHUNK_SIZE)
+        self.cache: ChunkCache = cache or ChunkCache.shared()
+        self._cache_owner: int = self.cache.new_owner()
+        _ = weakref.finalize(self, self.cache.drop, self._cache_owner)
 
-        self._cache: OrderedDict[int, bytes] = OrderedDict()
-        self.max_cached_chunks: int = max_cached_chunks
+        # chunks fetched ahead of the reader, possibly completing out of order.
+        # they only enter the cache once the reader asks for them
+        self.max_inflight: int = max(1, max_inflight)
+        self.reorder_buffer: int = max(
+            reorder_buffer or 2 * self.max_inflight, self.max_inflight
+        )
+        self._pending: dict[int, Future[bytes]] = {}
+        # whether `_submit` futures already went through `_process_chunk`
+        self._pending_processed: bool = False
+        self._executor: ThreadPoolExecutor | None = (
+            ThreadPoolExecutor(
+                max_workers=self.max_inflight, thread_name_prefix="chunk_fetch"
+            )
+            if self.max_inflight > 1 or read_ahead
+            else None
+        )
+        self.read_ahead: ReadAhead | None = (
+            ReadAhead(self.CHUNK_SIZE, max_window=self.reorder_buffer)
+            if read_ahead
+            else None
+        )
 
         self.pos: int = 0
         self.closed: bool = False
 
+        if head is not None:
+            if self.journal:
+                self.journal.write(0, head)
+            self._store(0, self._process_chunk(0, head))
+
     def __enter__(self) -> Self:
         return self
 
     def __exit__(self, *_) -> None:
         self.close()
 
+    def _get_head(self, url: str) -> tuple[bytes, int]:
+        started = time.monotonic()
+        try:
+            res = self.session.get(
+                url, headers={"Range": f"bytes=0-{self.CHUNK_SIZE - 1}"}
+            )
+            res.raise_for_status()
+
+            start, _, size = parse_content_range(res.headers.get("Content-Range", ""))
+            head = res.content
+            if start != 0 or len(head) != min(self.CHUNK_SIZE, size):
+                raise IOError(
+                    f"Expected the first {min(self.CHUNK_SIZE, size)} bytes, got {len(head)} at {start}"
+                )
+        except IOError:
+            self.health.record_failure(url)
+            raise
+
+        self.health.record(url, len(head), time.monotonic() - started)
+        return head, size
+
+    def _race_head(self) -> tuple[str, bytes, int]:
+        """the first chunk is asked from the best `RACE_WIDTH` cdns at once, the first full answer wins"""
+        candidates = self.health.rank(self.urls)
+        error: IOError | None = None
+
+        for i in range(0, len(candidates), self.RACE_WIDTH):
+            group = candidates[i : i + self.RACE_WIDTH]
+            if len(group) == 1:
+                try:
+                    return group[0], *self._get_head(group[0])
+                except IOError as e:
+                    error = e
+                    continue
+
+            # the losers finish in the background, their timings still count
+            executor = ThreadPoolExecutor(
+                max_workers=len(group), thread_name_prefix="cdn_race"
+            )
+            futures = {executor.submit(self._get_head, url): url for url in group}
+            executor.shutdown(wait=False)
+
+            for future in as_completed(futures):
+                try:
+                    head, size = future.result()
+                except IOError as e:
+                    self.logger.debug(f"{CdnHealth.host(futures[future])} failed: {e}")
+                    error = e
+                    continue
+
+                self.logger.debug(
+                    f"{CdnHealth.host(futures[future])} won the race of {len(group)}"
+                )
+                return futures[future], head, size
+
+        assert error is not None
+        raise error
+
+    def _switch(
+        self,
+        current: str,
+        reason: str,
+        failed: bool = False,
+        throughput: float | None = None,
+    ) -> bool:
+        """moves the remaining chunks to the best other cdn, false if there is none worth it"""
+        with self._switch_lock:
+            if failed:
+                self._failed.add(current)
+            if self.url != current:
+                # another fetch worker got here first
+                return self.url not in self._failed
+
+            alternatives = [
+                url
+                for url in self.health.rank(self.urls)
+                if url != current and url not in self._failed
+            ]
+            if not alternatives:
+                return False
+            if not failed and self.health.score(
+                alternatives[0]
+            ) < self.SWITCH_MARGIN * (
+                throughput if throughput is not None else self.health.score(current)
+            ):
+                return False
+
+            self.logger.info(
+                f"Switching {CdnHealth.host(current)} -> {CdnHealth.host(alternatives[0])} ({reason})"
+            )
+            self.url = alternatives[0]
+            self.switches += 1
+            self._recent.clear()
+            return True
+
     @override
     def request_chunk(self, chunk_index: int) -> bytes:
         if not (0 <= chunk_index < self.total_chunks):
             raise IndexError(f"Chunk index {chunk_index} out of range")
 
-        if chunk_index in self._cache:
-            self._cache.move_to_end(chunk_index)
-            return self._cache[chunk_index]
+        data = self.cache.get(self._cache_owner, chunk_index)
+        if data is not None:
+            if self._executor and self.read_ahead:
+                ahead = self.read_ahead.access(chunk_index, waited=False)
+                if ahead > 0:
+                    self._schedule(chunk_index, ahead)
+            return data
+
+        if not self._executor:
+            data = self._process_chunk(chunk_index, self._fetch_chunk(chunk_index))
+            self._store(chunk_index, data)
+            return data
+
+        future = self._pending.get(chunk_index)
+        waited = future is None or not future.done()
+        ahead = (
+            self.read_ahead.access(chunk_index, waited)
+            if self.read_ahead
+            else self.reorder_buffer - 1
+        )
+        self._schedule(chunk_index, ahead)
+        run = [self._pending.pop(chunk_index).result()]
+
+        if self._pending_processed:
+            self._store(chunk_index, run[0])
+            return run[0]
+
+        # chunks that already arrived right behind this one are processed in one pass
+        while (
+            (future := self._pending.get(chunk_index + len(run))) is not None
+            and future.done()
+            and future.exception() is None
+        ):
+            run.append(self._pending.pop(chunk_index + len(run)).result())
+
+        processed = self._process_run(chunk_index, run)
+        for idx, data in enumerate(processed, chunk_index):
+            self._store(idx, data)
+
+        return processed[0]
+
+    def _store(self, chunk_index: int, data: bytes) -> None:
+        self.cache.put(
+            self._cache_owner,
+            chunk_index,
+            data,
+            pin=chunk_index in self.PINNED_CHUNKS,
+        )
 
+    def _process_chunk(self, chunk_index: int, data: bytes) -> bytes:
+        return data
+
+    def _process_run(self, first_chunk: int, chunks: list[bytes]) -> list[bytes]:
+        return [
+            self._process_chunk(chunk_index, data)
+            for chunk_index, data in enumerate(chunks, first_chunk)
+        ]
+
+    def _fetch_chunk(self, chunk_index: int) -> bytes:
         start = chunk_index * self.CHUNK_SIZE
         end = min(start + self.CHUNK_SIZE, self.size) - 1
-        resp = self.session.get(self.url, headers={"Range": f"bytes={start}-{end}"})
-        resp.raise_for_status()
-        data = resp.content
 
-        self._cache[chunk_index] = data
-        if self.max_cached_chunks > 0 and len(self._cache) > self.max_cached_chunks:
-            _ = self._cache.popitem(last=False)
+        if self.blob:
+            return self.blob.read(start, end - start + 1)
+        if self.journal and (data := self.journal.read(chunk_index)) is not None:
+            return data
+
+        url = self.url
+        assert url is not None
+
+        started = time.monotonic()
+        try:
+            resp = self.session.get(url, headers={"Range": f"bytes={start}-{end}"})
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            self.health.record_failure(url)
+            if not self._switch(url, str(e), failed=True):
+                raise
+            return self._fetch_chunk(chunk_index)
+
+        elapsed = time.monotonic() - started
+        if self.read_ahead:
+            self.read_ahead.record_fetch(elapsed)
+
+        data = resp.content
+        self.health.record(url, len(data), elapsed)
+        if elapsed > 0 and url == self.url:
+            self._recent.append(len(data) / elapsed)
+            # the host's own average reacts too slowly to a sudden drop
+            if (
+                len(self._recent) == self.SWITCH_MIN_SAMPLES
+                and (throughput := max(self._recent)) < self.SWITCH_THROUGHPUT
+            ):
+                _ = self._switch(
+                    url, f"{throughput / 1024:.0f} KiB/s", throughput=throughput
+                )
+        if self.journal:
+            # never persist something that isn't exactly the chunk we asked for
+            got = parse_content_range(resp.headers.get("Content-Range", ""))
+            if got != (start, end, self.size) or len(data) != end - start + 1:
+                raise IOError(
+                    f"Expected bytes {start}-{end}/{self.size}, got {got} with {len(data)} bytes"
+                )
+            self.journal.write(chunk_index, data)
 
         return data
 
+    def _schedule(self, chunk_index: int, ahead: int) -> None:
+        assert self._executor
+
+        keep_end = chunk_index + self.reorder_buffer
+        window_end = min(chunk_index + 1 + ahead, keep_end, self.total_chunks)
+
+        # the reader moved away (seek), drop whatever it won't ask for anymore
+        for idx in [i for i in self._pending if not chunk_index <= i < keep_end]:
+            _ = self._pending.pop(idx).cancel()
+
+        for idx in range(chunk_index, window_end):
+            if idx in self._pending or self.cache.contains(self._cache_owner, idx):
+                continue
+            self._pending[idx] = self._submit(idx)
+
+    def _submit(self, chunk_index: int) -> Future[bytes]:
+        assert self._executor
+        return self._executor.submit(self._fetch_chunk, chunk_index)
+
     @override
     def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
         if whence == io.SEEK_SET:
@@ -127,88 +544,217 @@ class ChunkedStream(ChunkedBytesStreamProtocol):
             return b""
 
         to_read = min(size, self.size - self.pos)
-        start_chunk = self.pos // self.CHUNK_SIZE
-        end_chunk = (self.pos + to_read - 1) // self.CHUNK_SIZE
+        data = _join_views(self, self.pos, to_read)
 
-        parts = bytearray()
-        remaining = to_read
-        offset = self.pos
+        self.pos += len(data)
+        return data
 
-        for chunk_index in range(start_chunk, end_chunk + 1):
-            chunk_data = self.request_chunk(chunk_index)
+    @override
+    def readinto(self, buffer: Buffer) -> int:
+        if self.closed:
+            raise IOError("I/O operation on closed file.")
 
-            chunk_start = max(0, offset - chunk_index * self.CHUNK_SIZE)
-            chunk_end = min(len(chunk_data), chunk_start + remaining)
-            parts.extend(chunk_data[chunk_start:chunk_end])
+        to_read = min(memoryview(buffer).nbytes, self.size - self.pos)
+        if to_read <= 0:
+            return 0
 
-            read_len = chunk_end - chunk_start
-            remaining -= read_len
-            offset += read_len
+        read = _copy_views(self, self.pos, buffer, to_read)
 
-        self.pos += to_read
-        return bytes(parts)
+        self.pos += read
+        return read
 
     @override
     def close(self) -> None:
         if not self.closed:
-            self.session.close()
-            self._cache.clear()
+            if self._executor:
+                for future in self._pending.values():
+                    _ = future.cancel()
+                self._pending.clear()
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self.journal:
+                self.journal.close()
+            if self.blob:
+                self.blob.close()
+            self.cache.drop(self._cache_owner, keep_pinned=True)
             self.closed = True
 
+    def drop_cache(self) -> None:
+        """frees the pinned chunks as well, once nothing is going to read the header anymore"""
+        self.cache.drop(self._cache_owner)
+
+
+class CTRDecryptor:
+    def __init__(self, key: bytes, iv: int, chunk_size: int) -> None:
+        if chunk_size % AES.block_size != 0:
+            raise ValueError(f"Chunk size must be a multiple of {AES.block_size}")
+
+        self.key: bytes = key
+        self.iv: int = iv
+        self.chunk_size: int = chunk_size
+
+        # the keystream of the last call, reused when the next call continues it
+        self._cipher: CtrMode | None = None
+        self._next_block: int = -1
+        self._lock: threading.Lock = threading.Lock()
+
+    def _cipher_at(self, block: int) -> CtrMode:
+        if self._cipher is None or self._next_block != block:
+            self._cipher = AES.new(
+                self.key,
+                AES.MODE_CTR,
+                counter=Counter.new(128, initial_value=self.iv + block),
+            )
+            self._next_block = block
+
+        return self._cipher
+
+    def _decrypt(self, block: int, data: bytes) -> bytes:
+        cipher = self._cipher_at(block)
+        plaintext = cipher.decrypt(data)
+
+        if len(data) % AES.block_size == 0:
+            self._next_block = block + len(data) // AES.block_size
+        else:
+            # a partial block can only be the end of the file
+            self._cipher = None
+
+        return plaintext
+
+    def decrypt(self, chunk_index: int, data: bytes) -> bytes:
+        with self._lock:
+            return self._decrypt(chunk_index * self.chunk_size // AES.block_size, data)
+
+    def decrypt_run(self, first_chunk: int, chunks: list[bytes]) -> list[bytes]:
+        """decrypts contiguous chunks with a single keystream"""
+        with self._lock:
+            block = first_chunk * self.chunk_size // AES.block_size
+            plaintexts: list[bytes] = []
+            for data in chunks:
+                plaintexts.append(self._decrypt(block, data))
+                block += len(data) // AES.block_size
+
+            return plaintexts
+
 
 class EncryptedStream(ChunkedStream):
     def __init__(
         self,
-        url: str,
+        url: str | None,
         key: bytes,
         iv: int,
-        max_cached_chunks: int = 16,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        read_ahead: bool = False,
+        decrypt_in_worker: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+        mirrors: Sequence[str] = (),
     ) -> None:
-        super().__init__(url, max_cached_chunks)
-
         self.key: bytes = key
-        self.decrypted_chunk_buffer: OrderedDict[int, bytes] = OrderedDict()
         self.iv: int = iv
+        self.decryptor: CTRDecryptor | None = (
+            CTRDecryptor(key, iv, self.CHUNK_SIZE) if key else None
+        )
+
+        super().__init__(
+            url,
+            cache,
+            max_inflight,
+            read_ahead=read_ahead,
+            journal=journal,
+            blob=blob,
+            mirrors=mirrors,
+        )
+
+        # a single thread so chunks are decrypted in the order they were
+        # scheduled and keep reusing one keystream, while the reader and the
+        # fetch workers carry on
+        self._decrypt_executor: ThreadPoolExecutor | None = None
+        if self.decryptor and self._executor and decrypt_in_worker:
+            self._decrypt_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="chunk_decrypt"
+            )
+            self._pending_processed = True
 
     def decrypt_chunk(self, chunk: int, encrypted: bytes) -> bytes:
-        if not self.key:
+        if not self.decryptor:
             return encrypted
 
-        blocks_before = (chunk * self.CHUNK_SIZE) // AES.block_size
-        ctr = Counter.new(128, initial_value=self.iv + blocks_before)
-        cipher = AES.new(self.key, AES.MODE_CTR, counter=ctr)
-        return cipher.decrypt(encrypted)
+        return self.decryptor.decrypt(chunk, encrypted)
 
     @override
-    def request_chunk(self, chunk_index: int) -> bytes:
-        encrypted = super().request_chunk(chunk_index)
-        if chunk_index in self.decrypted_chunk_buffer:
-            return self.decrypted_chunk_buffer[chunk_index]
+    def _process_chunk(self, chunk_index: int, data: bytes) -> bytes:
+        # only the plaintext is cached
+        return self.decrypt_chunk(chunk_index, data)
 
-        plaintext = self.decrypt_chunk(chunk_index, encrypted)
-        self.decrypted_chunk_buffer[chunk_index] = plaintext
+    @override
+    def _process_run(self, first_chunk: int, chunks: list[bytes]) -> list[bytes]:
+        if not self.decryptor:
+            return chunks
 
-        return plaintext
+        return self.decryptor.decrypt_run(first_chunk, chunks)
+
+    @override
+    def _submit(self, chunk_index: int) -> Future[bytes]:
+        fetch = super()._submit(chunk_index)
+        if not self._decrypt_executor:
+            return fetch
+
+        return self._decrypt_executor.submit(
+            lambda: self.decrypt_chunk(chunk_index, fetch.result())
+        )
+
+    @override
+    def close(self) -> None:
+        if self._decrypt_executor:
+            self._decrypt_executor.shutdown(wait=False, cancel_futures=True)
+            self._decrypt_executor = None
+            self._pending_processed = False
+        super().close()
 
 
 class DecryptedSpotifyStream(EncryptedStream):
     AUDIO_IV: int = 152697175058892756956149811227012566419
+    REPLAYGAIN_OFFSET: int = 144
+    # `read_header` is called after the download is done and the stream closed
+    PINNED_CHUNKS: frozenset[int] = frozenset({0})
 
-    def __init__(self, url: str, key: bytes, max_cached_chunks: int = 16) -> None:
-        super().__init__(url, key, self.AUDIO_IV, max_cached_chunks=max_cached_chunks)
+    def __init__(
+        self,
+        url: str | None,
+        key: bytes,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        read_ahead: bool = False,
+        decrypt_in_worker: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+        mirrors: Sequence[str] = (),
+    ) -> None:
+        super().__init__(
+            url,
+            key,
+            self.AUDIO_IV,
+            cache=cache,
+            max_inflight=max_inflight,
+            read_ahead=read_ahead,
+            decrypt_in_worker=decrypt_in_worker,
+            journal=journal,
+            blob=blob,
+            mirrors=mirrors,
+        )
 
     def _read_rg(self) -> ReplayGain:
-        pos = self.pos
-        _ = self.seek(144)
-        rg = ReplayGain(
-            track_gain_db=struct.unpack("<f", self.read(4))[0],
-            track_peak=struct.unpack("<f", self.read(4))[0],
-            album_gain_db=struct.unpack("<f", self.read(4))[0],
-            album_peak=struct.unpack("<f", self.read(4))[0],
+        track_gain_db, track_peak, album_gain_db, album_peak = struct.unpack_from(
+            "<ffff", self.request_chunk(0), self.REPLAYGAIN_OFFSET
+        )
+        return ReplayGain(
+            track_gain_db=track_gain_db,
+            track_peak=track_peak,
+            album_gain_db=album_gain_db,
+            album_peak=album_peak,
         )
-
-        _ = self.seek(pos)
-        return rg
 
     def read_header(self) -> TrackHeader:
         return TrackHeader(
@@ -217,8 +763,25 @@ class DecryptedSpotifyStream(EncryptedStream):
 
 
 class EncryptedSpotifyStream(ChunkedStream):
-    def __init__(self, url: str, max_cached_chunks: int = 16) -> None:
-        super().__init__(url, max_cached_chunks=max_cached_chunks)
+    def __init__(
+        self,
+        url: str | None,
+        cache: ChunkCache | None = None,
+        max_inflight: int = 1,
+        read_ahead: bool = False,
+        journal: ChunkJournal | None = None,
+        blob: Blob | None = None,
+        mirrors: Sequence[str] = (),
+    ) -> None:
+        super().__init__(
+            url,
+            cache=cache,
+            max_inflight=max_inflight,
+            read_ahead=read_ahead,
+            journal=journal,
+            blob=blob,
+            mirrors=mirrors,
+        )
 
 
 class ChunkedStreamReader:
@@ -259,30 +822,25 @@ class ChunkedStreamReader:
         if self.pos >= logical_end or size == 0:
             return b""
 
-        to_read = size
-        start_byte = self.offset + self.pos
-        end_byte = start_byte + to_read
-
-        start_chunk = start_byte // self.source.CHUNK_SIZE
-        end_chunk = (end_byte - 1) // self.source.CHUNK_SIZE
+        data = _join_views(self.source, self.offset + self.pos, size)
 
-        parts = bytearray()
-        remaining = to_read
-        offset = start_byte
+        self.pos += len(data)
+        return data
 
-        for chunk_index in range(start_chunk, end_chunk + 1):
-            chunk_data = self.source.request_chunk(chunk_index)
+    def readinto(self, buffer: Buffer) -> int:
+        if self.closed:
+            raise IOError("I/O operation on closed reader")
 
-            chunk_start = max(0, offset - chunk_index * self.source.CHUNK_SIZE)
-            chunk_end = min(len(chunk_data), chunk_start + remaining)
-            parts.extend(chunk_data[chunk_start:chunk_end])
+        to_read = min(
+            memoryview(buffer).nbytes, self.source.size - self.offset - self.pos
+        )
+        if to_read <= 0:
+            return 0
 
-            read_len = chunk_end - chunk_start
-            remaining -= read_len
-            offset += read_len
+        read = _copy_views(self.source, self.offset + self.pos, buffer, to_read)
 
-        self.pos += to_read
-        return bytes(parts)
+        self.pos += read
+        return read
 
     def close(self) -> None:
         self.closed = True
@@ -7,23 +7,16 @@ from typing import Self, TypedDict, cast
 from urllib.parse import urlparse
 from dataclasses import dataclass
 
-import curl_cffi
-
-from spotify_dl.api.internal.proto.extension_kind_pb2 import ExtensionKind
-from spotify_dl.api.internal.spotify_client import SpotifyClient
-from spotify_dl.api.web.apresolve import get_random_spclient
-from spotify_dl.auth.clienttoken import ClientToken
+from spotify_dl.api.internal.extended_metadata import MetadataBatcher
+from spotify_dl.api.web.apresolve import with_best_spclient
+from spotify_dl.api.web.pathfinder import GET_TRACK_HASH, get_album_track_uris, query
+from spotify_dl.api.web.web_api import get_artist_album_uris, get_playlist_track_uris
 from spotify_dl.auth.web_auth import SpotifyAuthPKCE
 from spotify_dl.format import AudioFormat
+from spotify_dl.metadata_cache import MetadataCache, MetadataKind
 from spotify_dl.model.getTrack_gql import GraphQLResponse, TrackUnion
 from spotify_dl.model.web import ManifestFileMP4, MediaResponse
 from spotify_dl.utils.bytes_stuff import to_bytes
-from spotify_dl.api.internal.proto.extended_metadata_pb2 import (
-    EntityRequest,
-    BatchedEntityRequest,
-    ExtensionQuery,
-    BatchedExtensionResponse,
-)
 from spotify_dl.api.internal.proto import metadata_pb2 as Metadata
 
 
@@ -46,6 +39,10 @@ class Track:
         UNKNOWN = auto()
 
     BASE62_LEN: int = 22
+    MP4_QUALITY: dict[int, AudioFormat.Type] = {
+        128000: AudioFormat.Type.MP4_128,
+        256000: AudioFormat.Type.MP4_256,
+    }
 
     def __init__(self, id_base62: str, id_base16: str, type: Type) -> None:
         # used by web api (e.g. track url)
@@ -54,7 +51,7 @@ class Track:
         self.id_b16: str = id_base16
         self.type: Track.Type = type
 
-        # TODO: global caching system
+        # per instance on top of `MetadataCache`, which outlives the command
         self._metadata: TrackUnion | None = None
         self._metadata_internal: Metadata.Track | None = None
         self._manifest: MediaResponse | None = None
@@ -75,14 +72,24 @@ class Track:
         if self._manifest:
             return get()
 
-        res = auth.session.get(
-            f"https://{get_random_spclient()[0]}/track-playback/v1/media/{uri}?manifestFileFormat=file_ids_mp4"
+        cache = MetadataCache.shared()
+        self._manifest = cast(
+            MediaResponse | None, cache.get_json(MetadataKind.MANIFEST, uri)
+        )
+        if self._manifest:
+            return get()
+
+        res = with_best_spclient(
+            lambda host: auth.session.get(
+                f"https://{host}/track-playback/v1/media/{uri}?manifestFileFormat=file_ids_mp4"
+            )
         )
         res.raise_for_status()
 
         self._manifest = cast(
             MediaResponse, res.json()  # pyright: ignore[reportUnknownMemberType]
         )
+        cache.put_json(MetadataKind.MANIFEST, uri, self._manifest)
         return get()
 
     def get_metadata_internal(
@@ -92,65 +99,84 @@ class Track:
         if self._metadata_internal:
             return self._metadata_internal
 
-        query = ExtensionQuery(extension_kind=ExtensionKind.TRACK_V4)
-        req = EntityRequest(entity_uri=f"spotify:track:{self.id_b62}", query=[query])
-        batched_req = BatchedEntityRequest(entity_request=[req])
-        res = auth.session.post(
-            "https://spclient.wg.spotify.com/extended-metadata/v0/extended-metadata",
-            headers={"Content-Type": "application/x-protobuf"},
-            data=batched_req.SerializeToString(),
-        )
-        res.raise_for_status()
-
-        batched_res = BatchedExtensionResponse()
-        _ = batched_res.ParseFromString(res.content)
-
-        data = batched_res.extended_metadata[0].extension_data[0].extension_data.value
-
-        self._metadata_internal = Metadata.Track()
-        _ = self._metadata_internal.ParseFromString(data)
+        uri = f"spotify:track:{self.id_b62}"
+        cache = MetadataCache.shared()
+        data = cache.get(MetadataKind.TRACK_INTERNAL, uri)
+        if data is not None:
+            self._metadata_internal = Metadata.Track()
+            _ = self._metadata_internal.ParseFromString(data)
+            return self._metadata_internal
 
+        # concurrent workers asking at the same time share one request
+        self._metadata_internal = MetadataBatcher.shared().get_track(auth.session, uri)
+        cache.put(
+            MetadataKind.TRACK_INTERNAL,
+            uri,
+            self._metadata_internal.SerializeToString(),
+        )
         return self._metadata_internal
 
+    @classmethod
+    def prefetch_metadata_internal(
+        cls, tracks: "list[Track]", auth: SpotifyAuthPKCE
+    ) -> None:
+        """fills `get_metadata_internal` for every track with one request per `BATCH_SIZE` tracks"""
+        cache = MetadataCache.shared()
+        missing: dict[str, Track] = {}
+        for track in tracks:
+            if track._metadata_internal:
+                continue
+
+            uri = f"spotify:track:{track.id_b62}"
+            data = cache.get(MetadataKind.TRACK_INTERNAL, uri)
+            if data is None:
+                missing[uri] = track
+                continue
+
+            track._metadata_internal = Metadata.Track()
+            _ = track._metadata_internal.ParseFromString(data)
+
+        if not missing:
+            return
+
+        fetched = MetadataBatcher.shared().get_tracks(auth.session, list(missing))
+        for uri, metadata in fetched.items():
+            if uri in missing:
+                missing[uri]._metadata_internal = metadata
+                cache.put(
+                    MetadataKind.TRACK_INTERNAL, uri, metadata.SerializeToString()
+                )
+
     def get_metadata(self) -> TrackUnion:
         from spotify_dl.state import state
 
         if self._metadata:
             return self._metadata
 
-        if not state.client:
-            state.client = SpotifyClient.random_ap(state.auth)
-
-        if not state.clienttoken:
-            state.clienttoken = ClientToken(state.client)
-
-        res = curl_cffi.post(
-            "https://api-partner.spotify.com/pathfinder/v2/query",
-            json={
-                "variables": {"uri": f"spotify:track:{self.id_b62}"},
-                "operationName": "getTrack",
-                "extensions": {
-                    "persistedQuery": {
-                        "version": 1,
-                        "sha256Hash": "d208301e63ccb8504831114cb8db1201636a016187d7c832c8c00933e2cd64c6",
-                    }
-                },
-            },
-            headers={
-                "authorization": f"Bearer {state.auth.token}",
-                "client-token": state.ensure_clienttoken().token,
-            },
-            impersonate="chrome",
+        uri = f"spotify:track:{self.id_b62}"
+        cache = MetadataCache.shared()
+        self._metadata = cast(
+            TrackUnion | None, cache.get_json(MetadataKind.TRACK, uri)
         )
-        res.raise_for_status()
+        if self._metadata:
+            return self._metadata
+
         json = cast(
-            GraphQLResponse, res.json()  # pyright: ignore[reportUnknownMemberType]
+            GraphQLResponse,
+            query(
+                "getTrack",
+                GET_TRACK_HASH,
+                {"uri": uri},
+                state.auth.token,
+                state.ensure_clienttoken().token,
+            ),
         )
 
         self._metadata = json["data"]["trackUnion"]
+        cache.put_json(MetadataKind.TRACK, uri, self._metadata)
         return self._metadata
 
-    def get_formats(self, auth: SpotifyAuthPKCE) -> list[AudioFormat]:
+    def _file_formats(self, auth: SpotifyAuthPKCE) -> list[AudioFormat]:
         metadata = self.get_metadata_internal(auth)
 
         files: list[Metadata.AudioFile] = list(metadata.file) or list(
@@ -159,13 +185,6 @@ class Track:
         if not files:
             raise ValueError("Expecting a list of files")
 
-        mp4s = self.get_mp4_manifest(auth, self.id_b62)
-
-        MP4_QUALITY = {
-            128000: AudioFormat.Type.MP4_128,
-            256000: AudioFormat.Type.MP4_256,
-        }
-
         return [
             AudioFormat(
                 AudioFormat.Type.from_proto(file.format),
@@ -173,24 +192,76 @@ class Track:
                 binascii.hexlify(metadata.gid).decode(),
             )
             for file in files
-        ] + [
+        ]
+
+    def _mp4_formats(self, auth: SpotifyAuthPKCE) -> list[AudioFormat]:
+        metadata = self.get_metadata_internal(auth)
+        mp4s = self.get_mp4_manifest(auth, self.id_b62)
+
+        return [
             AudioFormat(
-                MP4_QUALITY[mp4["bitrate"]],
+                self.MP4_QUALITY[mp4["bitrate"]],
                 mp4["file_id"],
                 binascii.hexlify(metadata.gid).decode(),
             )
             for mp4 in mp4s
         ]
 
+    def get_formats(self, auth: SpotifyAuthPKCE) -> list[AudioFormat]:
+        return self._file_formats(auth) + self._mp4_formats(auth)
+
     def get_format(
         self,
         auth: SpotifyAuthPKCE,
         target_format: AudioFormat.Type,
     ) -> AudioFormat | None:
-        for format in self.get_formats(auth):
+        # the manifest is another request, only worth it when asked for an mp4
+        formats = self._file_formats(auth)
+        if target_format in self.MP4_QUALITY.values():
+            formats += self._mp4_formats(auth)
+
+        for format in formats:
             if format.type == target_format:
                 return format
 
+    def expand(self, auth: SpotifyAuthPKCE) -> "list[Track]":
+        """the tracks of an album, playlist or artist, or just this track"""
+        from spotify_dl.state import state
+
+        match self.type:
+            case Track.Type.ALBUM:
+                uris = get_album_track_uris(
+                    f"spotify:album:{self.id_b62}",
+                    state.auth.token,
+                    state.ensure_clienttoken().token,
+                )
+            case Track.Type.PLAYLIST:
+                uris = get_playlist_track_uris(auth.session, self.id_b62)
+            case Track.Type.ARTIST:
+                uris = []
+                for album in get_artist_album_uris(auth.session, self.id_b62):
+                    uris += get_album_track_uris(
+                        album, state.auth.token, state.ensure_clienttoken().token
+                    )
+            case Track.Type.TRACK | Track.Type.UNKNOWN:
+                return [self]
+            case _:
+                raise ValueError(f"Cannot download a {self.type.name.lower()}")
+
+        tracks: list[Track] = []
+        seen: set[str] = set()
+        for uri in uris:
+            try:
+                track = type(self).from_uri(uri)
+            except ValueError as e:
+                # local files in a playlist, among others
+                self.logger.warning(f"Skipping {uri}: {e}")
+                continue
+            if track.type == Track.Type.TRACK and track.id_b62 not in seen:
+                seen.add(track.id_b62)
+                tracks.append(track)
+        return tracks
+
     def set_format(self, format: AudioFormat) -> None:
         self.format = format
 
@@ -198,7 +269,7 @@ class Track:
     def probe(cls, s: str) -> Self:
         if s.startswith("spotify:"):
             return cls.from_uri(s)
-        elif re.match(r"^https?://.*/track/.*$", s):
+        elif re.match(r"^https?://.*/(track|album|playlist|artist|show|episode)/.*$", s):
             return cls.from_url(s)
         elif len(s) == cls.BASE62_LEN:
             return cls.from_base62(s)
@@ -208,22 +279,23 @@ class Track:
     @classmethod
     def from_url(cls, url: str) -> Self:
         # https://open.spotify.com/track/abcdef?si=abcdef
+        # https://open.spotify.com/intl-de/album/abcdef
 
         url_parts = urlparse(url)
         parts = url_parts.path.removeprefix("/").split("/")
 
-        id = ""
-        type = Track.Type.UNKNOWN
-
-        try:
-            if parts[0] != "track":
-                raise ValueError("Expected <spotify>/track/<id> from url")
+        for i, part in enumerate(parts[:-1]):
+            try:
+                type = Track.Type[part.upper()]
+            except KeyError:
+                continue
+            if type in (Track.Type.LOCAL, Track.Type.UNKNOWN):
+                continue
 
-            id = parts[1]
-        except IndexError:
-            raise ValueError(f"Invalid URL: {url}")
+            id = parts[i + 1]
+            return cls(id, cls.decode_base62(id), type)
 
-        return cls(id, cls.decode_base62(id), type)
+        raise ValueError(f"Invalid URL: {url}")
 
     @classmethod
     def from_uri(cls, uri: str) -> Self:
@@ -23,13 +23,18 @@ class SocketConnection:
         self.buf: io.BytesIO = io.BytesIO()
 
     def close(self) -> None:
+        try:
+            # wakes up a thread blocked in `read`, `close` alone doesn't
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
 
     def flush(self) -> None:
         _ = self.buf.seek(0)
         buf = self.buf.read()
         self.logger.debug(f"SEND [{len(buf):<5}]: {buf}")
-        _ = self.sock.send(buf)
+        self.sock.sendall(buf)
 
         self.clear_buf()
 
@@ -40,7 +45,13 @@ class SocketConnection:
             self.sock.settimeout(timeout)
 
     def read(self, length: int) -> bytes:
+        """short only once the connection is closed"""
         buf = self.sock.recv(length)
+        while buf and len(buf) < length:
+            more = self.sock.recv(length - len(buf))
+            if not more:
+                break
+            buf += more
 
         self.logger.debug(f"RECV [{len(buf):>5} of {length:<5} requested]: {buf}")
 
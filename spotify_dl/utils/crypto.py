@@ -1,8 +1,39 @@
+import ctypes
+import logging
 import os
 import struct
 
+from pathlib import Path
+
 from .bytes_stuff import to_bytes
 
+logger = logging.getLogger("spdl:crypto")
+
+_native_path = Path(__file__).parent / "shannon" / "shannon.so"
+_native: ctypes.CDLL | None = None
+if _native_path.exists():
+    try:
+        _native = ctypes.CDLL(str(_native_path))
+        _native.shn_crypt_words.restype = ctypes.c_uint32
+        _native.shn_crypt_words.argtypes = (
+            ctypes.POINTER(ctypes.c_uint32),
+            ctypes.POINTER(ctypes.c_uint32),
+            ctypes.c_uint32,
+            ctypes.c_void_p,
+            ctypes.c_size_t,
+            ctypes.c_int,
+        )
+        _native.shn_cycles.restype = ctypes.c_uint32
+        _native.shn_cycles.argtypes = (
+            ctypes.POINTER(ctypes.c_uint32),
+            ctypes.c_uint32,
+            ctypes.c_size_t,
+        )
+    # AttributeError: built from an older shannon.c
+    except (OSError, AttributeError) as e:
+        logger.warning(f"Could not load {_native_path}, using the python Shannon: {e}")
+        _native = None
+
 
 class DHKey:
     PRIME: int = (
@@ -20,7 +51,9 @@ class DHKey:
         return to_bytes(pow(int.from_bytes(remote_key), self.private, self.PRIME))
 
 
-class Shannon:
+class ShannonReference:
+    """straight port of the reference implementation, `Shannon` is checked against it"""
+
     n: int = 16
     fold: int = n
     initkonst: int = 0x6996C53A
@@ -250,3 +283,232 @@ class Shannon:
                     buffer[i + j] = (self.sbuf >> (i * 8)) & 0xFF
                 break
         return bytes(buffer)
+
+
+_Registers = ctypes.c_uint32 * 16
+
+
+class Shannon:
+    """same cipher as `ShannonReference`, the registers are rings indexed from `_r0`/`_crc0`
+    instead of lists shifted every word.
+
+    whole words are unpacked together and go through `shannon/shannon.so` when it was
+    built (make in that directory), through one loop with everything in locals otherwise.
+    the 16 cycle diffusions of `nonce` and `finish` use the library too
+    """
+
+    n: int = 16
+    initkonst: int = 0x6996C53A
+    keyp: int = 13
+
+    def __init__(self, native: bool = True) -> None:
+        self.native: bool = native and _native is not None
+
+        self.r: list[int] = [0] * self.n
+        self.crc: list[int] = [0] * self.n
+        # physical position of the logical register 0
+        self._r0: int = 0
+        self._crc0: int = 0
+        self.init_r: list[int] = [0] * self.n
+
+        self.konst: int = self.initkonst
+        self.sbuf: int = 0
+        self.mbuf: int = 0
+        self.nbuf: int = 0
+
+    def _registers(self) -> list[int]:
+        """r in logical order"""
+        return self.r[self._r0 :] + self.r[: self._r0]
+
+    def _crc_registers(self) -> list[int]:
+        return self.crc[self._crc0 :] + self.crc[: self._crc0]
+
+    def cycle(self) -> None:
+        r, p = self.r, self._r0
+        t = r[(p + 12) & 15] ^ r[(p + 13) & 15] ^ self.konst
+        t ^= ((t << 5 | t >> 27) | (t << 7 | t >> 25)) & 0xFFFFFFFF
+        t ^= ((t << 19 | t >> 13) | (t << 22 | t >> 10)) & 0xFFFFFFFF
+        t ^= (r[p] << 1 | r[p] >> 31) & 0xFFFFFFFF
+        # the oldest register becomes the newest
+        r[p] = t
+        p = self._r0 = (p + 1) & 15
+        t ^= r[(p + 2) & 15]
+        t ^= ((t << 7 | t >> 25) | (t << 22 | t >> 10)) & 0xFFFFFFFF
+        t ^= ((t << 5 | t >> 27) | (t << 19 | t >> 13)) & 0xFFFFFFFF
+        r[p] ^= t
+        self.sbuf = t ^ r[(p + 8) & 15] ^ r[(p + 12) & 15]
+
+    def mac_func(self, i: int) -> None:
+        crc, q = self.crc, self._crc0
+        crc[q] ^= crc[(q + 2) & 15] ^ crc[(q + 15) & 15] ^ i
+        self._crc0 = (q + 1) & 15
+        self.r[(self._r0 + self.keyp) & 15] ^= i
+
+    def diffuse(self) -> None:
+        if not self.native:
+            for _ in range(self.n):
+                self.cycle()
+            return
+
+        assert _native is not None
+        r = _Registers(*self._registers())
+        self.sbuf = _native.shn_cycles(r, self.konst, self.n)
+        self.r, self._r0 = list(r), 0
+
+    def load_key(self, key: bytes) -> None:
+        key = key + bytes(-len(key) % 4) + struct.pack("<I", len(key))
+        for (word,) in struct.iter_unpack("<I", key):
+            self.r[(self._r0 + self.keyp) & 15] ^= word
+            self.cycle()
+        self.crc = self._registers()
+        self._crc0 = 0
+        self.diffuse()
+        for i in range(self.n):
+            self.r[(self._r0 + i) & 15] ^= self.crc[i]
+
+    def key(self, key: bytes) -> None:
+        self.r = [1, 1]
+        for i in range(2, self.n):
+            self.r.append(self.r[i - 1] + self.r[i - 2])
+        self._r0 = 0
+        self.konst = self.initkonst
+        self.load_key(key)
+        self.konst = self.r[self._r0]
+        self.init_r = self._registers()
+        self.nbuf = 0
+
+    def nonce(self, _nonce: bytes | int) -> None:
+        nonce = _nonce if isinstance(_nonce, bytes) else struct.pack(">I", _nonce)
+        self.r = self.init_r.copy()
+        self._r0 = 0
+        self.konst = self.initkonst
+        self.load_key(nonce)
+        self.konst = self.r[self._r0]
+        self.nbuf = 0
+
+    def encrypt(self, _buffer: bytes, n: int | None = None) -> bytes:
+        return self._crypt(_buffer, len(_buffer) if n is None else n, False)
+
+    def decrypt(self, _buffer: bytes, n: int | None = None) -> bytes:
+        return self._crypt(_buffer, len(_buffer) if n is None else n, True)
+
+    def _crypt(self, _buffer: bytes, n: int, decrypt: bool) -> bytes:
+        buffer = bytearray(_buffer)
+        i = 0
+
+        # finish the word the previous call stopped in
+        if self.nbuf != 0:
+            while self.nbuf != 0 and n != 0:
+                i = self._crypt_byte(buffer, i, decrypt)
+                n -= 1
+            if self.nbuf != 0:
+                return b""
+            self.mac_func(self.mbuf)
+
+        words = n >> 2
+        if words:
+            if self.native:
+                self._crypt_words_native(buffer, i, words, decrypt)
+            else:
+                self._crypt_words(buffer, i, words, decrypt)
+            i += words * 4
+
+        n &= 0x03
+        if n != 0:
+            self.cycle()
+            self.mbuf = 0
+            self.nbuf = 32
+            while n != 0:
+                i = self._crypt_byte(buffer, i, decrypt)
+                n -= 1
+        return bytes(buffer)
+
+    def _crypt_byte(self, buffer: bytearray, i: int, decrypt: bool) -> int:
+        shift = 32 - self.nbuf
+        if decrypt:
+            buffer[i] ^= (self.sbuf >> shift) & 0xFF
+            self.mbuf ^= buffer[i] << shift
+        else:
+            self.mbuf ^= buffer[i] << shift
+            buffer[i] ^= (self.sbuf >> shift) & 0xFF
+        self.nbuf -= 8
+        return i + 1
+
+    def _crypt_words(
+        self, buffer: bytearray, offset: int, words: int, decrypt: bool
+    ) -> None:
+        fmt = f"<{words}I"
+        out = list(struct.unpack_from(fmt, buffer, offset))
+
+        r, p = self.r, self._r0
+        crc, q = self.crc, self._crc0
+        konst = self.konst
+        keyp = self.keyp
+        sbuf = self.sbuf
+        for k, w in enumerate(out):
+            # cycle
+            t = r[(p + 12) & 15] ^ r[(p + 13) & 15] ^ konst
+            t ^= ((t << 5 | t >> 27) | (t << 7 | t >> 25)) & 0xFFFFFFFF
+            t ^= ((t << 19 | t >> 13) | (t << 22 | t >> 10)) & 0xFFFFFFFF
+            t ^= (r[p] << 1 | r[p] >> 31) & 0xFFFFFFFF
+            r[p] = t
+            p = (p + 1) & 15
+            t ^= r[(p + 2) & 15]
+            t ^= ((t << 7 | t >> 25) | (t << 22 | t >> 10)) & 0xFFFFFFFF
+            t ^= ((t << 5 | t >> 27) | (t << 19 | t >> 13)) & 0xFFFFFFFF
+            r[p] ^= t
+            sbuf = t ^ r[(p + 8) & 15] ^ r[(p + 12) & 15]
+
+            # mac over the plaintext
+            if decrypt:
+                w ^= sbuf
+                out[k] = w
+            else:
+                out[k] = w ^ sbuf
+            crc[q] ^= crc[(q + 2) & 15] ^ crc[(q + 15) & 15] ^ w
+            q = (q + 1) & 15
+            r[(p + keyp) & 15] ^= w
+
+        self._r0, self._crc0, self.sbuf = p, q, sbuf
+        struct.pack_into(fmt, buffer, offset, *out)
+
+    def _crypt_words_native(
+        self, buffer: bytearray, offset: int, words: int, decrypt: bool
+    ) -> None:
+        assert _native is not None
+
+        r = _Registers(*self._registers())
+        crc = _Registers(*self._crc_registers())
+        data = (ctypes.c_char * (words * 4)).from_buffer(buffer, offset)
+        self.sbuf = _native.shn_crypt_words(
+            r, crc, self.konst, ctypes.addressof(data), words, decrypt
+        )
+        del data  # releases the export, `buffer` can't be resized while it's alive
+
+        self.r, self._r0 = list(r), 0
+        self.crc, self._crc0 = list(crc), 0
+
+    def finish(self, n: int) -> bytes:
+        buffer = bytearray(4)
+        i = 0
+        if self.nbuf != 0:
+            self.mac_func(self.mbuf)
+        self.cycle()
+        self.r[(self._r0 + self.keyp) & 15] ^= self.initkonst ^ (self.nbuf << 3)
+        self.nbuf = 0
+        crc = self._crc_registers()
+        for j in range(self.n):
+            self.r[(self._r0 + j) & 15] ^= crc[j]
+        self.diffuse()
+        while n > 0:
+            self.cycle()
+            if n >= 4:
+                buffer[i : i + 4] = struct.pack("<I", self.sbuf)
+                n -= 4
+                i += 4
+            else:
+                # the reference shifts by `i * 8` as well, kept so the macs match
+                for j in range(n):
+                    buffer[i + j] = (self.sbuf >> (i * 8)) & 0xFF
+                break
+        return bytes(buffer)
@@ -0,0 +1,257 @@
+# pyright: reportAny=false, reportExplicitAny=false, reportUnknownMemberType=false
+
+import logging
+import threading
+
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Any, ClassVar, Self, override
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from urllib3.connectionpool import (
+    ConnectionPool,
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+from urllib3.poolmanager import PoolManager
+from urllib3.response import BaseHTTPResponse
+from urllib3.util import Retry
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    connections: int = 0
+
+
+@dataclass
+class HttpPoolStats:
+    requests: int = 0
+    # every new connection is a tcp (and for https, tls) handshake
+    connections: int = 0
+    bytes_received: int = 0
+    # responses the Retry saw and retried
+    throttled: int = 0
+    server_errors: int = 0
+    hosts: dict[str, HostStats] = field(default_factory=dict)
+
+    @property
+    def handshakes_avoided(self) -> int:
+        return max(0, self.requests - self.connections)
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.handshakes_avoided / self.requests if self.requests != 0 else 0
+
+
+class _StatsRecorder:
+    def __init__(self) -> None:
+        self._stats: HttpPoolStats = HttpPoolStats()
+        self._lock: threading.Lock = threading.Lock()
+
+    def _host(self, host: str) -> HostStats:
+        return self._stats.hosts.setdefault(host, HostStats())
+
+    def request(self, host: str) -> None:
+        with self._lock:
+            self._stats.requests += 1
+            self._host(host).requests += 1
+
+    def connection(self, host: str) -> None:
+        with self._lock:
+            self._stats.connections += 1
+            self._host(host).connections += 1
+
+    def received(self, size: int) -> None:
+        with self._lock:
+            self._stats.bytes_received += size
+
+    def retry(self, status: int | None) -> None:
+        with self._lock:
+            if status == 429:
+                self._stats.throttled += 1
+            elif status is not None and status >= 500:
+                self._stats.server_errors += 1
+
+    def snapshot(self) -> HttpPoolStats:
+        with self._lock:
+            return HttpPoolStats(
+                requests=self._stats.requests,
+                connections=self._stats.connections,
+                bytes_received=self._stats.bytes_received,
+                throttled=self._stats.throttled,
+                server_errors=self._stats.server_errors,
+                hosts={
+                    host: HostStats(s.requests, s.connections)
+                    for host, s in self._stats.hosts.items()
+                },
+            )
+
+
+class CountingRetry(Retry):
+    recorder: _StatsRecorder | None = None
+
+    @override
+    def new(self, **kw: Any) -> Self:
+        retry = super().new(**kw)
+        retry.recorder = self.recorder
+        return retry
+
+    @override
+    def increment(
+        self,
+        method: str | None = None,
+        url: str | None = None,
+        response: BaseHTTPResponse | None = None,
+        error: Exception | None = None,
+        _pool: ConnectionPool | None = None,
+        _stacktrace: TracebackType | None = None,
+    ) -> Self:
+        if self.recorder:
+            self.recorder.retry(response.status if response else None)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    recorder: _StatsRecorder | None = None
+
+    @override
+    def _new_conn(self) -> Any:
+        if self.recorder:
+            self.recorder.connection(self.host)
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    recorder: _StatsRecorder | None = None
+
+    @override
+    def _new_conn(self) -> Any:
+        if self.recorder:
+            self.recorder.connection(self.host)
+        return super()._new_conn()
+
+
+class _CountingPoolManager(PoolManager):
+    def __init__(self, recorder: _StatsRecorder, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.recorder: _StatsRecorder = recorder
+        self.pool_classes_by_scheme: dict[str, type[HTTPConnectionPool]] = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    @override
+    def _new_pool(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        request_context: dict[str, Any] | None = None,
+    ) -> HTTPConnectionPool:
+        # pool kwargs are part of the pool key, so the recorder is set on the pool after
+        pool = super()._new_pool(scheme, host, port, request_context)
+        if isinstance(
+            pool, (_CountingHTTPConnectionPool, _CountingHTTPSConnectionPool)
+        ):
+            pool.recorder = self.recorder
+        return pool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    def __init__(self, recorder: _StatsRecorder, **kwargs: Any) -> None:
+        # `init_poolmanager` runs inside `HTTPAdapter.__init__`
+        self.recorder: _StatsRecorder = recorder
+        super().__init__(**kwargs)
+
+    @override
+    def init_poolmanager(
+        self,
+        connections: int,
+        maxsize: int,
+        block: bool = DEFAULT_POOLBLOCK,
+        **pool_kwargs: Any,
+    ) -> None:
+        # same as `HTTPAdapter.init_poolmanager`, with the counting pools
+        self._pool_connections: int = connections
+        self._pool_maxsize: int = maxsize
+        self._pool_block: bool = block
+        self.poolmanager: PoolManager = _CountingPoolManager(
+            self.recorder,
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            **pool_kwargs,
+        )
+
+    @override
+    def send(
+        self, request: requests.PreparedRequest, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        self.recorder.request(urlparse(request.url or "").hostname or "")
+        resp = super().send(request, *args, **kwargs)
+        self.recorder.received(int(resp.headers.get("Content-Length") or 0))
+        return resp
+
+
+class HttpPool:
+    """process-wide keep-alive connections, shared by every stream"""
+
+    logger: logging.Logger = logging.getLogger("spdl:http_pool")
+    DEFAULT_MAXSIZE: int = 10
+    # distinct hosts kept alive at once, the cdn only ever has a handful
+    HOST_POOLS: int = 32
+
+    _shared: ClassVar["HttpPool | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE) -> None:
+        self.maxsize: int = maxsize
+        self.session: requests.Session = requests.Session()
+        self._recorder: _StatsRecorder = _StatsRecorder()
+        self._lock: threading.Lock = threading.Lock()
+        self._mount()
+
+    @classmethod
+    def shared(cls) -> "HttpPool":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _mount(self) -> None:
+        retry_strategy = CountingRetry(
+            total=5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"],
+            backoff_factor=1,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        retry_strategy.recorder = self._recorder
+        adapter = CountingHTTPAdapter(
+            self._recorder,
+            max_retries=retry_strategy,
+            pool_connections=self.HOST_POOLS,
+            pool_maxsize=self.maxsize,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def ensure_size(self, maxsize: int) -> None:
+        """grows the per-host pool, meant to be called before the streams start"""
+        with self._lock:
+            if maxsize <= self.maxsize:
+                return
+
+            self.logger.debug(f"Resizing pool {self.maxsize} -> {maxsize}")
+            old = self.session.get_adapter("https://")
+            self.maxsize = maxsize
+            self._mount()
+            # connections checked out from the old pools are dropped on release
+            old.close()
+
+    def stats(self) -> HttpPoolStats:
+        return self._recorder.snapshot()
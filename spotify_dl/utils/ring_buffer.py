@@ -0,0 +1,188 @@
+import threading
+
+from collections.abc import Buffer, Callable
+from dataclasses import dataclass
+
+
+@dataclass
+class RingBufferStats:
+    capacity: int
+    used: int
+    written: int
+    # times the producer hit the high watermark and had to wait for the consumers
+    producer_waits: int
+    consumers: int
+
+
+class RingReader:
+    """one consumer's cursor into a `RingBuffer`"""
+
+    def __init__(self, ring: "RingBuffer", name: str, pos: int) -> None:
+        self.ring: RingBuffer = ring
+        self.name: str = name
+        self.pos: int = pos
+        self.closed: bool = False
+
+    def view(self, size: int = -1) -> memoryview:
+        """blocks until there is something to read, an empty view means eof. call `consume` when done with it"""
+        return self.ring._view(self, size)  # pyright: ignore[reportPrivateUsage]
+
+    def consume(self, size: int) -> None:
+        self.ring._consume(self, size)  # pyright: ignore[reportPrivateUsage]
+
+    def readinto(self, buffer: Buffer) -> int:
+        out = memoryview(buffer).cast("B")
+        view = self.view(len(out))
+        read = len(view)
+        out[:read] = view
+        view.release()
+        self.consume(read)
+        return read
+
+    def read(self, size: int = -1) -> bytes:
+        view = self.view(size)
+        data = bytes(view)
+        view.release()
+        self.consume(len(data))
+        return data
+
+    def close(self) -> None:
+        """stops holding the producer back"""
+        self.ring._detach(self)  # pyright: ignore[reportPrivateUsage]
+
+
+class RingBuffer:
+    """bytes written once by a single producer and read by every attached consumer at its own pace.
+
+    the producer waits once the slowest consumer is `high_watermark` bytes behind,
+    and carries on when it caught up to `low_watermark`
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        high_watermark: int | None = None,
+        low_watermark: int | None = None,
+    ) -> None:
+        if capacity <= 0:
+            raise ValueError(f"Invalid capacity: {capacity}")
+
+        self.capacity: int = capacity
+        self.high_watermark: int = min(high_watermark or capacity, capacity)
+        self.low_watermark: int = min(
+            low_watermark if low_watermark is not None else self.high_watermark // 2,
+            self.high_watermark,
+        )
+
+        self._buf: bytearray = bytearray(capacity)
+        # absolute stream offsets, the position in `_buf` is offset % capacity
+        self._write_pos: int = 0
+        self._readers: list[RingReader] = []
+        self._eof: bool = False
+        self._draining: bool = False
+        self._producer_waits: int = 0
+        self._cond: threading.Condition = threading.Condition()
+
+    def add_consumer(self, name: str) -> RingReader:
+        """consumers only see what's written after they attach"""
+        with self._cond:
+            reader = RingReader(self, name, self._write_pos)
+            self._readers.append(reader)
+            return reader
+
+    def _used(self) -> int:
+        if not self._readers:
+            return 0
+        return self._write_pos - min(r.pos for r in self._readers)
+
+    def _wait_for_space(self) -> int:
+        with self._cond:
+            if self._eof:
+                raise ValueError("Write to a closed ring buffer")
+
+            if self._used() >= self.high_watermark:
+                self._draining = True
+                self._producer_waits += 1
+            while self._draining or self._used() >= self.capacity:
+                if self._draining and self._used() <= self.low_watermark:
+                    self._draining = False
+                    continue
+                _ = self._cond.wait()
+
+            return self.capacity - self._used()
+
+    def write_from(self, readinto: Callable[[memoryview], int]) -> int:
+        """lets `readinto` fill the free space in place, returns what it wrote"""
+        free = self._wait_for_space()
+
+        # only the producer moves `_write_pos`, consumers never read past it,
+        # so the free region can be filled without holding the lock
+        start = self._write_pos % self.capacity
+        region = memoryview(self._buf)[start : start + min(free, self.capacity - start)]
+        written = readinto(region)
+        region.release()
+
+        if written > 0:
+            with self._cond:
+                self._write_pos += written
+                self._cond.notify_all()
+        return written
+
+    def write(self, data: Buffer) -> int:
+        src = memoryview(data).cast("B")
+        offset = 0
+        while offset < len(src):
+
+            def fill(region: memoryview) -> int:
+                n = min(len(region), len(src) - offset)
+                region[:n] = src[offset : offset + n]
+                return n
+
+            offset += self.write_from(fill)
+
+        return offset
+
+    def close(self) -> None:
+        """marks eof, consumers still get what's left"""
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def stats(self) -> RingBufferStats:
+        with self._cond:
+            return RingBufferStats(
+                capacity=self.capacity,
+                used=self._used(),
+                written=self._write_pos,
+                producer_waits=self._producer_waits,
+                consumers=len(self._readers),
+            )
+
+    def _view(self, reader: RingReader, size: int) -> memoryview:
+        with self._cond:
+            while reader.pos == self._write_pos and not self._eof and not reader.closed:
+                _ = self._cond.wait()
+
+            available = self._write_pos - reader.pos
+            if size >= 0:
+                available = min(available, size)
+
+        start = reader.pos % self.capacity
+        return memoryview(self._buf)[
+            start : start + min(available, self.capacity - start)
+        ]
+
+    def _consume(self, reader: RingReader, size: int) -> None:
+        if size <= 0:
+            return
+
+        with self._cond:
+            reader.pos = min(reader.pos + size, self._write_pos)
+            self._cond.notify_all()
+
+    def _detach(self, reader: RingReader) -> None:
+        with self._cond:
+            reader.closed = True
+            if reader in self._readers:
+                self._readers.remove(reader)
+            self._cond.notify_all()
@@ -0,0 +1,93 @@
+#include <stddef.h>
+#include <stdint.h>
+
+/* the word loop of `spotify_dl.utils.crypto.Shannon`, the partial words and the
+ * key schedule stay in python */
+
+#define N 16
+#define KEYP 13
+
+#define ROTL(w, d) (((w) << (d)) | ((w) >> (32 - (d))))
+
+static inline uint32_t sbox(uint32_t w) {
+    w ^= ROTL(w, 5) | ROTL(w, 7);
+    w ^= ROTL(w, 19) | ROTL(w, 22);
+    return w;
+}
+
+static inline uint32_t sbox2(uint32_t w) {
+    w ^= ROTL(w, 7) | ROTL(w, 22);
+    w ^= ROTL(w, 5) | ROTL(w, 19);
+    return w;
+}
+
+/* `count` plain cycles over `r`, in logical order. the key schedule and the
+ * mac run 16 of them per packet */
+uint32_t shn_cycles(uint32_t *r, uint32_t konst, size_t count) {
+    uint32_t R[N];
+    uint32_t t, sbuf = 0;
+    unsigned p = 0;
+
+    for (unsigned k = 0; k < N; k++)
+        R[k] = r[k];
+
+    for (size_t i = 0; i < count; i++) {
+        t = sbox(R[(p + 12) & 15] ^ R[(p + 13) & 15] ^ konst) ^ ROTL(R[p], 1);
+        R[p] = t;
+        p = (p + 1) & 15;
+        t = sbox2(R[(p + 2) & 15] ^ t);
+        R[p] ^= t;
+        sbuf = t ^ R[(p + 8) & 15] ^ R[(p + 12) & 15];
+    }
+
+    for (unsigned k = 0; k < N; k++)
+        r[k] = R[(p + k) & 15];
+    return sbuf;
+}
+
+/* `r` and `crc` are the registers in logical order and are written back the
+ * same way, `buf` holds `nwords` little endian words and is en/decrypted in
+ * place. returns the last keystream word */
+uint32_t shn_crypt_words(uint32_t *r, uint32_t *crc, uint32_t konst,
+                         uint8_t *buf, size_t nwords, int decrypt) {
+    uint32_t R[N], C[N];
+    uint32_t t, w, sbuf = 0;
+    unsigned p = 0;
+
+    for (unsigned k = 0; k < N; k++) {
+        R[k] = r[k];
+        C[k] = crc[k];
+    }
+
+    for (size_t i = 0; i < nwords; i++, buf += 4) {
+        /* cycle, the oldest register becomes the newest */
+        t = sbox(R[(p + 12) & 15] ^ R[(p + 13) & 15] ^ konst) ^ ROTL(R[p], 1);
+        R[p] = t;
+        p = (p + 1) & 15;
+        t = sbox2(R[(p + 2) & 15] ^ t);
+        R[p] ^= t;
+        sbuf = t ^ R[(p + 8) & 15] ^ R[(p + 12) & 15];
+
+        w = (uint32_t)buf[0] | (uint32_t)buf[1] << 8 | (uint32_t)buf[2] << 16 |
+            (uint32_t)buf[3] << 24;
+        if (decrypt)
+            w ^= sbuf;
+
+        /* mac, crc moves in step with r so it shares the index */
+        C[(p - 1) & 15] = C[(p - 1) & 15] ^ C[(p + 1) & 15] ^ C[(p + 14) & 15] ^ w;
+        R[(p + KEYP) & 15] ^= w;
+
+        if (!decrypt)
+            w ^= sbuf;
+        buf[0] = w;
+        buf[1] = w >> 8;
+        buf[2] = w >> 16;
+        buf[3] = w >> 24;
+    }
+
+    for (unsigned k = 0; k < N; k++) {
+        r[k] = R[(p + k) & 15];
+        crc[k] = C[(p + k) & 15];
+    }
+    return sbuf;
+}